@@ -0,0 +1,47 @@
+"""
+Compares the throughput (images/s) of ``omidb.filters.FilterImages.dicom_filter``
+with different numbers of worker threads, on the images of a single client.
+"""
+
+import omidb
+import argparse
+import time
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="FilterImages benchmark")
+
+    parser.add_argument("db", type=str, help="Path to OMI-DB data directory")
+    parser.add_argument("image_dir", type=str, help="Path to OMI-DB image directory")
+    parser.add_argument("client", type=str, help="ID of the client to filter")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+
+    args = parser.parse_args()
+
+    for workers in args.workers:
+        # Parse afresh, so no dicoms are cached by the images
+        db = omidb.DB(args.db, args.image_dir, clients=[args.client])
+        client = next(iter(db))
+        num_images = sum(
+            len(series.images)
+            for episode in client.episodes
+            for study in episode.studies
+            for series in study.series
+        )
+
+        image_filter = omidb.filters.FilterImages.dicom_filter(
+            {"ViewPosition": ["CC"]}, workers=workers
+        )
+        start = time.perf_counter()
+        num_selected = sum(1 for _ in image_filter.images(client))
+        elapsed = time.perf_counter() - start
+        print(
+            f"FilterImages(workers={workers}): {num_images / elapsed:.1f} images/s "
+            f"({num_selected}/{num_images} selected, {len(image_filter.errors)} errors)"
+        )
+
+
+if __name__ == "__main__":
+
+    main()
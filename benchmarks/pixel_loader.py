@@ -0,0 +1,60 @@
+"""
+Compares the throughput (images/s) of a serial ``omidb.pixels.load_pixels``
+loop with ``omidb.pixels.BatchLoader``, which runs the same loader on a pool of
+threads, so only the prefetching differs.
+"""
+
+import omidb
+import argparse
+import itertools
+import time
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Pixel loader benchmark")
+
+    parser.add_argument("db", type=str, help="Path to OMI-DB data directory")
+    parser.add_argument("image_dir", type=str, help="Path to OMI-DB image directory")
+    parser.add_argument("--max-images", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+
+    args = parser.parse_args()
+
+    def images():
+        db = omidb.DB(args.db, args.image_dir)
+        it = (
+            image
+            for client in db
+            for episode in client.episodes
+            for study in episode.studies
+            for series in study.series
+            for image in series.images
+        )
+        return list(itertools.islice(it, args.max_images))
+
+    # Parse afresh for each run, so no pixel data locations are cached
+    selected = images()
+
+    start = time.perf_counter()
+    for image in selected:
+        omidb.pixels.load_pixels(image)
+    elapsed = time.perf_counter() - start
+    print(f"serial: {len(selected) / elapsed:.1f} images/s")
+
+    for workers in args.workers:
+        selected = images()
+        loader = omidb.pixels.BatchLoader(
+            selected, batch_size=args.batch_size, workers=workers
+        )
+        start = time.perf_counter()
+        for _ in loader:
+            pass
+        elapsed = time.perf_counter() - start
+        print(f"BatchLoader(workers={workers}): {len(selected) / elapsed:.1f} images/s")
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,56 @@
+"""
+Compares the throughput (clients/s) of ``omidb summarise`` with different
+numbers of worker processes, writing to a temporary file.
+"""
+
+from omidb.commands import summarise
+import argparse
+import os
+import tempfile
+import time
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="summarise benchmark")
+
+    parser.add_argument("db", type=str, help="Path to OMI-DB data directory")
+    parser.add_argument(
+        "--jobs", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1]
+    )
+
+    args = parser.parse_args()
+
+    num_clients = sum(
+        1 for entry in os.scandir(args.db) if entry.is_dir(follow_symlinks=False)
+    )
+    baseline = None
+    with tempfile.TemporaryDirectory() as output_dir:
+        for jobs in sorted(set(args.jobs)):
+            config = summarise.Config(
+                args.db,
+                os.path.join(output_dir, f"summary_{jobs}.csv"),
+                False,
+                None,
+                None,
+                None,
+                None,
+                None,
+                None,
+                None,
+                jobs,
+            )
+            start = time.perf_counter()
+            summarise.run(config)
+            elapsed = time.perf_counter() - start
+            if baseline is None:
+                baseline = elapsed
+            print(
+                f"summarise(jobs={jobs}): {num_clients / elapsed:.1f} clients/s "
+                f"({elapsed:.2f} s, {baseline / elapsed:.2f}x)"
+            )
+
+
+if __name__ == "__main__":
+
+    main()
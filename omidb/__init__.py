@@ -1,7 +1,10 @@
 from .parser import DB  # noqa
 from . import (  # noqa
     image,
+    pixels,
+    thumbnails,
     mark,
+    spatial,
     series,
     study,
     events,
@@ -9,7 +12,15 @@ from . import (  # noqa
     client,
     utilities,
     filters,
+    header,
+    index,
     classificationtools,
+    episode_table,
+    tabular,
+    checkpoint,
+    profiling,
+    manifest,
+    progress,
     commands,
 )
 from loguru import logger
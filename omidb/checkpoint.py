@@ -0,0 +1,190 @@
+"""
+Checkpoints of long passes over the clients of a DB (e.g. ``omidb summarise
+--checkpoint-dir``), from which an interrupted pass can be resumed.
+"""
+
+import datetime
+import gzip
+import json
+import os
+import pathlib
+import tempfile
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Union,
+)
+from loguru import logger
+from .tabular import Column, coerce
+
+MANIFEST = "manifest.json"
+VERSION = 1
+
+
+def write_atomic(path: pathlib.Path, write: Callable[[IO[bytes]], Any]) -> None:
+    """
+    Calls ``write`` with a temporary file (in the directory of ``path``), which
+    then atomically replaces ``path``, so ``path`` is never partially written.
+    """
+
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class Checkpoint:
+    """
+    A directory of shards, each holding the rows of a batch of completed
+    clients (gzipped, one JSON array per row), and a manifest
+    (``manifest.json``) listing the shards and their clients in the order they
+    were written.
+
+    Shards and the manifest are written atomically, and each shard before the
+    manifest listing it, so the checkpoint is consistent wherever the process
+    is killed: the clients of the manifest are complete, and the rest are
+    summarised again on resumption.
+
+    Example::
+
+        checkpoint = Checkpoint("checkpoint", COLUMNS, resume=True)
+        todo = [c for c in client_ids if c not in checkpoint.completed]
+        ...
+        checkpoint.add(batch_client_ids, batch_rows)
+        ...
+        writer.writerows(checkpoint.rows())
+
+    :param directory: The checkpoint directory, created if missing
+    :param columns: The name and type of each column of the rows
+    :param params: Parameters of the pass (JSON-serialisable) which determine
+        the rows, and must match those of a resumed checkpoint
+    :param resume: Resume from the checkpoint in ``directory``, if any, rather
+        than discard it
+    """
+
+    def __init__(
+        self,
+        directory: Union[str, pathlib.Path],
+        columns: Sequence[Column],
+        params: Optional[Mapping[str, Any]] = None,
+        resume: bool = False,
+    ):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.columns = list(columns)
+        self.params = dict(params or {})
+        #: The shards written, each with its ``file``, ``clients`` and
+        #: ``num_rows``
+        self.shards: List[Dict[str, Any]] = []
+
+        # Temporary files of a killed process
+        for tmp in self.directory.glob("*.tmp"):
+            tmp.unlink()
+
+        manifest_path = self.directory / MANIFEST
+        if manifest_path.exists():
+            manifest = json.loads(manifest_path.read_text())
+            if resume:
+                self._check(manifest)
+                self.shards = manifest["shards"]
+                logger.info(
+                    f"Resuming from {len(self.completed)} completed clients "
+                    f"in {self.directory}"
+                )
+            else:
+                for shard in manifest.get("shards", []):
+                    try:
+                        (self.directory / shard["file"]).unlink()
+                    except FileNotFoundError:
+                        pass
+        self._write_manifest()
+
+    def _check(self, manifest: Dict[str, Any]) -> None:
+        names = [name for name, _ in self.columns]
+        if manifest.get("version") != VERSION or manifest.get("columns") != names:
+            raise ValueError(
+                f"The checkpoint in {self.directory} has different columns"
+            )
+        if manifest.get("params") != json.loads(json.dumps(self.params)):
+            raise ValueError(
+                f"The checkpoint in {self.directory} was written with different "
+                f"parameters, {manifest.get('params')}"
+            )
+
+    def _write_manifest(self) -> None:
+        manifest = {
+            "version": VERSION,
+            "columns": [name for name, _ in self.columns],
+            "params": self.params,
+            "shards": self.shards,
+        }
+        write_atomic(
+            self.directory / MANIFEST,
+            lambda f: f.write(json.dumps(manifest, indent=1).encode()),
+        )
+
+    @property
+    def completed(self) -> Set[str]:
+        """IDs of the clients whose rows are in the checkpoint"""
+        return {client_id for shard in self.shards for client_id in shard["clients"]}
+
+    @property
+    def num_rows(self) -> int:
+        return sum(shard["num_rows"] for shard in self.shards)
+
+    def add(self, client_ids: Sequence[str], rows: Iterable[Sequence[Any]]) -> None:
+        """
+        Writes the rows of completed clients as a new shard, and records it in
+        the manifest.
+
+        :param client_ids: The IDs of the clients
+        :param rows: Their rows
+        """
+
+        name = f"shard-{len(self.shards):06d}.json.gz"
+        num_rows = 0
+
+        def write(f: IO[bytes]) -> None:
+            nonlocal num_rows
+            with gzip.open(f, "wt", compresslevel=1) as shard:
+                for row in rows:
+                    shard.write(json.dumps(list(row), default=str) + "\n")
+                    num_rows += 1
+
+        write_atomic(self.directory / name, write)
+        self.shards.append(
+            {"file": name, "clients": list(client_ids), "num_rows": num_rows}
+        )
+        self._write_manifest()
+
+    def rows(self) -> Iterator[List[Any]]:
+        """
+        Yields the rows of all shards, in the order they were added, with
+        values as added (dates are restored from their ISO 8601 strings).
+        """
+
+        dates = [
+            idx for idx, (_, type_) in enumerate(self.columns) if type_ is datetime.date
+        ]
+        for shard in self.shards:
+            with gzip.open(self.directory / shard["file"], "rt") as f:
+                for line in f:
+                    row = json.loads(line)
+                    for idx in dates:
+                        row[idx] = coerce(row[idx], datetime.date)
+                    yield row
@@ -1,12 +1,14 @@
 import omidb
 from .events import Event
 from .episode import Episode, Type, Status, _validate_events
+import bisect
 import copy
-from typing import Optional, List, Union, Tuple
+from typing import Dict, Optional, List, Union, Tuple
 import datetime
 import dataclasses
 import enum
 from math import ceil
+from loguru import logger
 
 
 def has_prior(client: omidb.client.Client) -> bool:
@@ -175,17 +177,30 @@ def is_post_op(episode: Episode, all_episodes: List[Episode]) -> bool:
     """
     Returns `True` if *any* episode in `all_episodes` prior to `episode` is of
     type `Episode.CI` or includes surgery information.
+
+    See also: ``ClientTimeline.is_post_op``.
     """
-    all_episodes = sorted(all_episodes, key=_earliest_date)
-    idx = all_episodes.index(episode)
-    for ep in all_episodes[:idx]:
-        if (
-            ep.events is not None
-            and ep.events.surgery is not None
-            or ep.type == Type.CI
-        ):
-            return True
-    return False
+    return ClientTimeline(all_episodes).is_post_op(episode)
+
+
+@dataclasses.dataclass(frozen=True)
+class LongitudinalFeatures:
+    """
+    Properties of an episode derived from the episodes before it, in
+    chronological order (see ``ClientTimeline.longitudinal_features``).
+    """
+
+    #: Any earlier episode is of type ``Type.CI`` or includes surgery
+    #: information, see ``is_post_op``
+    is_post_op: bool
+    #: Number of earlier episodes with screening events
+    num_prior_screens: int
+    #: Days since the earliest date of the previous episode, if any
+    days_since_previous: Optional[int]
+    #: Any earlier episode has a status of ``Status.M`` or ``Status.CI``
+    any_prior_malignancy: bool
+    #: Any earlier episode includes surgery information
+    any_prior_surgery: bool
 
 
 @enum.unique
@@ -220,6 +235,373 @@ class UndefinedEpisodeOutcome(enum.Enum):
     NoSubsequentEpisode = "Subsequent episode not found"
 
 
+class ClientTimeline:
+    """
+    The episodes of a client in chronological order (by ``_earliest_date``),
+    with the earliest date, status and event validity of each episode computed
+    once, such that all episodes of a client can be classified (see
+    ``ClientTimeline.outcome`` and ``classify_client``) without re-sorting the
+    episodes for each.
+
+    The episodes must not be modified while the timeline is in use.
+
+    :param episodes: All episodes belonging to a single client
+    """
+
+    def __init__(self, episodes: List[Episode]):
+        self.episodes = episodes
+
+        self._dates: Dict[int, Optional[datetime.date]] = {}
+        for episode in episodes:
+            try:
+                self._dates[id(episode)] = _earliest_date(episode)
+            except ValueError:
+                self._dates[id(episode)] = None
+
+        # `None` if any episode has no dates, so the episodes cannot be sorted
+        self._sorted: Optional[List[Episode]] = None
+        self._sorted_dates: List[datetime.date] = []
+        if all(d is not None for d in self._dates.values()):
+            self._sorted = sorted(episodes, key=self.date)
+            self._sorted_dates = [self.date(e) for e in self._sorted]
+
+        self._positions: Dict[int, int] = {}
+        self._statuses: Dict[int, Optional[Status]] = {}
+        self._valid: Dict[int, bool] = {}
+
+    def date(self, episode: Episode) -> datetime.date:
+        """
+        The earliest date of ``episode``, see ``_earliest_date``.
+        Raises a ``ValueError`` if no dates are found.
+        """
+
+        if id(episode) not in self._dates:
+            return _earliest_date(episode)
+        date = self._dates[id(episode)]
+        if date is None:
+            raise ValueError("No valid dates to compare")
+        return date
+
+    def status(self, episode: Episode) -> Optional[Status]:
+        """``Episode.status``, computed once per episode"""
+        if id(episode) not in self._statuses:
+            self._statuses[id(episode)] = episode.status
+        return self._statuses[id(episode)]
+
+    def _validate_events(self, episode: Episode) -> bool:
+        if id(episode) not in self._valid:
+            self._valid[id(episode)] = _validate_events(episode)
+        return self._valid[id(episode)]
+
+    def _position(self, episode: Episode) -> int:
+        """
+        Position of ``episode`` in chronological order. As for ``list.index``,
+        this is the position of the first episode equal to ``episode``, which
+        has the same earliest date, so is searched for among those only.
+        """
+
+        if self._sorted is None:
+            raise ValueError("No valid dates to compare")
+
+        if id(episode) not in self._positions:
+            date = self.date(episode)
+            lo = bisect.bisect_left(self._sorted_dates, date)
+            hi = bisect.bisect_right(self._sorted_dates, date)
+            for idx in range(lo, hi):
+                if self._sorted[idx] == episode:
+                    self._positions[id(episode)] = idx
+                    break
+            else:
+                raise ValueError(f"Episode {episode.id} is not in the timeline")
+        return self._positions[id(episode)]
+
+    def next_episodes(self, episode: Episode) -> List[Episode]:
+        """
+        The episodes after ``episode``, in chronological order. Raises a
+        ``ValueError`` if the episodes cannot be sorted.
+        """
+
+        idx = self._position(episode)
+        assert self._sorted is not None
+        return self._sorted[idx + 1 :]
+
+    def previous_episodes(self, episode: Episode) -> List[Episode]:
+        """
+        The episodes before ``episode``, in chronological order. Raises a
+        ``ValueError`` if the episodes cannot be sorted.
+        """
+
+        idx = self._position(episode)
+        assert self._sorted is not None
+        return self._sorted[:idx]
+
+    def within(self, e1: Episode, e2: Episode, num_months: int) -> bool:
+        """``True`` if ``e2`` starts no more than ``num_months`` after ``e1``"""
+        t1 = self.date(e1)
+        t2 = self.date(e2)
+        return t2 - t1 <= datetime.timedelta(num_months * 365 / 12)
+
+    def is_post_op(self, episode: Episode) -> bool:
+        """See ``is_post_op``"""
+
+        for ep in self.previous_episodes(episode):
+            if (
+                ep.events is not None
+                and ep.events.surgery is not None
+                or ep.type == Type.CI
+            ):
+                return True
+        return False
+
+    def longitudinal_features(self) -> List[LongitudinalFeatures]:
+        """
+        The ``LongitudinalFeatures`` of every episode, in the order of
+        :attr:`episodes`, computed in a single pass over the episodes in
+        chronological order. Raises a ``ValueError`` if the episodes cannot be
+        sorted.
+        """
+
+        if self._sorted is None:
+            raise ValueError("No valid dates to compare")
+
+        # Features of an episode at each position, from the episodes before it
+        prefix: List[LongitudinalFeatures] = []
+        post_op = malignancy = surgery = False
+        screens = 0
+        previous: Optional[datetime.date] = None
+        for ep, date in zip(self._sorted, self._sorted_dates):
+            prefix.append(
+                LongitudinalFeatures(
+                    is_post_op=post_op,
+                    num_prior_screens=screens,
+                    days_since_previous=(
+                        (date - previous).days if previous is not None else None
+                    ),
+                    any_prior_malignancy=malignancy,
+                    any_prior_surgery=surgery,
+                )
+            )
+            has_surgery = ep.events is not None and ep.events.surgery is not None
+            post_op = post_op or has_surgery or ep.type == Type.CI
+            surgery = surgery or has_surgery
+            if ep.events is not None and ep.events.screening:
+                screens += 1
+            malignancy = malignancy or self.status(ep) in (Status.M, Status.CI)
+            previous = date
+
+        return [prefix[self._position(ep)] for ep in self.episodes]
+
+    def _is_not_cancer(self, ep: Episode) -> bool:
+        status = self.status(ep)
+        if status == Status.CI:
+            return False
+        if ep.type == Type.CI:
+            return False
+        if status == Status.M:
+            return False
+        return True
+
+    def _classify_normal_or_raise(self, episode: Episode) -> EpisodeOutcome:
+        normal = _classify_normal(self.status(episode))
+        if normal is None:
+            raise ValueError(
+                f"Failed to classify episode {episode.id}, unexpected condition"
+            )
+        return normal
+
+    def _classify_ci_prior(
+        self, episode: Episode, next_episode: Episode, num_months_ci_prior: int
+    ) -> Optional[bool]:
+        if next_episode.type == Type.CI:
+            if self.within(episode, next_episode, num_months_ci_prior):
+                if next_episode.is_interval_cancer:
+                    return True
+                return None  # Ambiguous
+        return False
+
+    def _classify_m_prior(
+        self, episode: Episode, next_episode: Episode, num_months_cancer_prior: int
+    ) -> bool:
+        return (
+            next_episode.type != Type.CI
+            and next_episode.has_malignant_opinions
+            and self.within(episode, next_episode, num_months_cancer_prior)
+        )
+
+    def outcome(
+        self,
+        episode: Episode,
+        num_months_ci_prior: Optional[int] = None,
+        num_months_cancer_prior: Optional[int] = None,
+        num_months_normal_follow_up: Optional[int] = None,
+        num_months_benign_follow_up: Optional[int] = None,
+    ) -> Tuple[Union[EpisodeOutcome, UndefinedEpisodeOutcome], Optional[str]]:
+        """
+        Classifies ``episode``, which must be one of :attr:`episodes`, see
+        ``episode_outcome``.
+        """
+
+        episode_status = self.status(episode)
+        # Cancers
+        if episode_status == Status.CI:
+            return EpisodeOutcome.CI, None
+        if episode.type == Type.CI:
+            # Should this be invalidCI?
+            return UndefinedEpisodeOutcome.InvalidEvents, None
+        if episode_status == Status.M:
+            return EpisodeOutcome.M, None
+
+        if episode.events is None or not self._validate_events(episode):
+            return UndefinedEpisodeOutcome.InvalidEvents, None
+
+        """
+        The next group depend on next episode and validated events, which may
+        raise exceptions
+        """
+        try:
+            next_episodes = self.next_episodes(episode)
+            for n_ep in next_episodes:
+                if not self._validate_events(n_ep):
+                    return UndefinedEpisodeOutcome.InvalidEvents, None
+        except ValueError:
+            return UndefinedEpisodeOutcome.DateError, None
+
+        next_episode = next_episodes[0] if next_episodes else None
+
+        """
+        if no follow-up, then we may only classify as normal or benign
+        so long as a follow-up is not required. We need to check for
+        a subsequent episode because priors trump negatives
+        """
+        if next_episode is None:
+            if num_months_benign_follow_up is None:
+                if episode_status == Status.B:
+                    return EpisodeOutcome.B, None
+
+            if num_months_normal_follow_up is None:
+                return self._classify_normal_or_raise(episode), None
+
+            return UndefinedEpisodeOutcome.NoSubsequentEpisode, None
+
+        if num_months_ci_prior is None:
+            num_months_ci_prior = ceil(
+                12 * (self.date(next_episode) - self.date(episode)).days / 365.0
+            )
+
+        if num_months_cancer_prior is None:
+            num_months_cancer_prior = ceil(
+                12 * (self.date(next_episode) - self.date(episode)).days / 365.0
+            )
+
+        longest_window = max(num_months_ci_prior or 0, num_months_cancer_prior or 0)
+
+        for n_ep in next_episodes:
+            if self.within(episode, n_ep, longest_window):
+                if n_ep.type == Type.CI:
+                    res = self._classify_ci_prior(episode, n_ep, num_months_ci_prior)
+                    if res:
+                        return EpisodeOutcome.CIP, n_ep.id
+                    elif res is None:
+                        return UndefinedEpisodeOutcome.InvalidEvents, n_ep.id
+                    else:
+                        return UndefinedEpisodeOutcome.InvalidPrior, n_ep.id
+                elif self.status(n_ep) == Status.M:
+                    if self._classify_m_prior(episode, n_ep, num_months_cancer_prior):
+                        return EpisodeOutcome.MP, n_ep.id
+                    else:
+                        return UndefinedEpisodeOutcome.InvalidPrior, n_ep.id
+            else:
+                break
+
+        """
+        Here we check if a follow-up is required or not.
+        If not, then early return benign or normal.
+        Otherwise, continue using the approproate number of months
+        as the minimum inter-episode time delta.
+        """
+        if episode_status == Status.B:
+            if num_months_benign_follow_up is None:
+                return EpisodeOutcome.B, None
+            num_months = num_months_benign_follow_up
+        else:
+            if num_months_normal_follow_up is None:
+                return self._classify_normal_or_raise(episode), None
+            num_months = num_months_normal_follow_up
+
+        """
+        A follow-up is required.
+        `episode_to_check` is either the first
+        episode AFTER the `num_months_normal_follow_up` or `None`.
+        If `None` then we assume we have no valid follow-up.
+        """
+        episode_to_check = None
+
+        for ep in next_episodes:
+            if ep.events is None:
+                return UndefinedEpisodeOutcome.InvalidEvents, ep.id
+            # is there a cancer inside window?
+            if self.within(episode, ep, num_months):
+                if not self._is_not_cancer(ep):
+                    return UndefinedEpisodeOutcome.InvalidPrior, ep.id
+            # first episode outside window
+            else:
+                episode_to_check = ep
+                break
+
+        if episode_to_check is None:
+            return UndefinedEpisodeOutcome.InvalidFollowUp, None
+
+        # first episode outside window is cancer, so must be invalid prior
+        if not self._is_not_cancer(episode_to_check):
+            return UndefinedEpisodeOutcome.InvalidPrior, episode_to_check.id
+
+        # At this point we have two non-malignant neighbouring episodes
+        if episode_status == Status.B:
+            return EpisodeOutcome.B, episode_to_check.id
+
+        return self._classify_normal_or_raise(episode), episode_to_check.id
+
+
+def classify_client(
+    client: omidb.client.Client,
+    num_months_ci_prior: Optional[int] = None,
+    num_months_cancer_prior: Optional[int] = None,
+    num_months_normal_follow_up: Optional[int] = None,
+    num_months_benign_follow_up: Optional[int] = None,
+) -> List[
+    Optional[Tuple[Union[EpisodeOutcome, UndefinedEpisodeOutcome], Optional[str]]]
+]:
+    """
+    Classifies all episodes of ``client`` (see ``episode_outcome``, whose
+    results are matched exactly) using a single ``ClientTimeline``. Returns the
+    outcome, and the ID of the related episode, of each episode, in the order
+    of ``client.episodes``. Episodes which fail to be classified are logged and
+    have an outcome of ``None``.
+
+    :param client: The client to classify
+    """
+
+    timeline = ClientTimeline(client.episodes)
+    outcomes: List[
+        Optional[Tuple[Union[EpisodeOutcome, UndefinedEpisodeOutcome], Optional[str]]]
+    ] = []
+    for episode in client.episodes:
+        try:
+            outcomes.append(
+                timeline.outcome(
+                    episode,
+                    num_months_ci_prior=num_months_ci_prior,
+                    num_months_cancer_prior=num_months_cancer_prior,
+                    num_months_normal_follow_up=num_months_normal_follow_up,
+                    num_months_benign_follow_up=num_months_benign_follow_up,
+                )
+            )
+        except Exception:
+            logger.exception(f"Failed to classify {client.id} / {episode.id}")
+            outcomes.append(None)
+    return outcomes
+
+
 def episode_outcome(
     episode: Episode,
     all_episodes: List[Episode],
@@ -327,127 +709,17 @@ def episode_outcome(
       episodes by ``Type`` if you would like restrict the classification to
       specific episode types, or otherwise adapt this function as needed.
 
-    See also: ``is_post_op``.
-    """
-    episode_status = episode.status
-    # Cancers
-    if episode_status == Status.CI:
-        return EpisodeOutcome.CI, None
-    if episode.type == Type.CI:
-        # Should this be invalidCI?
-        return UndefinedEpisodeOutcome.InvalidEvents, None
-    if episode_status == Status.M:
-        return EpisodeOutcome.M, None
-
-    if episode.events is None or not _validate_events(episode):
-        return UndefinedEpisodeOutcome.InvalidEvents, None
-
-    """
-    The next group depend on next episode and validated events, which may
-    raise exceptions
-    """
-    try:
-        for n_ep in _find_next_episodes(episode, all_episodes):
-            if not _validate_events(n_ep):
-                return UndefinedEpisodeOutcome.InvalidEvents, None
-    except ValueError:
-        return UndefinedEpisodeOutcome.DateError, None
-
-    next_episode = _find_next_episode(episode, all_episodes)
-
-    """
-    if no follow-up, then we may only classify as normal or benign
-    so long as a follow-up is not required. We need to check for
-    a subsequent episode because priors trump negatives
-    """
-    if next_episode is None:
-        if num_months_benign_follow_up is None:
-            if episode_status == Status.B:
-                return EpisodeOutcome.B, None
-
-        if num_months_normal_follow_up is None:
-            return _classify_normal_or_raise(episode), None
-
-        return UndefinedEpisodeOutcome.NoSubsequentEpisode, None
-
-    if num_months_ci_prior is None:
-        num_months_ci_prior = ceil(
-            12 * (_earliest_date(next_episode) - _earliest_date(episode)).days / 365.0
-        )
+    To classify all episodes of a client, ``classify_client`` is more efficient.
 
-    if num_months_cancer_prior is None:
-        num_months_cancer_prior = ceil(
-            12 * (_earliest_date(next_episode) - _earliest_date(episode)).days / 365.0
-        )
-
-    longest_window = max(num_months_ci_prior or 0, num_months_cancer_prior or 0)
-
-    for n_ep in _find_next_episodes(episode, all_episodes):
-        if _within_time_period(episode, n_ep, longest_window):
-            if n_ep.type == Type.CI:
-                res = _classify_ci_prior(episode, n_ep, num_months_ci_prior)
-                if res:
-                    return EpisodeOutcome.CIP, n_ep.id
-                elif res is None:
-                    return UndefinedEpisodeOutcome.InvalidEvents, n_ep.id
-                else:
-                    return UndefinedEpisodeOutcome.InvalidPrior, n_ep.id
-            elif n_ep.status == Status.M:
-                res = _classify_m_prior(episode, n_ep, num_months_cancer_prior)
-                if res:
-                    return EpisodeOutcome.MP, n_ep.id
-                else:
-                    return UndefinedEpisodeOutcome.InvalidPrior, n_ep.id
-        else:
-            break
-
-    """
-    Here we check if a follow-up is required or not.
-    If not, then early return benign or normal.
-    Otherwise, continue using the approproate number of months
-    as the minimum inter-episode time delta.
-    """
-    if episode_status == Status.B:
-        if num_months_benign_follow_up is None:
-            return EpisodeOutcome.B, None
-        num_months = num_months_benign_follow_up
-    else:
-        if num_months_normal_follow_up is None:
-            return _classify_normal_or_raise(episode), None
-        num_months = num_months_normal_follow_up
-
-    """
-    A follow-up is required.
-    `episode_to_check` is either the first
-    episode AFTER the `num_months_normal_follow_up` or `None`.
-    If `None` then we assume we have no valid follow-up.
+    See also: ``is_post_op``.
     """
-    episode_to_check = None
-
-    for ep in _find_next_episodes(episode, all_episodes):
-        if ep.events is None:
-            return UndefinedEpisodeOutcome.InvalidEvents, ep.id
-        # is there a cancer inside window?
-        if _within_time_period(episode, ep, num_months):
-            if not _is_not_cancer(ep):
-                return UndefinedEpisodeOutcome.InvalidPrior, ep.id
-        # first episode outside window
-        else:
-            episode_to_check = ep
-            break
-
-    if episode_to_check is None:
-        return UndefinedEpisodeOutcome.InvalidFollowUp, None
-
-    # first episode outside window is cancer, so must be invalid prior
-    if not _is_not_cancer(episode_to_check):
-        return UndefinedEpisodeOutcome.InvalidPrior, episode_to_check.id
-
-    # At this point we have two non-malignant neighbouring episodes
-    if episode_status == Status.B:
-        return EpisodeOutcome.B, episode_to_check.id
-
-    return _classify_normal_or_raise(episode), episode_to_check.id
+    return ClientTimeline(all_episodes).outcome(
+        episode,
+        num_months_ci_prior=num_months_ci_prior,
+        num_months_cancer_prior=num_months_cancer_prior,
+        num_months_normal_follow_up=num_months_normal_follow_up,
+        num_months_benign_follow_up=num_months_benign_follow_up,
+    )
 
 
 def _classify_normal_or_raise(episode: Episode) -> EpisodeOutcome:
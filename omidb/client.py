@@ -1,7 +1,8 @@
 from dataclasses import dataclass
 import enum
-from typing import List
+from typing import List, Iterable
 from . import episode
+from .utilities import Memoised, memoised_property
 
 
 @enum.unique
@@ -18,7 +19,7 @@ class Status(enum.Enum):
 
 
 @dataclass
-class Client:
+class Client(Memoised):
     """
     A client represents a patient who has attended the NHS screening programme.
 
@@ -37,7 +38,10 @@ class Client:
     episodes: List[episode.Episode]
     site: str
 
-    @property
+    def _memoised_children(self) -> Iterable[episode.Episode]:
+        return self.episodes
+
+    @memoised_property
     def status(self) -> Status:
         """
         Determines the :class:`omidb.client.Status` by first classifying
@@ -1,6 +1,6 @@
 import datetime
 import dataclasses
-from typing import List, Dict, Optional, Any
+from typing import TYPE_CHECKING, List, Dict, Optional, Any
 from loguru import logger
 from . import utilities
 from .client import Client
@@ -45,6 +45,9 @@ from .events import (
     SideOpinion,
 )
 
+if TYPE_CHECKING:
+    from .filters import Query
+
 
 class ClientParser:
     def __init__(
@@ -56,6 +59,8 @@ class ClientParser:
         distinct_event_study_links: bool = True,
         json_loader: Optional[im.JsonLoaderFunc] = None,
         dcm_loader: Optional[im.DicomLoaderFunc] = None,
+        dcm_path_loader: Optional[im.PathLoaderFunc] = None,
+        query: Optional["Query"] = None,
     ):
         self.id = id
         self.nbss = nbss
@@ -64,6 +69,9 @@ class ClientParser:
         self.distinct_event_study_links = distinct_event_study_links
         self.json_loader = json_loader
         self.dcm_loader = dcm_loader
+        self.dcm_path_loader = dcm_path_loader
+        # If given, only studies and images matching the query are parsed
+        self.query = query
         self._episode_id: Optional[str] = None
 
     def __call__(self) -> Client:
@@ -122,6 +130,11 @@ class ClientParser:
                 else None
             )
 
+            if self.query is not None:
+                this_episodes_studies = self.select_studies(
+                    ep_type, this_episodes_studies
+                )
+
             lesions = self._parse_lesions(nbss_episode)
 
             out.append(
@@ -213,9 +226,14 @@ class ClientParser:
                 continue
 
             # Now add studies to the episode
+            # Given a query, series are parsed once studies are selected
             study = Study(
                 id=study_id,
-                series=self.parse_series(study_id, study_data),
+                series=(
+                    []
+                    if self.query is not None
+                    else self.parse_series(study_id, study_data)
+                ),
                 date=study_date,
                 event_type=matched_events,
             )
@@ -227,6 +245,29 @@ class ClientParser:
 
         return episode_studies
 
+    def select_studies(
+        self, episode_type: Optional[episode.Type], studies: List[Study]
+    ) -> List[Study]:
+        """
+        Selects the `studies` of an episode matching :attr:`query`, and parses
+        the series of each, keeping only matching images. Studies without
+        matching images are dropped.
+        """
+
+        assert self.query is not None
+        if not self.query.accepts_episode_type(episode_type):
+            return []
+
+        selected = []
+        for study in studies:
+            if not self.query.accepts_study(study.date, study.event_type):
+                continue
+            series = self.parse_series(study.id, self.imagedb["STUDIES"][study.id])
+            study.series = [s for s in series if s.images]
+            if study.series:
+                selected.append(study)
+        return selected
+
     def parse_series(
         self,
         study_iuid: str,
@@ -257,6 +298,9 @@ class ClientParser:
                             )
                             continue
 
+                if self.query is not None and not self.query.accepts_marks(marks):
+                    continue
+
                 args = im.LoaderParams(self.id, study_iuid, series, image)
 
                 if self.dcm_loader is not None:
@@ -269,12 +313,18 @@ class ClientParser:
                 else:
                     json_loader = None
 
+                if self.dcm_path_loader is not None:
+                    dcm_path_loader = im.PathLoader(args, self.dcm_path_loader)
+                else:
+                    dcm_path_loader = None
+
                 images.append(
                     im.Image(
                         id=image,
                         dcm_loader=dcm_loader,
                         json_loader=json_loader,
                         marks=marks,
+                        dcm_path_loader=dcm_path_loader,
                     )
                 )
 
@@ -1,5 +1,5 @@
 import click
-from . import summarise
+from . import summarise, export_patches, thumbnails, pack_headers, build_index
 
 
 @click.group()
@@ -9,4 +9,8 @@ def entry_point() -> None:
 
 def main() -> None:
     entry_point.add_command(summarise.cli)
+    entry_point.add_command(export_patches.cli)
+    entry_point.add_command(thumbnails.cli)
+    entry_point.add_command(pack_headers.cli)
+    entry_point.add_command(build_index.cli)
     entry_point()
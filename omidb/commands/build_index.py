@@ -0,0 +1,114 @@
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import click
+from loguru import logger
+from ..parser import DB
+from ..image import LoaderParams
+from ..index import AttributeIndex, index_entry
+from ..parallel import ordered_map, worker_pool, worker_state
+
+Entry = Tuple[LoaderParams, Dict[str, Any]]
+
+
+def index_client(db: DB, client_id: str) -> List[Entry]:
+    """
+    The index entries of the images of a client. Images whose headers cannot be
+    read are indexed without attributes; clients that cannot be parsed are
+    logged and skipped.
+    """
+
+    try:
+        client = db._parse_client(client_id, db._studies(client_id))
+    except Exception:
+        logger.exception(f"Failed to parse {client_id}, skipping")
+        return []
+
+    entries: List[Entry] = []
+    for episode in client.episodes:
+        for study in episode.studies:
+            for series in study.series:
+                for image in series.images:
+                    try:
+                        entries.append(index_entry(image))
+                    except Exception:
+                        logger.exception(
+                            f"Failed to read attributes of {client_id} / {image.id}"
+                        )
+                        entries.append(
+                            (LoaderParams(client_id, study.id, series.id, image.id), {})
+                        )
+    return entries
+
+
+def _index_client(client_id: str) -> List[Entry]:
+    # The DB is sent to each worker process once, see worker_pool
+    return index_client(worker_state(), client_id)
+
+
+def run(db: DB, jobs: int = 1) -> AttributeIndex:
+    """Builds the attribute index of the clients of ``db``"""
+
+    client_ids = sorted(db.clients)
+
+    def entries(results: Iterator[List[Entry]]) -> Iterator[Entry]:
+        for client_entries in results:
+            yield from client_entries
+
+    if jobs == 1:
+        return AttributeIndex.build(
+            entries(index_client(db, client_id) for client_id in client_ids)
+        )
+
+    with worker_pool(jobs, db) as executor:
+        return AttributeIndex.build(
+            entries(ordered_map(executor, _index_client, client_ids, 4 * jobs))
+        )
+
+
+@click.command("build-index")
+@click.argument("db", type=click.Path(exists=True))
+@click.option(
+    "--index-file",
+    type=click.Path(exists=False),
+    help="Where to write the index, defaults to attribute_index.json in DB",
+)
+@click.option(
+    "--jobs",
+    type=int,
+    default=1,
+    help="Number of worker processes",
+)
+@click.option(
+    "--clients-file",
+    type=click.Path(exists=True),
+    help="File containing a list of clients to index",
+)
+@click.option("--log-file", type=click.Path(exists=False), help="Log to this file")
+def cli(
+    db: str,
+    index_file: Optional[str],
+    jobs: int,
+    clients_file: Optional[str],
+    log_file: Optional[str],
+) -> None:
+    """Build an index of the DICOM attributes (manufacturer, laterality, view
+    position etc.) of the images of OMI-DB, located at DB, used to select images
+    without loading their headers (see DB.images_where). Re-run after the data
+    changes.
+    """
+
+    client_list = None
+    if clients_file:
+        with open(clients_file, "r") as f:
+            client_list = [_.strip() for _ in f.readlines()]
+
+    logger.enable("omidb")
+
+    if log_file:
+        logger.remove()
+        logger.add(log_file, enqueue=jobs > 1)
+
+    parser = DB(db, clients=client_list, index_path=index_file)
+    index = run(parser, max(jobs, 1))
+    index.save(parser.index_path)
+
+    click.echo(f"Indexed {len(index.images)} images to {parser.index_path}")
@@ -0,0 +1,206 @@
+from typing import List, Iterator, Any, Optional
+from dataclasses import dataclass
+import concurrent.futures
+import pathlib
+import csv
+import click
+import numpy as np
+import pydicom
+from loguru import logger
+from ..parser import DB
+from ..mark import Mark
+from .. import image as im
+from ..parallel import ordered_map
+
+INDEX_HEADER = [
+    "ClientID",
+    "EpisodeID",
+    "StudyInstanceUID",
+    "SeriesInstanceUID",
+    "SOPInstanceUID",
+    "MarkID",
+    "LesionIDs",
+    "Conspicuity",
+    "RowStart",
+    "RowStop",
+    "ColumnStart",
+    "ColumnStop",
+    "PatchFile",
+]
+
+
+@dataclass
+class ExportTask:
+    """
+    The marks of a single image to export, in a picklable form such that tasks
+    can be sent to worker processes.
+    """
+
+    client_id: str
+    episode_id: str
+    params: im.LoaderParams
+    dcm_path: pathlib.Path
+    marks: List[Mark]
+
+
+def tasks(db: DB) -> Iterator[ExportTask]:
+    for client in db:
+        for episode in client.episodes:
+            for study in episode.studies:
+                for series in study.series:
+                    for image in series.images:
+                        if not image.marks or image.dcm_path_loader is None:
+                            continue
+                        yield ExportTask(
+                            client.id,
+                            episode.id,
+                            image.dcm_path_loader.args,
+                            image.dcm_path_loader.func(image.dcm_path_loader.args),
+                            image.marks,
+                        )
+
+
+def export_image(
+    task: ExportTask, output_dir: pathlib.Path, margin: int
+) -> List[List[Any]]:
+    """
+    Writes one patch per mark of ``task`` to ``output_dir`` and returns the
+    corresponding rows of the index file. Failures are logged and result in no
+    rows, such that one unreadable image does not abort the export.
+    """
+
+    path = task.dcm_path
+    image = im.Image(
+        id=task.params.image_id,
+        dcm_loader=im.DicomLoader(task.params, lambda _: pydicom.dcmread(str(path))),
+        dcm_path_loader=im.PathLoader(task.params, lambda _: path),
+    )
+
+    rows: List[List[Any]] = []
+    try:
+        pixels = image.pixels_mmap()
+        if pixels is None:
+            raise ValueError(f"Failed to load pixel data for image {image.id}")
+
+        client_dir = output_dir / task.client_id
+        client_dir.mkdir(parents=True, exist_ok=True)
+
+        for mark in task.marks:
+            row_slice, col_slice = mark.boundingBox.slices(margin, pixels.shape)
+            patch_file = client_dir / f"{image.id}_{mark.id}.npy"
+            np.save(patch_file, np.array(pixels[row_slice, col_slice]))
+
+            rows.append(
+                [
+                    task.client_id,
+                    task.episode_id,
+                    task.params.study_id,
+                    task.params.series_id,
+                    image.id,
+                    mark.id,
+                    ",".join(sorted(mark.lesion_ids or [])),
+                    mark.conspicuity.name if mark.conspicuity else None,
+                    row_slice.start,
+                    row_slice.stop,
+                    col_slice.start,
+                    col_slice.stop,
+                    patch_file.relative_to(output_dir),
+                ]
+            )
+    except Exception:
+        logger.exception(f"Failed to export patches of {task.client_id} / {image.id}")
+        return []
+
+    return rows
+
+
+def _export_image(args: Any) -> List[List[Any]]:
+    return export_image(*args)
+
+
+def run(
+    db: DB,
+    output_dir: pathlib.Path,
+    margin: int = 0,
+    jobs: int = 1,
+) -> int:
+    """
+    Exports a patch around every mark in ``db`` to ``output_dir``, alongside an
+    index file, ``index.csv``. Returns the number of patches written.
+    """
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    work = ((task, output_dir, margin) for task in tasks(db))
+
+    num_patches = 0
+    with open(output_dir / "index.csv", "w", newline="") as f:
+        writer = csv.writer(f, delimiter=",")
+        writer.writerow(INDEX_HEADER)
+
+        if jobs == 1:
+            for rows in map(_export_image, work):
+                writer.writerows(rows)
+                num_patches += len(rows)
+        else:
+            with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+                for rows in ordered_map(executor, _export_image, work, 4 * jobs):
+                    writer.writerows(rows)
+                    num_patches += len(rows)
+
+    return num_patches
+
+
+@click.command("export-patches")
+@click.argument("db", type=click.Path(exists=True))
+@click.argument("image-dir", type=click.Path(exists=True))
+@click.argument("output-dir", type=click.Path(exists=False))
+@click.option(
+    "--margin",
+    type=int,
+    default=0,
+    help="Number of pixels to pad each mark's bounding box by",
+)
+@click.option(
+    "--jobs",
+    type=int,
+    default=1,
+    help="Number of worker processes used to extract patches",
+)
+@click.option(
+    "--clients-file",
+    type=click.Path(exists=True),
+    help="File containing a list of clients to parse",
+)
+@click.option("--log-file", type=click.Path(exists=False), help="Log to this file")
+def cli(
+    db: str,
+    image_dir: str,
+    output_dir: str,
+    margin: int,
+    jobs: int,
+    clients_file: Optional[str],
+    log_file: Optional[str],
+) -> None:
+    """Extract a patch around every mark of the images of OMI-DB, located at DB
+    and IMAGE_DIR, writing them (as .npy files) and an index file, index.csv, to
+    OUTPUT_DIR
+    """
+
+    client_list = None
+    if clients_file:
+        with open(clients_file, "r") as f:
+            client_list = [_.strip() for _ in f.readlines()]
+
+    logger.enable("omidb")
+
+    if log_file:
+        logger.remove()
+        logger.add(log_file, enqueue=jobs > 1)
+
+    num_patches = run(
+        DB(db, image_dir, clients=client_list),
+        pathlib.Path(output_dir),
+        margin,
+        max(jobs, 1),
+    )
+    click.echo(f"Exported {num_patches} patches to {output_dir}")
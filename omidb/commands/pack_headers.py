@@ -0,0 +1,82 @@
+from typing import Optional, Iterator, Tuple
+import concurrent.futures
+import pathlib
+import click
+from loguru import logger
+from ..parser import DB
+from ..header import pack_client
+from ..parallel import ordered_map
+
+
+def _pack_client(client_dir: pathlib.Path) -> Tuple[str, Optional[int]]:
+    try:
+        return client_dir.name, pack_client(client_dir)
+    except Exception:
+        logger.exception(f"Failed to pack headers of {client_dir.name}, skipping")
+        return client_dir.name, None
+
+
+def run(db: DB, jobs: int = 1) -> Iterator[Tuple[str, Optional[int]]]:
+    """
+    Consolidates the JSON headers of each client in ``db``, yielding the client
+    ID and the number of headers packed (``None`` on failure).
+    """
+
+    client_dirs = [db._data_dir / client for client in sorted(db.clients)]
+
+    if jobs == 1:
+        yield from map(_pack_client, client_dirs)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+            yield from ordered_map(executor, _pack_client, client_dirs, 4 * jobs)
+
+
+@click.command("pack-headers")
+@click.argument("db", type=click.Path(exists=True))
+@click.option(
+    "--jobs",
+    type=int,
+    default=1,
+    help="Number of worker processes",
+)
+@click.option(
+    "--clients-file",
+    type=click.Path(exists=True),
+    help="File containing a list of clients to pack",
+)
+@click.option("--log-file", type=click.Path(exists=False), help="Log to this file")
+def cli(
+    db: str,
+    jobs: int,
+    clients_file: Optional[str],
+    log_file: Optional[str],
+) -> None:
+    """Consolidate the JSON headers of each client of OMI-DB, located at DB, into
+    one file per client (headers_<client>.pack), from which image attributes are
+    then read. Re-run after the JSON headers change: the JSON headers of a client
+    are read instead while they are newer than its file.
+    """
+
+    client_list = None
+    if clients_file:
+        with open(clients_file, "r") as f:
+            client_list = [_.strip() for _ in f.readlines()]
+
+    logger.enable("omidb")
+
+    if log_file:
+        logger.remove()
+        logger.add(log_file, enqueue=jobs > 1)
+
+    num_clients = num_headers = num_failed = 0
+    for _, count in run(DB(db, clients=client_list), max(jobs, 1)):
+        if count is None:
+            num_failed += 1
+        else:
+            num_clients += 1
+            num_headers += count
+
+    click.echo(
+        f"Packed {num_headers} headers of {num_clients} clients "
+        f"({num_failed} failed)"
+    )
@@ -1,16 +1,56 @@
-from typing import List, Iterable, Tuple, Union, Any, Optional, Iterator
+from typing import (
+    IO,
+    Callable,
+    Dict,
+    List,
+    Iterable,
+    Tuple,
+    Union,
+    Any,
+    Optional,
+    Iterator,
+    Sequence,
+    Set,
+    Type,
+)
 from dataclasses import dataclass
 import dataclasses
+import contextlib
 import csv
+import json
+import multiprocessing
+import os
+import pathlib
+import sys
+import threading
 import click
-from .. import utilities
 from ..client import Client
 from ..image import Image
+from ..header import (  # noqa
+    DICOM_ATTRIBUTE_TAGS,
+    DICOM_ATTRIBUTE_PROJECTION,
+    dicom_attributes,
+)
 from ..study import Study
 from ..series import Series
 from ..episode import Episode
 from .. import classificationtools as ct
+from .. import profiling
 from ..parser import DB
+from ..parallel import ordered_map, worker_pool, worker_state
+from ..tabular import (
+    FORMATS,
+    BUFFER_SIZE,
+    Column,
+    CSVTableWriter,
+    TableWriter,
+    format_from_path,
+    open_table,
+    read_table,
+)
+from ..checkpoint import Checkpoint
+from ..manifest import SourceManifest, manifest_path
+from ..progress import Progress, ProgressInfo, count
 from loguru import logger
 import datetime
 
@@ -27,6 +67,19 @@ class Config:
     num_months_ci_prior: Optional[int]
     num_months_normal_follow_up: Optional[int]
     num_months_benign_follow_up: Optional[int]
+    jobs: int = 1
+    format: Optional[str] = None
+    include_images: bool = True
+    checkpoint_dir: Optional[str] = None
+    resume: bool = False
+    checkpoint_size: int = 100
+    profile: bool = False
+    profile_json: Optional[str] = None
+    columns: Optional[Sequence[str]] = None
+    exclude_columns: Optional[Sequence[str]] = None
+    manifest: bool = False
+    incremental: Optional[str] = None
+    progress: bool = False
 
 
 def flatten(
@@ -43,46 +96,66 @@ def flatten(
         Optional[Study],
         Optional[Series],
         Optional[Image],
+        Optional[ct.LongitudinalFeatures],
     ]
 ]:
+    """
+    Yields the data of the rows of the summary of ``clients``: one tuple per
+    image, or per episode (with no study, series or image) if the episode has
+    no images or ``config.include_images`` is false. The longitudinal features
+    of the episode are ``None`` if they cannot be computed.
+    """
+
     for client in clients:
-        for episode in client.episodes:
-            episode_sort_date: Optional[datetime.date]
+        with profiling.stage("classify", client.id):
+            timeline = ct.ClientTimeline(client.episodes)
+            features: Sequence[Optional[ct.LongitudinalFeatures]]
             try:
-                episode_sort_date = ct._earliest_date(episode)
+                features = timeline.longitudinal_features()
             except Exception:
-                logger.exception(
-                    f"Failed to extract sort date for {client.id} / {episode.id}"
-                )
-                episode_sort_date = None
+                # Fall back to (and log the failures of) each episode, below
+                features = [None] * len(client.episodes)
 
-            episode_outcome: Optional[str] = None
-            related_episode_id: Optional[str] = None
-            try:
-                outcome, related_episode_id = ct.episode_outcome(
-                    episode=episode,
-                    all_episodes=client.episodes,
-                    num_months_ci_prior=config.num_months_ci_prior,
-                    num_months_cancer_prior=config.num_months_cancer_prior,
-                    num_months_normal_follow_up=config.num_months_normal_follow_up,
-                    num_months_benign_follow_up=config.num_months_benign_follow_up,
-                )
-                if outcome is not None:
-                    episode_outcome = outcome.name
-            except Exception:
-                logger.exception(f"Failed to classify {client.id} / {episode.id}")
+        for episode, episode_features in zip(client.episodes, features):
+            with profiling.stage("classify", client.id):
+                episode_sort_date: Optional[datetime.date]
+                try:
+                    episode_sort_date = timeline.date(episode)
+                except Exception:
+                    logger.exception(
+                        f"Failed to extract sort date for {client.id} / {episode.id}"
+                    )
+                    episode_sort_date = None
 
-            post_op: Optional[bool] = None
-            try:
-                post_op = ct.is_post_op(episode, client.episodes)
-            except Exception:
-                logger.exception(
-                    "Failed to identify 'post_op' status for "
-                    f"{client.id} / {episode.id}"
-                )
-                post_op = None
+                episode_outcome: Optional[str] = None
+                related_episode_id: Optional[str] = None
+                try:
+                    outcome, related_episode_id = timeline.outcome(
+                        episode,
+                        num_months_ci_prior=config.num_months_ci_prior,
+                        num_months_cancer_prior=config.num_months_cancer_prior,
+                        num_months_normal_follow_up=config.num_months_normal_follow_up,
+                        num_months_benign_follow_up=config.num_months_benign_follow_up,
+                    )
+                    if outcome is not None:
+                        episode_outcome = outcome.name
+                except Exception:
+                    logger.exception(f"Failed to classify {client.id} / {episode.id}")
+
+                post_op: Optional[bool] = None
+                try:
+                    if episode_features is not None:
+                        post_op = episode_features.is_post_op
+                    else:
+                        post_op = timeline.is_post_op(episode)
+                except Exception:
+                    logger.exception(
+                        "Failed to identify 'post_op' status for "
+                        f"{client.id} / {episode.id}"
+                    )
+                    post_op = None
 
-            if not episode.studies:
+            if not episode.studies or not config.include_images:
                 yield (
                     client,
                     episode,
@@ -93,6 +166,7 @@ def flatten(
                     None,
                     None,
                     None,
+                    episode_features,
                 )
             else:
                 for study in episode.studies:
@@ -108,6 +182,7 @@ def flatten(
                                 study,
                                 series,
                                 image,
+                                episode_features,
                             )
 
 
@@ -128,66 +203,279 @@ class DicomAttributes:
 def extract_dicom_attributes(image: Image) -> DicomAttributes:
     """Forcefully extract dicom attributes"""
 
-    manufacturer = utilities.try_image_attribute(image, "00080070")
-    model = utilities.try_image_attribute(image, "00081090")
-    presentation_intent_type = utilities.try_image_attribute(image, "00080068")
-    image_laterality = utilities.try_image_attribute(image, "00200062")
-    view_position = utilities.try_image_attribute(image, "00185101")
-    view_mod_code_value = utilities.try_image_attribute(image, ["00540220", "00080100"])
-    view_mod_code_meaning = utilities.try_image_attribute(
-        image, ["00540220", "00080104"]
-    )
+    return DicomAttributes(**dicom_attributes(image))
 
-    thickness = utilities.try_image_attribute(image, "001811A0")
-    age = utilities.parse_age(image)
-    transfer_syntax_uid = utilities.try_image_attribute(image, "00020010")
-
-    return DicomAttributes(
-        Manufacturer=manufacturer,
-        Model=model,
-        PresentationIntentType=presentation_intent_type,
-        ImageLaterality=image_laterality,
-        ViewPosition=view_position,
-        ViewModCodeValue=view_mod_code_value,
-        ViewModCodeMeaning=view_mod_code_meaning,
-        BodyPartThicknessMM=thickness,
-        PatientAgeYears=age,
-        TransferSyntaxUID=transfer_syntax_uid,
-    )
+
+# Name and type of the columns of the summary, followed by those of
+# DicomAttributes
+EPISODE_COLUMNS: List[Column] = [
+    ("ClientID", str),
+    ("Site", str),
+    ("EpisodeID", str),
+    ("EpisodeSortDate", datetime.date),
+    ("EpisodeStatus", str),
+    ("EpisodeOutcome", str),
+    ("EpisodeOutcomeFutureEpisodeID", str),
+    ("EpisodeIsPostOp", bool),
+    ("EpisodeType", str),
+    ("EpisodeAction", str),
+    ("EpisodeContainsMalignantOpinions", bool),
+    ("EpisodeContainsBenignOpinions", bool),
+    ("EpisodeOpenedDate", datetime.date),
+    ("EpisodeClosedDate", datetime.date),
+    ("ActualEpisodeOpenedYear", int),
+    ("EpisodeHasEvents", bool),
+    ("StudyInstanceUID", str),
+    ("StudyDate", datetime.date),
+    ("EventType", str),
+    ("SeriesInstanceUID", str),
+    ("SOPInstanceUID", str),
+    ("NumberOfMarks", int),
+]
+
+
+def _optional_type(annotation: Any) -> Type[Any]:
+    """``T``, given ``Optional[T]``"""
+    type_: Type[Any] = getattr(annotation, "__args__", (annotation,))[0]
+    return type_
+
+
+COLUMNS: List[Column] = EPISODE_COLUMNS + [
+    (field.name, _optional_type(field.type))
+    for field in dataclasses.fields(DicomAttributes)
+]
+
+
+# Names of the columns of episode-level summaries (see Config.include_images):
+# those of EPISODE_COLUMNS which do not depend on studies, series or images
+EPISODE_LEVEL_COLUMNS: List[str] = [
+    "ClientID",
+    "Site",
+    "EpisodeID",
+    "EpisodeSortDate",
+    "EpisodeStatus",
+    "EpisodeOutcome",
+    "EpisodeOutcomeFutureEpisodeID",
+    "EpisodeIsPostOp",
+    "EpisodeType",
+    "EpisodeAction",
+    "EpisodeContainsMalignantOpinions",
+    "EpisodeContainsBenignOpinions",
+    "EpisodeOpenedDate",
+    "EpisodeClosedDate",
+    "ActualEpisodeOpenedYear",
+    "EpisodeHasEvents",
+]
+
+# Name and type of the columns of the longitudinal features of episodes (see
+# omidb.classificationtools.LongitudinalFeatures), only written if selected
+LONGITUDINAL_COLUMNS: List[Column] = [
+    ("EpisodeNumPriorScreens", int),
+    ("EpisodeDaysSincePrevious", int),
+    ("EpisodeAnyPriorMalignancy", bool),
+    ("EpisodeAnyPriorSurgery", bool),
+]
+
+
+def select_columns(
+    columns: Optional[Sequence[str]] = None,
+    exclude_columns: Optional[Sequence[str]] = None,
+) -> List[Column]:
+    """
+    The columns of :data:`COLUMNS` and :data:`LONGITUDINAL_COLUMNS` named in
+    ``columns`` (in that order, by default all of :data:`COLUMNS`), except
+    those in ``exclude_columns``.
+
+    :raises ValueError: If a column is unknown
+    """
+
+    types = dict(COLUMNS + LONGITUDINAL_COLUMNS)
+    unknown = [
+        c for c in [*(columns or []), *(exclude_columns or [])] if c not in types
+    ]
+    if unknown:
+        raise ValueError(f"Unknown columns {unknown}, expected some of {list(types)}")
+
+    names = [name for name, _ in COLUMNS] if columns is None else columns
+    excluded = set(exclude_columns or [])
+    return [(name, types[name]) for name in names if name not in excluded]
+
+
+def summary_columns(config: Config) -> List[Column]:
+    """
+    The columns of the summary of ``config``: those of ``config.columns``
+    (by default all, or :data:`EPISODE_LEVEL_COLUMNS` if
+    ``config.include_images`` is false), except ``config.exclude_columns``
+    """
+
+    columns = config.columns
+    if columns is None and not config.include_images:
+        columns = EPISODE_LEVEL_COLUMNS
+    return select_columns(columns, config.exclude_columns)
+
+
+_DICOM_ATTRIBUTE_NAMES = [field.name for field in dataclasses.fields(DicomAttributes)]
+_NO_DICOM_ATTRIBUTES: List[Any] = [None] * len(_DICOM_ATTRIBUTE_NAMES)
+_LONGITUDINAL_NAMES = [name for name, _ in LONGITUDINAL_COLUMNS]
+# Marks the study templates of DataWriter as unset (None is a valid study)
+_NO_STUDY = object()
 
 
 class DataWriter:
-    def __init__(self) -> None:
-        # Set up header
-        self.rows: List[List[Any]] = [
-            [
-                "ClientID",
-                "Site",
-                "EpisodeID",
-                "EpisodeSortDate",
-                "EpisodeStatus",
-                "EpisodeOutcome",
-                "EpisodeOutcomeFutureEpisodeID",
-                "EpisodeIsPostOp",
-                "EpisodeType",
-                "EpisodeAction",
-                "EpisodeContainsMalignantOpinions",
-                "EpisodeContainsBenignOpinions",
-                "EpisodeOpenedDate",
-                "EpisodeClosedDate",
-                "ActualEpisodeOpenedYear",
-                "EpisodeHasEvents",
-                "StudyInstanceUID",
-                "StudyDate",
-                "EventType",
-                "SeriesInstanceUID",
-                "SOPInstanceUID",
-                "NumberOfMarks",
-            ]
+    """
+    Builds the rows of the summary, one per event type of each image (see
+    :meth:`add`), with ``columns`` (by default, those of :data:`COLUMNS`).
+    The JSON headers of images are only loaded if the columns include DICOM
+    attributes.
+
+    If ``output`` is given, each row is written to it as soon as it is built
+    (streaming), so memory use does not grow with the number of rows, and
+    :attr:`rows` holds the header only. ``output`` is either a table writer
+    (see :func:`omidb.tabular.open_table`) or a text file, to which the header
+    and rows are written as CSV. Otherwise the rows are collected in
+    :attr:`rows` and written by :meth:`write`.
+
+    :param output: A table writer or text file to stream rows to
+    :param columns: A selection of :data:`COLUMNS` and
+        :data:`LONGITUDINAL_COLUMNS`, see :func:`select_columns`
+    """
+
+    def __init__(
+        self,
+        output: Union[TableWriter, IO[str], None] = None,
+        columns: Optional[Sequence[Column]] = None,
+    ) -> None:
+        self.columns: List[Column] = list(COLUMNS if columns is None else columns)
+        self.header: List[str] = [name for name, _ in self.columns]
+
+        self._dicom = any(name in _DICOM_ATTRIBUTE_NAMES for name in self.header)
+        self._longitudinal = any(name in _LONGITUDINAL_NAMES for name in self.header)
+
+        # Indices of the columns in the rows of all COLUMNS (followed by the
+        # LONGITUDINAL_COLUMNS, if any are selected), if a selection
+        names = [name for name, _ in COLUMNS]
+        if self._longitudinal:
+            names += _LONGITUDINAL_NAMES
+        self._indices: Optional[List[int]] = [names.index(n) for n in self.header]
+        if self._indices == list(range(len(names))):
+            self._indices = None
+
+        self.rows: List[List[Any]] = [self.header]
+        #: Number of rows added, excluding the header
+        self.num_rows = 0
+        #: IDs of the clients whose rows could not be built (see
+        #: :func:`write_client_data`)
+        self.skipped: List[str] = []
+
+        self._writer: Optional[TableWriter] = None
+        if isinstance(output, TableWriter):
+            self._writer = output
+        elif output is not None:
+            self._writer = CSVTableWriter(output, self.columns)
+
+        # Templates of the rows of the last episode and study added
+        self._client: Optional[Client] = None
+        self._episode: Optional[Episode] = None
+        self._episode_key: Tuple[Any, ...] = ()
+        self._episode_template: List[Any] = []
+        self._longitudinal_values: List[Any] = []
+        self._study: Any = _NO_STUDY
+        self._study_templates: List[List[Any]] = []
+
+    def episode_template(
+        self,
+        client: Client,
+        episode: Episode,
+        episode_sort_date: Optional[datetime.date],
+        episode_outcome: Optional[str],
+        episode_outcome_future_id: Optional[str],
+        post_op: Optional[bool],
+    ) -> List[Any]:
+        """The episode-level columns, shared by all rows of ``episode``"""
+
+        return [
+            client.id,
+            client.site,
+            episode.id,
+            episode_sort_date,
+            episode.status.name if episode.status else None,
+            episode_outcome,
+            episode_outcome_future_id,
+            post_op,
+            episode.type.name if episode.type else None,
+            episode.action.name if episode.action else None,
+            episode.has_malignant_opinions,
+            episode.has_benign_opinions,
+            episode.opened_date,
+            episode.closed_date,
+            episode.actual_opened_year,
+            episode.events is not None,
         ]
 
-        for field in dataclasses.fields(DicomAttributes):
-            self.rows[0].append(field.name)
+    def longitudinal_columns(
+        self, features: Optional[ct.LongitudinalFeatures]
+    ) -> List[Any]:
+        """
+        The columns of the longitudinal features of an episode (see
+        :data:`LONGITUDINAL_COLUMNS`), if any are selected
+        """
+
+        if not self._longitudinal:
+            return []
+        if features is None:
+            return [None] * len(LONGITUDINAL_COLUMNS)
+        return [
+            features.num_prior_screens,
+            features.days_since_previous,
+            features.any_prior_malignancy,
+            features.any_prior_surgery,
+        ]
+
+    def study_templates(
+        self, episode_template: List[Any], study: Optional[Study]
+    ) -> List[List[Any]]:
+        """
+        The episode- and study-level columns, shared by all rows of ``study``
+        (or of an episode without studies), one per event type of the study
+        """
+
+        if study is None:
+            return [episode_template + [None, None, None]]
+
+        event_types: List[Optional[str]] = [None]
+        if study.event_type:
+            event_types = [e.name for e in study.event_type]
+        return [
+            episode_template + [study.id, study.date, event_type]
+            for event_type in event_types
+        ]
+
+    def image_columns(
+        self, series: Optional[Series], image: Optional[Image]
+    ) -> List[Any]:
+        """
+        The series- and image-level columns of a row, without DICOM
+        attributes unless selected (or if the header of the image cannot be
+        read, which is logged)
+        """
+
+        if not image:
+            return [series.id if series else None, None, 0] + _NO_DICOM_ATTRIBUTES
+
+        columns = [
+            series.id if series else None,
+            image.id,
+            len(image.marks) if image.marks else 0,
+        ]
+        if not self._dicom:
+            return columns + _NO_DICOM_ATTRIBUTES
+        try:
+            values = dicom_attributes(image)
+        except Exception:
+            # The row is written with empty DICOM attributes
+            logger.exception(f"Failed to read the attributes of {image.id}")
+            return columns + _NO_DICOM_ATTRIBUTES
+        return columns + [values[name] for name in _DICOM_ATTRIBUTE_NAMES]
 
     def add(
         self,
@@ -200,63 +488,120 @@ class DataWriter:
         study: Optional[Study],
         series: Optional[Series],
         image: Optional[Image],
+        features: Optional[ct.LongitudinalFeatures] = None,
     ) -> None:
-        event_types: List[Union[None, str]] = [None]
-
-        if study and study.event_type:
-            event_types = [e.name for e in study.event_type]
-
-        if image:
-            tags = extract_dicom_attributes(image)
-            num_marks = len(image.marks) if image.marks else 0
-        else:
-            tags = DicomAttributes()  # type: ignore
-            num_marks = 0
+        """Adds the rows of an image, see :meth:`build_rows`"""
 
-        episode_status = episode.status.name if episode.status else None
+        self.add_rows(
+            self.build_rows(
+                client,
+                episode,
+                episode_sort_date,
+                episode_outcome,
+                episode_outcome_future_id,
+                post_op,
+                study,
+                series,
+                image,
+                features,
+            )
+        )
 
-        # 1 row per event
-        for event_type in event_types:
-            ep_action = episode.action.name if episode.action else None
-            ep_type = episode.type.name if episode.type else None
+    def build_rows(
+        self,
+        client: Client,
+        episode: Episode,
+        episode_sort_date: Optional[datetime.date],
+        episode_outcome: Optional[str],
+        episode_outcome_future_id: Optional[str],
+        post_op: Optional[bool],
+        study: Optional[Study],
+        series: Optional[Series],
+        image: Optional[Image],
+        features: Optional[ct.LongitudinalFeatures] = None,
+    ) -> List[List[Any]]:
+        """
+        The rows of an image (or of an episode without images), one per event
+        type of ``study``, as yielded by :func:`flatten`. Consecutive
+        images of the same episode and study share their row templates, which
+        are built once.
+        """
 
-            row = [
-                client.id,
-                client.site,
-                episode.id,
+        with profiling.stage("rows", client.id):
+            episode_key = (
                 episode_sort_date,
-                episode_status,
                 episode_outcome,
                 episode_outcome_future_id,
                 post_op,
-                ep_type,
-                ep_action,
-                episode.has_malignant_opinions,
-                episode.has_benign_opinions,
-                episode.opened_date,
-                episode.closed_date,
-                episode.actual_opened_year,
-                episode.events is not None,
-                study.id if study else None,
-                study.date if study else None,
-                event_type,
-                series.id if series else None,
-                image.id if image else None,
-                num_marks,
-            ]
-
-            for tag in self.rows[0][len(row) :]:
-                row.append(getattr(tags, tag))
-
-            self.rows.append(row)
+                features,
+            )
+            if (
+                client is not self._client
+                or episode is not self._episode
+                or episode_key != self._episode_key
+            ):
+                self._client = client
+                self._episode = episode
+                self._episode_key = episode_key
+                self._episode_template = self.episode_template(
+                    client, episode, *episode_key[:-1]
+                )
+                self._longitudinal_values = self.longitudinal_columns(features)
+                self._study = _NO_STUDY
+
+            if study is not self._study:
+                self._study = study
+                self._study_templates = self.study_templates(
+                    self._episode_template, study
+                )
+
+            image_columns = self.image_columns(series, image)
+            if self._longitudinal:
+                image_columns += self._longitudinal_values
+            # 1 row per event
+            rows = [template + image_columns for template in self._study_templates]
+            if self._indices is not None:
+                rows = [[row[idx] for idx in self._indices] for row in rows]
+        return rows
+
+    def add_rows(self, rows: Iterable[List[Any]]) -> None:
+        """Adds rows built by another writer, e.g. in another process"""
+
+        with profiling.stage("write"):
+            for row in rows:
+                if self._writer is not None:
+                    self._writer.writerow(row)
+                else:
+                    self.rows.append(row)
+                self.num_rows += 1
 
     def write(self, outfile: str) -> None:
-        with open(outfile, "w") as f:
+        """Writes the collected :attr:`rows` to ``outfile``"""
+
+        with open(outfile, "w", buffering=BUFFER_SIZE) as f:
             writer = csv.writer(f, delimiter=",")
             writer.writerows(self.rows)
 
 
-def run(config: Config) -> None:
+def run(config: Config) -> List[str]:
+    """
+    Writes the summary of ``config``. Returns the IDs of the clients skipped,
+    as they could not be parsed or summarised (see :func:`summarise_client`).
+    """
+
+    if not (config.profile or config.profile_json):
+        return _run(config)
+
+    with profiling.profile() as profiler:
+        skipped = _run(config)
+    if config.profile:
+        click.echo(profiler.format(), err=True)
+    if config.profile_json:
+        profiler.write_json(config.profile_json)
+    return skipped
+
+
+def _run(config: Config) -> List[str]:
     client_list = None
     if config.clients_file:
         with open(config.clients_file, "r") as f:
@@ -268,21 +613,408 @@ def run(config: Config) -> None:
         distinct_event_study_links=(not config.link_all),
         nbss_dir=config.nbss_dir,
     )
-    writer = write_client_data(db, config)
-    writer.write(config.output_file)
+    if config.progress:
+        # A line updated in place on a terminal, otherwise logged periodically
+        tty = sys.stderr.isatty()
+        db.progress = _echo_progress if tty else _log_progress
+        db.progress_interval = 1.0 if tty else 30.0
+
+    try:
+        return _summarise_db(db, config)
+    finally:
+        if config.progress and sys.stderr.isatty():
+            click.echo(err=True)
+
+
+def _echo_progress(info: ProgressInfo) -> None:
+    click.echo(f"\r\033[K{info}", err=True, nl=False)
+
+
+def _log_progress(info: ProgressInfo) -> None:
+    click.echo(str(info), err=True)
+
+
+def _summarise_db(db: DB, config: Config) -> List[str]:
+    if config.incremental:
+        return run_incremental(db, config)
+
+    manifest: Optional[SourceManifest] = None
+    if config.manifest:
+        # Fingerprinted before summarising, so that files changed meanwhile
+        # are summarised again by the next incremental run
+        manifest = SourceManifest(manifest_params(config))
+        manifest.update(db, sorted(db.clients))
+
+    skipped: List[str] = []
+    if config.checkpoint_dir:
+        skipped = run_checkpointed(db, config)
+    else:
+        # Rows are streamed to the output file as each client is summarised
+        columns = summary_columns(config)
+        with open_table(config.output_file, columns, config.format) as table:
+            writer = DataWriter(table, columns)
+            if config.jobs == 1:
+                parsed: Set[str] = set()
+                write_client_data(_recorded(db, parsed), config, writer)
+                skipped = [c for c in db.clients if c not in parsed]
+                skipped += writer.skipped
+            else:
+                # Clients are summarised in order of ID, so the output is
+                # deterministic
+                client_ids = sorted(db.clients)
+                results = summarise_clients(db, client_ids, config)
+                for client_id, rows in zip(client_ids, results):
+                    if rows is None:
+                        skipped.append(client_id)
+                    else:
+                        writer.add_rows(rows)
+
+    if manifest is not None:
+        # Skipped clients have no rows, so are summarised again by the next
+        # incremental run
+        for client_id in skipped:
+            manifest.clients.pop(client_id, None)
+        manifest.save(manifest_path(config.output_file))
+    return skipped
+
+
+def _recorded(clients: Iterable[Client], ids: Set[str]) -> Iterator[Client]:
+    """Yields ``clients``, adding their IDs to ``ids``"""
+
+    for client in clients:
+        ids.add(client.id)
+        yield client
+
+
+def run_incremental(db: DB, config: Config) -> List[str]:
+    """
+    Updates the summary ``config.incremental``, written with a manifest (see
+    :class:`omidb.manifest.SourceManifest`), writing it to the output file
+    with a new manifest: the rows of the clients whose source files are
+    unchanged are copied, those of removed clients dropped, and the clients
+    which are new or changed are summarised (and their rows appended).
+
+    :return: The IDs of the new or changed clients skipped, as they could not
+        be parsed or summarised
+    :raises ValueError: If the previous summary was written with different
+        parameters or columns, or the columns do not include ``ClientID``
+    """
+
+    columns = summary_columns(config)
+    names = [name for name, _ in columns]
+    if "ClientID" not in names:
+        raise ValueError("Incremental summaries require the ClientID column")
+
+    manifest = SourceManifest.load(manifest_path(config.incremental))  # type: ignore
+    params = manifest_params(config)
+    if manifest.params != json.loads(json.dumps(params)):
+        raise ValueError(
+            f"{config.incremental} was written with different parameters, "
+            f"{manifest.params}"
+        )
+
+    previous = dict(manifest.clients)
+    changed = manifest.update(db, sorted(db.clients))
+    unchanged = set(manifest.clients) - set(changed)
+    logger.info(
+        f"Summarising {len(changed)} new or changed clients, keeping "
+        f"{len(unchanged)} and removing {len(set(previous) - set(manifest.clients))}"
+    )
+
+    # Written to a temporary file, so the output may replace the previous one
+    output_file = pathlib.Path(config.output_file)
+    tmp = output_file.with_name(output_file.name + ".tmp")
+    client_idx = names.index("ClientID")
+    try:
+        with open_table(
+            tmp, columns, config.format or format_from_path(output_file)
+        ) as table:
+            writer = DataWriter(table, columns)
+            # The previous rows of changed clients, kept if they are skipped
+            stale: Dict[str, List[List[Any]]] = {c: [] for c in changed}
+
+            def unchanged_rows() -> Iterator[List[Any]]:
+                for row in read_table(config.incremental, columns):  # type: ignore
+                    if row[client_idx] in unchanged:
+                        yield row
+                    elif row[client_idx] in stale:
+                        stale[row[client_idx]].append(row)
+
+            writer.add_rows(unchanged_rows())
+            skipped: List[str] = []
+            results = summarise_clients(db, changed, config)
+            for client_id, rows in zip(changed, results):
+                if rows is not None:
+                    writer.add_rows(rows)
+                    continue
+                skipped.append(client_id)
+                # Skipped: the previous rows are kept, with the previous
+                # fingerprint (if any), so the next run summarises it again
+                writer.add_rows(stale[client_id])
+                if client_id in previous:
+                    manifest.clients[client_id] = previous[client_id]
+                else:
+                    del manifest.clients[client_id]
+                del stale[client_id]
+        os.replace(tmp, output_file)
+    except BaseException:
+        if tmp.exists():
+            tmp.unlink()
+        raise
+
+    manifest.save(manifest_path(output_file))
+    return skipped
+
+
+def run_checkpointed(db: DB, config: Config) -> List[str]:
+    """
+    Summarises the clients of ``db`` in order of ID, writing the rows of every
+    ``config.checkpoint_size`` clients to a shard of the checkpoint in
+    ``config.checkpoint_dir`` (see :class:`omidb.checkpoint.Checkpoint`), and
+    finally merges the shards into the output file. With ``config.resume``,
+    the clients of an existing checkpoint are not summarised again.
+
+    :return: The IDs of the clients skipped, as they could not be parsed or
+        summarised
+    """
+
+    columns = summary_columns(config)
+    checkpoint = Checkpoint(
+        config.checkpoint_dir,  # type: ignore
+        columns,
+        checkpoint_params(config),
+        resume=config.resume,
+    )
+    completed = checkpoint.completed
+    client_ids = [c for c in sorted(db.clients) if c not in completed]
+    logger.info(
+        f"Summarising {len(client_ids)} clients "
+        f"({len(completed)} already in the checkpoint)"
+    )
+
+    skipped: List[str] = []
+    batch_ids: List[str] = []
+    batch_rows: List[List[Any]] = []
+    for client_id, rows in zip(client_ids, summarise_clients(db, client_ids, config)):
+        if rows is None:
+            # Not recorded as completed, so retried on resuming
+            skipped.append(client_id)
+            continue
+        batch_ids.append(client_id)
+        batch_rows.extend(rows)
+        if len(batch_ids) >= config.checkpoint_size:
+            checkpoint.add(batch_ids, batch_rows)
+            batch_ids, batch_rows = [], []
+    if batch_ids:
+        checkpoint.add(batch_ids, batch_rows)
+
+    with open_table(config.output_file, columns, config.format) as table:
+        DataWriter(table, columns).add_rows(checkpoint.rows())
+    return skipped
+
+
+def checkpoint_params(config: Config) -> Dict[str, Any]:
+    """The parameters of ``config`` which determine the rows of a client"""
+
+    return {
+        "link_all": config.link_all,
+        "nbss_dir": config.nbss_dir,
+        "num_months_cancer_prior": config.num_months_cancer_prior,
+        "num_months_ci_prior": config.num_months_ci_prior,
+        "num_months_normal_follow_up": config.num_months_normal_follow_up,
+        "num_months_benign_follow_up": config.num_months_benign_follow_up,
+        "include_images": config.include_images,
+    }
+
+
+def manifest_params(config: Config) -> Dict[str, Any]:
+    """The parameters of ``config`` which determine the summary of a client"""
+
+    params = checkpoint_params(config)
+    params["columns"] = [name for name, _ in summary_columns(config)]
+    return params
+
+
+# Rows (None if skipped), number of episodes and images, and profile of a
+# client
+_ClientResult = Tuple[
+    Optional[List[List[Any]]], Tuple[int, int], Optional[profiling.Profiler]
+]
+
+
+def summarise_clients(
+    db: DB, client_ids: Iterable[str], config: Config
+) -> Iterator[Optional[List[List[Any]]]]:
+    """
+    Yields the rows of each client of ``client_ids`` (see
+    :func:`summarise_client`), or ``None`` if the client was skipped as it
+    could not be parsed or summarised, in order, summarised in
+    ``config.jobs`` worker processes if more than one. If profiling (see
+    :mod:`omidb.profiling`), the profiles of the workers are merged into the
+    active profiler. Progress is reported to ``db.progress``, if set, with the
+    clients being summarised by the workers (not those queued) in progress.
+    """
+
+    client_ids = list(client_ids)
+    progress: Optional[Progress] = None
+    if db.progress is not None:
+        progress = Progress(
+            db.progress, db.source_sizes(client_ids), db.progress_interval, ticker=True
+        )
+    profiler = profiling.active()
+    # Worker processes profile themselves, and their profiles are merged
+    profile_workers = profiler is not None and config.jobs > 1
+
+    def work() -> Iterator[str]:
+        for client_id in client_ids:
+            if progress is not None:
+                progress.start(client_id)
+            yield client_id
+
+    try:
+        with contextlib.ExitStack() as stack:
+            results: Iterator[_ClientResult]
+            if config.jobs == 1:
+                results = (
+                    _summarise_client(db, client_id, config, False)
+                    for client_id in work()
+                )
+            else:
+                # Clients are submitted ahead of the workers, so the workers
+                # report the clients they start
+                started: Optional["multiprocessing.SimpleQueue[Any]"] = None
+                if progress is not None:
+                    started = multiprocessing.SimpleQueue()
+                    stack.callback(_forward_starts(started, progress))
+                # The DB and config are sent to each worker once, and the
+                # tasks only carry a client ID
+                executor = stack.enter_context(
+                    worker_pool(config.jobs, (db, config, profile_workers, started))
+                )
+                results = ordered_map(
+                    executor, _summarise_worker, client_ids, 4 * config.jobs
+                )
+
+            for client_id, (rows, counts, worker_profiler) in zip(client_ids, results):
+                if worker_profiler is not None:
+                    profiler.merge(worker_profiler)  # type: ignore
+                if progress is not None:
+                    progress.finish(client_id, *counts)
+                yield rows
+    finally:
+        if progress is not None:
+            progress.close()
+
+
+def summarise_client(db: DB, client_id: str, config: Config) -> List[List[Any]]:
+    """
+    The rows (excluding the header) of the client of ``db`` with ID
+    ``client_id``. Clients that cannot be parsed or summarised are logged and
+    skipped (with no rows).
+    """
+
+    return _summarise(db, client_id, config)[0] or []
+
+
+def _summarise(
+    db: DB, client_id: str, config: Config
+) -> Tuple[Optional[List[List[Any]]], Tuple[int, int]]:
+    """
+    The rows of a client (``None`` if skipped), and its number of episodes and
+    images
+    """
+
+    try:
+        client = db._parse_client(client_id, db._studies(client_id))
+    except Exception:
+        logger.exception(f"Failed to parse {client_id}, skipping")
+        return None, (0, 0)
+
+    writer = write_client_data([client], config)
+    if writer.skipped:
+        return None, count(client)
+    return writer.rows[1:], count(client)
+
+
+def _forward_starts(
+    started: "multiprocessing.SimpleQueue[Any]", progress: Progress
+) -> Callable[[], None]:
+    """
+    Marks the clients put on ``started`` (by workers) as in progress, from a
+    background thread. Returns a function which stops the thread, once the
+    workers are done.
+    """
+
+    def forward() -> None:
+        for client_id in iter(started.get, None):
+            progress.start(client_id)
+
+    thread = threading.Thread(target=forward, daemon=True)
+    thread.start()
+
+    def stop() -> None:
+        started.put(None)
+        thread.join()
+
+    return stop
+
+
+def _summarise_worker(client_id: str) -> _ClientResult:
+    db, config, profile, started = worker_state()
+    if started is not None:
+        started.put(client_id)
+    return _summarise_client(db, client_id, config, profile)
+
+
+def _summarise_client(
+    db: DB, client_id: str, config: Config, profile: bool
+) -> _ClientResult:
+    if not profile:
+        return (*_summarise(db, client_id, config), None)
+    with profiling.profile() as profiler:
+        rows, counts = _summarise(db, client_id, config)
+    return rows, counts, profiler
 
 
 def write_client_data(
-    clients: Iterable[Client], config: Optional[Config] = None
+    clients: Iterable[Client],
+    config: Optional[Config] = None,
+    writer: Optional[DataWriter] = None,
 ) -> DataWriter:
+    """
+    Adds the rows of ``clients`` to ``writer`` (by default, a new in-memory
+    :class:`DataWriter` with the columns of ``config``), which is returned.
+    The rows of a client are only added once all of them are built: clients
+    whose rows cannot be built are logged, skipped and recorded in
+    :attr:`DataWriter.skipped`. Images whose headers cannot be read are
+    written with empty DICOM attributes (see :meth:`DataWriter.image_columns`).
+    """
+
     if config is None:
         config = Config("", "", False, "", "", "", None, None, None, None)
-    writer: DataWriter = DataWriter()
-    for data in flatten(clients, config):
-        writer.add(*data)
+    if writer is None:
+        writer = DataWriter(columns=summary_columns(config))
+    for client in clients:
+        rows: List[List[Any]] = []
+        try:
+            # The derived properties of the client are read once per row
+            with client.memoised():
+                for data in flatten([client], config):
+                    rows.extend(writer.build_rows(*data))
+        except Exception:
+            logger.exception(f"Failed to summarise {client.id}, skipping")
+            writer.skipped.append(client.id)
+            continue
+        writer.add_rows(rows)
     return writer
 
 
+def _split_columns(columns: Optional[str]) -> Optional[List[str]]:
+    if columns is None:
+        return None
+    return [c.strip() for c in columns.split(",") if c.strip()]
+
+
 @click.command("summarise")
 @click.argument("db", type=click.Path(exists=True))
 @click.argument("output-file", type=click.Path(exists=False))
@@ -332,6 +1064,105 @@ def write_client_data(
     default=None,
     help="The number of months after which a second non-malignant episode must exist",
 )
+@click.option(
+    "--jobs",
+    type=int,
+    default=1,
+    help="Number of worker processes, each summarising a client at a time",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(FORMATS),
+    default=None,
+    help=(
+        "Format of OUTPUT_FILE (zst requires zstandard, parquet requires pyarrow), "
+        "by default inferred from its extension, or csv"
+    ),
+)
+@click.option(
+    "--checkpoint-dir",
+    type=click.Path(file_okay=False),
+    default=None,
+    help=(
+        "Write the rows of completed clients to this directory as the run "
+        "progresses, merging them into OUTPUT_FILE at the end"
+    ),
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Skip the clients already completed in the checkpoint (see --checkpoint-dir)",
+)
+@click.option(
+    "--checkpoint-size",
+    type=int,
+    default=100,
+    help="Number of clients per checkpoint shard",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    help=(
+        "Report the time, number of calls and bytes read of each stage (e.g. "
+        "JSON decoding, linking, classification), and the slowest clients"
+    ),
+)
+@click.option(
+    "--profile-json",
+    type=click.Path(exists=False),
+    default=None,
+    help="Write the profile (see --profile) to this file as JSON",
+)
+@click.option(
+    "--columns",
+    default=None,
+    help=(
+        "Comma-separated columns to write, in this order (by default all, "
+        "except the longitudinal features EpisodeNumPriorScreens, "
+        "EpisodeDaysSincePrevious, EpisodeAnyPriorMalignancy and "
+        "EpisodeAnyPriorSurgery). Image headers are only read if DICOM "
+        "attribute columns are written"
+    ),
+)
+@click.option(
+    "--exclude-columns",
+    default=None,
+    help="Comma-separated columns not to write",
+)
+@click.option(
+    "--episode-level",
+    is_flag=True,
+    help=(
+        "Write one row per episode, without studies, series and images (by "
+        "default, with the episode-level columns only)"
+    ),
+)
+@click.option(
+    "--manifest",
+    is_flag=True,
+    help=(
+        "Write a manifest of the source files of each client alongside "
+        "OUTPUT_FILE, for later --incremental runs"
+    ),
+)
+@click.option(
+    "--incremental",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help=(
+        "Update this previous summary, written with --manifest, summarising only "
+        "the clients whose source files changed (OUTPUT_FILE may be the same file)"
+    ),
+)
+@click.option(
+    "--progress",
+    is_flag=True,
+    help=(
+        "Report the clients, episodes and images summarised, throughput, ETA and "
+        "slowest client in progress"
+    ),
+)
 def cli(
     db: str,
     output_file: str,
@@ -343,6 +1174,19 @@ def cli(
     num_months_ci_prior: Optional[int],
     num_months_normal_follow_up: Optional[int],
     num_months_benign_follow_up: Optional[int],
+    jobs: int,
+    output_format: Optional[str],
+    checkpoint_dir: Optional[str],
+    resume: bool,
+    checkpoint_size: int,
+    profile: bool,
+    profile_json: Optional[str],
+    columns: Optional[str],
+    exclude_columns: Optional[str],
+    episode_level: bool,
+    manifest: bool,
+    incremental: Optional[str],
+    progress: bool,
 ) -> None:
     """ "Write a csv file, OUTPUT_FILE, summarising the content of OMI-DB,
     located at DB
@@ -359,12 +1203,44 @@ def cli(
         num_months_ci_prior,
         num_months_normal_follow_up,
         num_months_benign_follow_up,
+        max(jobs, 1),
+        output_format,
+        checkpoint_dir=checkpoint_dir,
+        resume=resume,
+        checkpoint_size=max(checkpoint_size, 1),
+        profile=profile,
+        profile_json=profile_json,
+        columns=_split_columns(columns),
+        exclude_columns=_split_columns(exclude_columns),
+        include_images=not episode_level,
+        manifest=manifest,
+        incremental=incremental,
+        progress=progress,
     )
+    try:
+        summary_columns(config)
+    except ValueError as e:
+        raise click.BadParameter(
+            str(e), param_hint="--columns/--exclude-columns"
+        ) from e
+
+    if resume and not checkpoint_dir:
+        raise click.UsageError("--resume requires --checkpoint-dir")
+    if incremental and checkpoint_dir:
+        raise click.UsageError("--incremental cannot be used with --checkpoint-dir")
 
     logger.enable("omidb")
 
     if log_file:
         logger.remove()
-        logger.add(log_file)
+        logger.add(log_file, enqueue=jobs > 1)
 
-    run(config)
+    skipped = run(config)
+    if skipped:
+        click.echo(
+            f"Skipped {len(skipped)} clients which could not be summarised "
+            f"(see the log): {', '.join(sorted(skipped)[:10])}"
+            + (", ..." if len(skipped) > 10 else ""),
+            err=True,
+        )
+        sys.exit(1)
@@ -0,0 +1,135 @@
+from typing import Iterator, Optional, Tuple, Sequence
+import concurrent.futures
+import pathlib
+import click
+from loguru import logger
+from ..parser import DB
+from ..thumbnails import ThumbnailCache, LEVELS
+from ..parallel import ordered_map
+
+
+def images(db: DB) -> Iterator[Tuple[str, pathlib.Path]]:
+    for client in db:
+        for episode in client.episodes:
+            for study in episode.studies:
+                for series in study.series:
+                    for image in series.images:
+                        dcm_path = image.dcm_path
+                        if dcm_path is not None:
+                            yield image.id, dcm_path
+
+
+def build_thumbnails(
+    uid: str, dcm_path: pathlib.Path, cache: ThumbnailCache, force: bool = False
+) -> bool:
+    """
+    Builds the thumbnails of a single dicom, returning ``False`` (and logging
+    the error) on failure.
+    """
+
+    try:
+        cache.build(uid, dcm_path, force)
+    except Exception:
+        logger.exception(f"Failed to build thumbnails of {dcm_path}")
+        return False
+    return True
+
+
+def _build_thumbnails(args: Tuple[str, pathlib.Path, ThumbnailCache, bool]) -> bool:
+    return build_thumbnails(*args)
+
+
+def run(
+    db: DB,
+    cache: ThumbnailCache,
+    jobs: int = 1,
+    force: bool = False,
+) -> Tuple[int, int]:
+    """
+    Builds the thumbnails of every image in ``db``. Returns the number of
+    images processed successfully and the number of failures.
+    """
+
+    work = ((uid, dcm_path, cache, force) for uid, dcm_path in images(db))
+
+    num_ok = num_failed = 0
+    if jobs == 1:
+        for ok in map(_build_thumbnails, work):
+            num_ok += ok
+            num_failed += not ok
+    else:
+        with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+            for ok in ordered_map(executor, _build_thumbnails, work, 4 * jobs):
+                num_ok += ok
+                num_failed += not ok
+
+    return num_ok, num_failed
+
+
+@click.command("thumbnails")
+@click.argument("db", type=click.Path(exists=True))
+@click.argument("image-dir", type=click.Path(exists=True))
+@click.option(
+    "--cache-dir",
+    type=click.Path(exists=False),
+    help=(
+        "Directory in which to store the thumbnails, defaults to "
+        "$OMIDB_CACHE_DIR/thumbnails or ~/.cache/omidb/thumbnails"
+    ),
+)
+@click.option(
+    "--level",
+    "levels",
+    type=int,
+    multiple=True,
+    help=(
+        "Length of the longest side of the thumbnails at each level, "
+        f"defaults to {', '.join(str(_) for _ in LEVELS)}"
+    ),
+)
+@click.option(
+    "--jobs",
+    type=int,
+    default=1,
+    help="Number of worker processes used to build thumbnails",
+)
+@click.option("--force", is_flag=True, help="Rebuild existing thumbnails")
+@click.option(
+    "--clients-file",
+    type=click.Path(exists=True),
+    help="File containing a list of clients to parse",
+)
+@click.option("--log-file", type=click.Path(exists=False), help="Log to this file")
+def cli(
+    db: str,
+    image_dir: str,
+    cache_dir: Optional[str],
+    levels: Sequence[int],
+    jobs: int,
+    force: bool,
+    clients_file: Optional[str],
+    log_file: Optional[str],
+) -> None:
+    """Build the thumbnail pyramid of every image of OMI-DB, located at DB and
+    IMAGE_DIR
+    """
+
+    client_list = None
+    if clients_file:
+        with open(clients_file, "r") as f:
+            client_list = [_.strip() for _ in f.readlines()]
+
+    logger.enable("omidb")
+
+    if log_file:
+        logger.remove()
+        logger.add(log_file, enqueue=jobs > 1)
+
+    cache = ThumbnailCache(cache_dir, levels or LEVELS)
+    num_ok, num_failed = run(
+        DB(db, image_dir, clients=client_list), cache, max(jobs, 1), force
+    )
+    click.echo(
+        f"Built thumbnails of {num_ok} images in {cache.cache_dir} "
+        f"({num_failed} failed)"
+    )
@@ -1,10 +1,11 @@
 import datetime
 from dataclasses import dataclass, fields, field
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Iterable
 import enum
 from .events import Events, SideOpinion
 from .study import Study
 from .lesion import Lesion
+from .utilities import Memoised, memoised_property
 
 
 @enum.unique
@@ -62,7 +63,7 @@ class Status(enum.Enum):
 
 
 @dataclass
-class Episode:
+class Episode(Memoised):
     """
     An episode contains a set of medical procedures or events associated with
     the treatment or diagnosis of a clinical condition. Medical imaging studies
@@ -96,7 +97,10 @@ class Episode:
     lesions: Dict[str, Lesion] = field(default_factory=dict)
     actual_opened_year: Optional[int] = None
 
-    @property
+    def _memoised_children(self) -> Iterable[Lesion]:
+        return self.lesions.values()
+
+    @memoised_property
     def has_benign_opinions(self) -> bool:
         """
         Returns ``True`` if the container ``e.events`` contains a
@@ -122,7 +126,7 @@ class Episode:
 
         return False
 
-    @property
+    @memoised_property
     def has_malignant_opinions(self) -> bool:
         """
         Returns ``True`` if the container ``e.events`` contains a
@@ -148,7 +152,7 @@ class Episode:
 
         return False
 
-    @property
+    @memoised_property
     def is_interval_cancer(self) -> bool:
         """
         Return ``True`` if:
@@ -173,7 +177,7 @@ class Episode:
                     return False
         return True
 
-    @property
+    @memoised_property
     def status(self) -> Optional[Status]:
         if self.is_interval_cancer:
             return Status.CI
@@ -0,0 +1,629 @@
+"""
+A columnar representation of the episodes of many clients, over which the
+classification rules of ``classificationtools.episode_outcome`` are evaluated
+with vectorised operations.
+"""
+
+import datetime
+import itertools
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+import numpy as np
+import numpy.typing as npt
+from loguru import logger
+from .client import Client
+from .episode import Episode, Status, Type, _validate_events
+from .classificationtools import (
+    ClientTimeline,
+    EpisodeOutcome,
+    UndefinedEpisodeOutcome,
+    classify_client,
+)
+
+Outcome = Union[EpisodeOutcome, UndefinedEpisodeOutcome]
+IntArray = npt.NDArray[np.int64]
+BoolArray = npt.NDArray[np.bool_]
+
+# Date, type, status, has events, valid events, is interval cancer, has malignant
+# opinions, has surgery and has screening of an episode
+_Row = Tuple[int, int, int, bool, bool, bool, bool, bool, bool]
+
+# Outcome codes are indices into OUTCOMES, with FAILED for episodes whose
+# classification raises (see ``classify_client``)
+OUTCOMES: List[Outcome] = [*EpisodeOutcome, *UndefinedEpisodeOutcome]
+FAILED = -1
+
+_CODE: Dict[Outcome, int] = {outcome: code for code, outcome in enumerate(OUTCOMES)}
+_STATUSES = list(Status)
+_TYPES = list(Type)
+
+# Outcome code of a normal episode by status code (the last entry is for `None`)
+_NORMAL_CODE = np.array(
+    [
+        (
+            _CODE[EpisodeOutcome[s.name]]
+            if s in (Status.NAB, Status.NA, Status.N)
+            else FAILED
+        )
+        for s in _STATUSES
+    ]
+    + [FAILED],
+    dtype=np.int64,
+)
+
+# Keeps the dates (as ordinals) of different clients apart in the sort key
+_CLIENT_STRIDE = 2**40
+_MAX_WINDOW = 2**38
+
+
+def _days(num_months: int) -> int:
+    """
+    The largest whole number of days within ``num_months`` months of an
+    episode, as compared by ``ClientTimeline.within``
+    """
+
+    days = datetime.timedelta(num_months * 365 / 12) // datetime.timedelta(days=1)
+    return int(np.clip(days, -_MAX_WINDOW, _MAX_WINDOW))
+
+
+def _window_days(num_months: IntArray) -> IntArray:
+    """:func:`_days` of each element of ``num_months``"""
+
+    values, inverse = np.unique(num_months, return_inverse=True)
+    days = np.array([_days(int(m)) for m in values], dtype=np.int64)
+    window: IntArray = days[inverse.reshape(-1)]
+    return window
+
+
+def _next_true(mask: BoolArray) -> IntArray:
+    """
+    For each index ``i``, the first index ``j >= i`` at which ``mask`` is
+    ``True``, or ``len(mask)`` if none, with an additional entry for
+    ``i = len(mask)``.
+    """
+
+    n = len(mask)
+    idx = np.append(np.where(mask, np.arange(n), n), n)
+    first: IntArray = np.minimum.accumulate(idx[::-1])[::-1]
+    return first
+
+
+def _tabulate(client: Client) -> Tuple[List[int], List[_Row]]:
+    """
+    The position of each episode of ``client`` (or ``-1`` if they cannot be
+    sorted), and the properties of each episode used for classification.
+    """
+
+    timeline = ClientTimeline(client.episodes)
+    sortable = timeline._sorted is not None
+
+    positions: List[int] = []
+    rows: List[_Row] = []
+    for ep in client.episodes:
+        try:
+            date = timeline.date(ep).toordinal()
+        except ValueError:
+            date = -1
+        status = timeline.status(ep)
+        positions.append(timeline._position(ep) if sortable else -1)
+        rows.append(
+            (
+                date,
+                _TYPES.index(ep.type) if ep.type is not None else -1,
+                _STATUSES.index(status) if status is not None else -1,
+                ep.events is not None,
+                _validate_events(ep),
+                ep.is_interval_cancer,
+                ep.has_malignant_opinions,
+                ep.events is not None and ep.events.surgery is not None,
+                ep.events is not None and bool(ep.events.screening),
+            )
+        )
+    return positions, rows
+
+
+class _Decisions:
+    """
+    The outcome codes and related rows of a classification in progress, where
+    each rule decides the episodes it matches among those still undecided
+    """
+
+    def __init__(self, todo: BoolArray):
+        self.todo = todo
+        self.code: IntArray = np.full(len(todo), FAILED, dtype=np.int64)
+        self.related: IntArray = np.full(len(todo), -1, dtype=np.int64)
+
+    def copy(self) -> "_Decisions":
+        other = _Decisions(self.todo.copy())
+        other.code = self.code.copy()
+        other.related = self.related.copy()
+        return other
+
+    def decide(
+        self,
+        mask: BoolArray,
+        outcome: Union[Outcome, IntArray],
+        rows: Optional[IntArray] = None,
+    ) -> None:
+        mask = mask & self.todo
+        if isinstance(outcome, np.ndarray):
+            self.code[mask] = outcome[mask]
+        else:
+            self.code[mask] = _CODE[outcome]
+        if rows is not None:
+            self.related[mask] = rows[mask]
+        self.todo &= ~mask
+
+
+class EpisodeTable:
+    """
+    The episodes of ``clients`` as columns (NumPy arrays), with one row per
+    episode in the order of the clients and their episodes, such that the
+    outcomes of all episodes (see ``classificationtools.episode_outcome``,
+    whose results are matched exactly) are computed with vectorised operations.
+
+    The properties of each episode (earliest date, status etc.) are computed
+    once, on construction, so classifying with several sets of thresholds
+    costs little more than classifying once::
+
+        table = EpisodeTable(db)
+        for months in (12, 24, 36):
+            labels = table.labels(num_months_normal_follow_up=months)
+
+    Clients whose episodes fail to be tabulated are logged, and classified
+    with ``classificationtools.classify_client`` instead.
+
+    The episodes must not be modified while the table is in use.
+
+    :param clients: The clients, e.g. a :class:`omidb.parser.DB`
+    """
+
+    def __init__(self, clients: Iterable[Client]):
+        self.clients: List[Client] = []
+        self.episodes: List[Episode] = []
+
+        client: List[int] = []
+        position: List[int] = []
+        rows: List[_Row] = []
+        fallback: List[bool] = []
+        for client_idx, c in enumerate(clients):
+            try:
+                client_positions, client_rows = _tabulate(c)
+                failed = False
+            except Exception:
+                logger.exception(
+                    f"Failed to tabulate {c.id}, classifying it episode by episode"
+                )
+                client_positions = [-1] * len(c.episodes)
+                client_rows = [
+                    (-1, -1, -1, False, False, False, False, False, False)
+                ] * len(c.episodes)
+                failed = True
+
+            self.clients.append(c)
+            self.episodes.extend(c.episodes)
+            client.extend([client_idx] * len(c.episodes))
+            position.extend(client_positions)
+            rows.extend(client_rows)
+            fallback.extend([failed] * len(c.episodes))
+
+        columns = list(zip(*rows)) if rows else [()] * 9
+
+        #: Index into :attr:`clients` of the client of each episode
+        self.client: IntArray = np.array(client, dtype=np.int64)
+        #: Earliest date of each episode (as an ordinal), ``-1`` if none
+        self.date: IntArray = np.array(columns[0], dtype=np.int64)
+        #: Index into ``list(Type)`` of each episode's type, ``-1`` if none
+        self.type: IntArray = np.array(columns[1], dtype=np.int64)
+        #: Index into ``list(Status)`` of each episode's status, ``-1`` if none
+        self.status: IntArray = np.array(columns[2], dtype=np.int64)
+        self.has_events: BoolArray = np.array(columns[3], dtype=bool)
+        self.valid_events: BoolArray = np.array(columns[4], dtype=bool)
+        self.is_interval_cancer: BoolArray = np.array(columns[5], dtype=bool)
+        self.has_malignant_opinions: BoolArray = np.array(columns[6], dtype=bool)
+        self.has_surgery: BoolArray = np.array(columns[7], dtype=bool)
+        self.has_screening: BoolArray = np.array(columns[8], dtype=bool)
+
+        self._fallback: BoolArray = np.array(fallback, dtype=bool)
+        position_ = np.array(position, dtype=np.int64)
+        #: ``False`` for the episodes of clients whose episodes cannot be sorted
+        self.sortable: BoolArray = position_ >= 0
+
+        n = len(self.episodes)
+        starts = np.searchsorted(self.client, np.arange(len(self.clients)))
+        ends = np.searchsorted(self.client, np.arange(len(self.clients)), "right")
+
+        # The episodes of each client in chronological order (as a stable sort,
+        # like ClientTimeline), or in their original order if unsortable
+        key = np.where(self.sortable, self.date, 0)
+        #: Row of each episode in chronological order, grouped by client
+        self.order: IntArray = np.lexsort((np.arange(n), key, self.client))
+        self._key = self.client[self.order] * _CLIENT_STRIDE + key[self.order]
+
+        #: Position of each episode in :attr:`order`
+        self.position: IntArray = starts[self.client] + np.maximum(position_, 0)
+        # Start in `order` of the episodes of each episode's client
+        self._start: IntArray = starts[self.client]
+        # End (exclusive) in `order` of the episodes of each episode's client
+        self._end: IntArray = ends[self.client]
+
+        self._scan()
+
+    def __len__(self) -> int:
+        return len(self.episodes)
+
+    def _scan(self) -> None:
+        """
+        Computes everything that does not depend on the number of months of
+        :meth:`outcomes`: the next episode of each kind after each episode, the
+        gap to the next episode, and the outcomes independent of subsequent
+        episodes
+        """
+
+        n = len(self)
+        order = self.order
+        status = self.status
+        self._is_ci_type = self.type == _TYPES.index(Type.CI)
+        self._is_benign = status == _STATUSES.index(Status.B)
+        self._is_malignant = status == _STATUSES.index(Status.M)
+        self._is_cancer = (
+            (status == _STATUSES.index(Status.CI))
+            | self._is_ci_type
+            | self._is_malignant
+        )
+        self._normal = _NORMAL_CODE[status]
+
+        first = self.position + 1
+        self._last = first >= self._end
+        self._next = self._row(first)
+        #: Days from each episode to the next (undefined for the last episode)
+        self.gap: IntArray = self.date[self._next] - self.date
+        # The window of the default number of months of priors, see outcomes
+        self._default_window = _window_days(
+            np.ceil(12 * self.gap / 365.0).astype(np.int64)
+        )
+
+        def next_true(mask: BoolArray) -> IntArray:
+            """First position in :attr:`order` after each episode where ``mask``"""
+            pos = _next_true(mask[order])[first]
+            return np.where(pos < self._end, pos, n)
+
+        self._next_invalid = next_true(~self.valid_events)
+        self._next_prior = next_true(self._is_ci_type | self._is_malignant)
+        self._next_no_events = next_true(~self.has_events)
+        self._next_cancer = next_true(self._is_cancer)
+
+        base = _Decisions(~self._fallback)
+        base.decide(status == _STATUSES.index(Status.CI), EpisodeOutcome.CI)
+        base.decide(self._is_ci_type, UndefinedEpisodeOutcome.InvalidEvents)
+        base.decide(self._is_malignant, EpisodeOutcome.M)
+        base.decide(
+            ~self.has_events | ~self.valid_events,
+            UndefinedEpisodeOutcome.InvalidEvents,
+        )
+        base.decide(~self.sortable, UndefinedEpisodeOutcome.DateError)
+        # Subsequent episodes with invalid events
+        base.decide(self._next_invalid < n, UndefinedEpisodeOutcome.InvalidEvents)
+        self._base = base
+
+    def _row(self, pos: IntArray) -> IntArray:
+        """The row at each position of :attr:`order`, clamped to the table"""
+        rows: IntArray = self.order[np.clip(pos, 0, max(len(self) - 1, 0))]
+        return rows
+
+    def _window_end(self, window: Union[int, IntArray], rows: BoolArray) -> IntArray:
+        """
+        For each of ``rows``, the position in :attr:`order` of the first
+        subsequent episode more than ``window`` days after it (or the end of its
+        client). Other rows are given the end of their client.
+        """
+
+        idx = np.flatnonzero(rows)
+        target = (
+            self.client[idx] * _CLIENT_STRIDE
+            + self.date[idx]
+            + np.broadcast_to(window, rows.shape)[idx]
+        )
+        end = self._end.copy()
+        end[idx] = np.clip(
+            np.searchsorted(self._key, target, "right"),
+            self.position[idx] + 1,
+            self._end[idx],
+        )
+        return end
+
+    def outcomes(
+        self,
+        num_months_ci_prior: Optional[int] = None,
+        num_months_cancer_prior: Optional[int] = None,
+        num_months_normal_follow_up: Optional[int] = None,
+        num_months_benign_follow_up: Optional[int] = None,
+    ) -> Tuple[IntArray, IntArray]:
+        """
+        Classifies every episode, see ``classificationtools.episode_outcome``
+        for the parameters. Returns the outcome of each episode as an index
+        into :data:`OUTCOMES` (or :data:`FAILED`), and the row of the related
+        episode (or ``-1``).
+        """
+
+        months = dict(
+            num_months_ci_prior=num_months_ci_prior,
+            num_months_cancer_prior=num_months_cancer_prior,
+            num_months_normal_follow_up=num_months_normal_follow_up,
+            num_months_benign_follow_up=num_months_benign_follow_up,
+        )
+        n = len(self)
+        result = self._base.copy()
+        decide = result.decide
+        if not result.todo.any():
+            return self._fill_fallback(result.code, result.related, months)
+
+        is_benign = self._is_benign
+        normal = self._normal
+
+        # No subsequent episode
+        last = self._last
+        if num_months_benign_follow_up is None:
+            decide(last & is_benign, EpisodeOutcome.B)
+        if num_months_normal_follow_up is None:
+            decide(last, normal)
+        decide(last, UndefinedEpisodeOutcome.NoSubsequentEpisode)
+
+        # Priors of interval cancers and malignant episodes
+        window_ci: Union[int, IntArray] = (
+            self._default_window
+            if num_months_ci_prior is None
+            else _days(num_months_ci_prior)
+        )
+        window_cancer: Union[int, IntArray] = (
+            self._default_window
+            if num_months_cancer_prior is None
+            else _days(num_months_cancer_prior)
+        )
+        # The window of the longer of the two, as _days is non-decreasing
+        window_end = self._window_end(np.maximum(window_ci, window_cancer), result.todo)
+        prior_row = self._row(self._next_prior)
+        has_prior = self._next_prior < window_end
+        prior_gap = self.date[prior_row] - self.date
+
+        ci_prior = has_prior & self._is_ci_type[prior_row]
+        within_ci = prior_gap <= window_ci
+        decide(
+            ci_prior & within_ci & self.is_interval_cancer[prior_row],
+            EpisodeOutcome.CIP,
+            prior_row,
+        )
+        decide(ci_prior & within_ci, UndefinedEpisodeOutcome.InvalidEvents, prior_row)
+        decide(ci_prior, UndefinedEpisodeOutcome.InvalidPrior, prior_row)
+        decide(
+            has_prior
+            & self.has_malignant_opinions[prior_row]
+            & (prior_gap <= window_cancer),
+            EpisodeOutcome.MP,
+            prior_row,
+        )
+        decide(has_prior, UndefinedEpisodeOutcome.InvalidPrior, prior_row)
+
+        # Follow-up
+        if num_months_benign_follow_up is None:
+            decide(is_benign, EpisodeOutcome.B)
+        if num_months_normal_follow_up is None:
+            decide(~is_benign, normal)
+        if not result.todo.any():
+            return self._fill_fallback(result.code, result.related, months)
+
+        window_follow_up = np.where(
+            is_benign,
+            _days(num_months_benign_follow_up or 0),
+            _days(num_months_normal_follow_up or 0),
+        )
+        follow_up = self._window_end(window_follow_up, result.todo)
+        outside = follow_up < self._end
+
+        no_events = self._next_no_events
+        cancer = np.where(self._next_cancer < follow_up, self._next_cancer, n)
+        decide(
+            (no_events < n)
+            & (no_events <= np.minimum(cancer, np.where(outside, follow_up, n))),
+            UndefinedEpisodeOutcome.InvalidEvents,
+            self._row(no_events),
+        )
+        decide(cancer < n, UndefinedEpisodeOutcome.InvalidPrior, self._row(cancer))
+        decide(~outside, UndefinedEpisodeOutcome.InvalidFollowUp)
+
+        to_check = self._row(follow_up)
+        decide(
+            self._is_cancer[to_check], UndefinedEpisodeOutcome.InvalidPrior, to_check
+        )
+        decide(is_benign, EpisodeOutcome.B, to_check)
+        decide(result.todo, normal, to_check)
+
+        return self._fill_fallback(result.code, result.related, months)
+
+    def longitudinal_features(self) -> Dict[str, npt.NDArray[Any]]:
+        """
+        The ``classificationtools.LongitudinalFeatures`` of every episode, as
+        columns keyed by field name, computed with prefix sums over
+        :attr:`order`. ``days_since_previous`` is ``-1`` for the first episode
+        of each client. The features of episodes of clients whose episodes
+        cannot be sorted (see :attr:`sortable`), or which failed to be
+        tabulated, are ``False``, ``0`` or ``-1``.
+        """
+
+        order = self.order
+        valid = self.sortable & ~self._fallback
+
+        def prior_count(mask: BoolArray) -> IntArray:
+            """Number of earlier episodes of the same client where ``mask``"""
+            cumulative = np.concatenate(([0], np.cumsum(mask[order])))
+            count: IntArray = np.where(
+                valid, cumulative[self.position] - cumulative[self._start], 0
+            )
+            return count
+
+        has_previous = valid & (self.position > self._start)
+        previous = self._row(self.position - 1)
+        malignant = self._is_malignant | (self.status == _STATUSES.index(Status.CI))
+        return {
+            "is_post_op": prior_count(self.has_surgery | self._is_ci_type) > 0,
+            "num_prior_screens": prior_count(self.has_screening),
+            "days_since_previous": np.where(
+                has_previous, self.date - self.date[previous], -1
+            ),
+            "any_prior_malignancy": prior_count(malignant) > 0,
+            "any_prior_surgery": prior_count(self.has_surgery) > 0,
+        }
+
+    def _fill_fallback(
+        self, code: IntArray, related: IntArray, months: Dict[str, Optional[int]]
+    ) -> Tuple[IntArray, IntArray]:
+        """Classifies the clients which failed to be tabulated, in place"""
+
+        if not self._fallback.any():
+            return code, related
+
+        for client_idx in np.unique(self.client[self._fallback]):
+            rows = np.flatnonzero(self.client == client_idx)
+            ids = {}
+            for r in rows[::-1]:
+                ids[self.episodes[r].id] = r
+            client = self.clients[client_idx]
+            try:
+                results = classify_client(client, **months)
+            except Exception:
+                logger.exception(f"Failed to classify {client.id}")
+                continue
+            for r, result in zip(rows, results):
+                if result is None:
+                    continue
+                outcome, related_id = result
+                code[r] = _CODE[outcome]
+                related[r] = ids.get(related_id, -1) if related_id is not None else -1
+        return code, related
+
+    def labels(
+        self,
+        num_months_ci_prior: Optional[int] = None,
+        num_months_cancer_prior: Optional[int] = None,
+        num_months_normal_follow_up: Optional[int] = None,
+        num_months_benign_follow_up: Optional[int] = None,
+    ) -> List[Optional[Tuple[Outcome, Optional[str]]]]:
+        """
+        Classifies every episode as :meth:`outcomes`, returning the outcome and
+        the ID of the related episode of each, as ``episode_outcome``, or
+        ``None`` if the classification failed (as ``classify_client``).
+        """
+
+        code, related = self.outcomes(
+            num_months_ci_prior=num_months_ci_prior,
+            num_months_cancer_prior=num_months_cancer_prior,
+            num_months_normal_follow_up=num_months_normal_follow_up,
+            num_months_benign_follow_up=num_months_benign_follow_up,
+        )
+        return [
+            (
+                None
+                if c == FAILED
+                else (OUTCOMES[c], self.episodes[r].id if r >= 0 else None)
+            )
+            for c, r in zip(code.tolist(), related.tolist())
+        ]
+
+
+Months = Dict[str, Optional[int]]
+Counts = Dict[Optional[Outcome], int]
+Labels = List[Optional[Tuple[Outcome, Optional[str]]]]
+
+_PARAMETERS = (
+    "num_months_ci_prior",
+    "num_months_cancer_prior",
+    "num_months_normal_follow_up",
+    "num_months_benign_follow_up",
+)
+
+
+def parameter_grid(
+    grid: Union[Mapping[str, Sequence[Optional[int]]], Iterable[Months]],
+) -> List[Months]:
+    """
+    The combinations of month parameters of ``grid``, either a mapping from
+    parameter name to the values to try (all combinations of which are
+    returned, parameters not listed being ``None``) or the combinations
+    themselves. Raises a ``ValueError`` for unknown parameter names.
+
+    :param grid: E.g. ``{"num_months_normal_follow_up": [None, 12, 24]}``
+    """
+
+    if isinstance(grid, Mapping):
+        names = list(grid.keys())
+        combinations = [
+            dict(zip(names, values))
+            for values in itertools.product(*(grid[name] for name in names))
+        ]
+    else:
+        combinations = [dict(months) for months in grid]
+
+    for months in combinations:
+        unknown = set(months) - set(_PARAMETERS)
+        if unknown:
+            raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+    return [{name: months.get(name) for name in _PARAMETERS} for months in combinations]
+
+
+def count_outcomes(code: IntArray) -> Counts:
+    """
+    The number of episodes with each outcome (``None`` for failures), given the
+    outcome codes of :meth:`EpisodeTable.outcomes`
+    """
+
+    counts = np.bincount(code + 1, minlength=len(OUTCOMES) + 1).tolist()
+    result: Counts = {outcome: counts[c + 1] for c, outcome in enumerate(OUTCOMES)}
+    result[None] = counts[0]
+    return result
+
+
+def sweep_outcomes(
+    clients: Union[Iterable[Client], EpisodeTable],
+    grid: Union[Mapping[str, Sequence[Optional[int]]], Iterable[Months]],
+    labels: bool = False,
+) -> List[Tuple[Months, Union[Counts, Labels]]]:
+    """
+    Classifies every episode of ``clients`` (see
+    ``classificationtools.episode_outcome``) with each combination of month
+    parameters in ``grid``. The episodes are tabulated once (see
+    :class:`EpisodeTable`), so the sorting, earliest dates, event validation
+    and inter-episode gaps are shared by all combinations. Returns each
+    combination (with all four parameters) alongside the number of episodes
+    per outcome, or, if ``labels``, the outcome and related episode ID of each
+    episode as :meth:`EpisodeTable.labels`. For example::
+
+        for months, counts in sweep_outcomes(db, {
+            "num_months_normal_follow_up": [None, 12, 24, 36],
+            "num_months_cancer_prior": [None, 36, 39],
+        }):
+            print(months, counts[EpisodeOutcome.N])
+
+    :param clients: The clients, or an :class:`EpisodeTable` of them
+    :param grid: See :func:`parameter_grid`
+    :param labels: Return per-episode labels rather than counts
+    """
+
+    table = clients if isinstance(clients, EpisodeTable) else EpisodeTable(clients)
+
+    results: List[Tuple[Months, Union[Counts, Labels]]] = []
+    for months in parameter_grid(grid):
+        if labels:
+            results.append((months, table.labels(**months)))
+        else:
+            code, _ = table.outcomes(**months)
+            results.append((months, count_outcomes(code)))
+    return results
@@ -1,10 +1,30 @@
 from __future__ import annotations
-from typing import Dict, List, Callable, Iterator, Union
+from typing import (
+    Dict,
+    List,
+    Callable,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+from dataclasses import dataclass, replace
+import concurrent.futures
+import datetime
+from loguru import logger
 from .client import Client
-from .episode import Episode
+from .episode import Episode, Type
+from .events import Event
+from .mark import Mark
 from .study import Study
 from .series import Series
 from .image import Image
+from .parallel import ordered_map
+
+Match = Tuple[Client, Episode, Study, Series, Image]
 
 
 class FilterImages:
@@ -12,14 +32,27 @@ class FilterImages:
     Filter images of a hierarchical Image model, by applying a user-specified
     filtering function to each image.
 
+    Images for which the filtering function raises an exception are logged,
+    recorded in :attr:`errors` (as tuples of the image and the exception), and
+    filtered out, such that one unreadable image does not abort the filtering.
+    :attr:`errors` holds the errors of the latest call only (of
+    :meth:`images`, :meth:`__call__`, or of a :class:`Query` using the filter).
+
     :param image_filter: Use `image_filter` to filter images provided by the caller.
+    :param workers: Number of threads used to evaluate `image_filter`. Use more
+        than one for filters that do I/O, e.g. read headers or dicoms. Images
+        remain in their original order.
     """
 
-    def __init__(self, image_filter: Callable[[Image], bool]):
+    def __init__(self, image_filter: Callable[[Image], bool], workers: int = 1):
         self.image_filter = image_filter
+        self.workers = workers
+        self.errors: List[Tuple[Image, Exception]] = []
 
     @classmethod
-    def dicom_filter(cls, tag_criteria: Dict[str, List[str]]) -> FilterImages:
+    def dicom_filter(
+        cls, tag_criteria: Dict[str, List[str]], workers: int = 1
+    ) -> FilterImages:
         """
         Returns a new :class:`FilterImages` instance whose filter function uses the
         tag/attribute name of a Data Element to filter images by the value of a
@@ -27,6 +60,7 @@ class FilterImages:
 
         :param tag_criteria: Dictionary whose keys are the data element tags
             and values are a list of data element values
+        :param workers: Number of threads used to load the dicoms
         """
 
         def the_filter(image: Image) -> bool:
@@ -42,9 +76,9 @@ class FilterImages:
 
             return True
 
-        return cls(the_filter)
+        return cls(the_filter, workers)
 
-    def _from_client_iter(self, client: Client) -> Iterator[Episode]:
+    def _from_client_iter(self, client: Client) -> Iterator[Series]:
         """
         Iterate over episodes within `client`
         """
@@ -52,7 +86,7 @@ class FilterImages:
             for _ in self._from_episode_iter(episode):
                 yield (_)
 
-    def _from_episode_iter(self, episode: Episode) -> Iterator[Study]:
+    def _from_episode_iter(self, episode: Episode) -> Iterator[Series]:
         """
         Iterate over studies within `episode`
         """
@@ -68,6 +102,58 @@ class FilterImages:
         for series in study.series:
             yield (series)
 
+    def _series_iter(
+        self, obj: Union[Client, Episode, Study, Series]
+    ) -> Iterator[Series]:
+        """
+        Iterate over series within `obj`
+        """
+        if isinstance(obj, Series):
+            yield obj
+        elif isinstance(obj, Client):
+            yield from self._from_client_iter(obj)
+        elif isinstance(obj, Episode):
+            yield from self._from_episode_iter(obj)
+        elif isinstance(obj, Study):
+            yield from self._from_study_iter(obj)
+
+    def _accepts(self, image: Image) -> Tuple[Image, bool]:
+        try:
+            return image, self.image_filter(image)
+        except Exception as e:
+            logger.exception(f"Failed to filter image {image.id}, excluding it")
+            self.errors.append((image, e))
+            return image, False
+
+    def _evaluate(self, images: Iterable[Image]) -> Iterator[Tuple[Image, bool]]:
+        """
+        Lazily evaluate the filter for each of `images`, in order
+        """
+        if self.workers <= 1:
+            yield from map(self._accepts, images)
+        else:
+            with concurrent.futures.ThreadPoolExecutor(self.workers) as executor:
+                yield from ordered_map(
+                    executor, self._accepts, images, 4 * self.workers
+                )
+
+    def images(self, obj: Union[Client, Episode, Study, Series]) -> Iterator[Image]:
+        """
+        Lazily yields the :class:`omidb.image.Image` s found in ``obj`` that pass
+        the filter, without modifying ``obj``.
+
+        :param obj: Filter the images nested within one of the core OMI-DB objects
+        """
+
+        def all_images() -> Iterator[Image]:
+            for series in self._series_iter(obj):
+                yield from series.images
+
+        self.errors = []
+        for image, accepted in self._evaluate(all_images()):
+            if accepted:
+                yield image
+
     def __call__(self, obj: Union[Client, Episode, Study, Series]) -> None:
         """
         Inplace filtering of the :class:`omidb.image.Image` s found in ``obj``.
@@ -75,17 +161,134 @@ class FilterImages:
         :param obj: Filter the images nested within one of the core OMI-DB objects
         """
 
-        if isinstance(obj, Series):
-            obj.images = [_ for _ in filter(self.image_filter, obj.images)]
+        self.errors = []
+        series_list = list(self._series_iter(obj))
+        images = [image for series in series_list for image in series.images]
+        accepted = {id(image) for image, ok in self._evaluate(images) if ok}
 
-        elif isinstance(obj, Client):
-            for _ in self._from_client_iter(obj):
-                self(_)
+        for series in series_list:
+            series.images = [image for image in series.images if id(image) in accepted]
 
-        elif isinstance(obj, Episode):
-            for _ in self._from_episode_iter(obj):
-                self(_)
 
-        elif isinstance(obj, Study):
-            for _ in self._from_study_iter(obj):
-                self(_)
+@dataclass(frozen=True)
+class Query:
+    """
+    A composable, non-mutating query over images, yielding a
+    ``(client, episode, study, series, image)`` tuple per matching image.
+
+    Queries are built by chaining methods, each of which returns a new query::
+
+        query = (
+            Query()
+            .episode_type(omidb.episode.Type.F)
+            .study_date(start=datetime.date(2012, 1, 1))
+            .marked()
+            .where(FilterImages.dicom_filter({"ViewPosition": ["CC"]}))
+        )
+
+        for client, episode, study, series, image in db.select(query):
+            ...
+
+    Apart from :meth:`where`, predicates use only the NBSS and IMAGEDB data, so
+    :meth:`omidb.parser.DB.select` evaluates them while parsing each client
+    (*pushdown*), such that non-matching studies and images are never built,
+    and :meth:`where` predicates, which typically read headers, are only
+    evaluated for images matching all other predicates. Queries may also be
+    applied to clients that are already parsed, see :meth:`__call__`.
+    """
+
+    episode_types: Optional[FrozenSet[Type]] = None
+    event_types: Optional[FrozenSet[Event]] = None
+    start_date: Optional[datetime.date] = None
+    end_date: Optional[datetime.date] = None
+    has_marks: Optional[bool] = None
+    image_filters: Tuple[Union[Callable[[Image], bool], FilterImages], ...] = ()
+
+    def episode_type(self, *types: Type) -> Query:
+        """Only images of episodes of any of ``types``"""
+        return replace(self, episode_types=frozenset(types))
+
+    def event_type(self, *events: Event) -> Query:
+        """Only images of studies linked to any of ``events``"""
+        return replace(self, event_types=frozenset(events))
+
+    def study_date(
+        self,
+        start: Optional[datetime.date] = None,
+        end: Optional[datetime.date] = None,
+    ) -> Query:
+        """Only images of studies dated from ``start`` to ``end`` (inclusive)"""
+        return replace(self, start_date=start, end_date=end)
+
+    def marked(self, has_marks: bool = True) -> Query:
+        """Only images with (or, if ``has_marks`` is ``False``, without) marks"""
+        return replace(self, has_marks=has_marks)
+
+    def where(
+        self, image_filter: Union[Callable[[Image], bool], FilterImages]
+    ) -> Query:
+        """
+        Only images passing ``image_filter``, in addition to any previous
+        filters. A :class:`FilterImages` is evaluated for the images of each
+        client at once, on its ``workers`` threads, and images for which it
+        raises are excluded and recorded in its ``errors`` (from the start of
+        each call of the query, or of :meth:`omidb.parser.DB.select`). Other
+        exceptions are raised.
+        """
+
+        return replace(self, image_filters=self.image_filters + (image_filter,))
+
+    def accepts_episode_type(self, episode_type: Optional[Type]) -> bool:
+        return self.episode_types is None or episode_type in self.episode_types
+
+    def accepts_study(
+        self, date: Optional[datetime.date], event_types: Sequence[Event]
+    ) -> bool:
+        if self.start_date is not None or self.end_date is not None:
+            if date is None:
+                return False
+            if self.start_date is not None and date < self.start_date:
+                return False
+            if self.end_date is not None and date > self.end_date:
+                return False
+
+        if self.event_types is not None:
+            return not self.event_types.isdisjoint(event_types)
+        return True
+
+    def accepts_marks(self, marks: List[Mark]) -> bool:
+        return self.has_marks is None or bool(marks) == self.has_marks
+
+    def __call__(self, clients: Union[Client, Iterable[Client]]) -> Iterator[Match]:
+        """
+        Lazily yields the images of ``clients`` matching the query, without
+        modifying them.
+
+        :param clients: A client, or clients
+        """
+
+        if isinstance(clients, Client):
+            clients = [clients]
+
+        for image_filter in self.image_filters:
+            if isinstance(image_filter, FilterImages):
+                image_filter.errors = []
+
+        for client in clients:
+            matches = [
+                (client, episode, study, series, image)
+                for episode in client.episodes
+                if self.accepts_episode_type(episode.type)
+                for study in episode.studies
+                if self.accepts_study(study.date, study.event_type)
+                for series in study.series
+                for image in series.images
+                if self.accepts_marks(image.marks)
+            ]
+            for image_filter in self.image_filters:
+                if isinstance(image_filter, FilterImages):
+                    results = image_filter._evaluate(m[-1] for m in matches)
+                    matches = [m for m, (_, ok) in zip(matches, results) if ok]
+                else:
+                    matches = [m for m in matches if image_filter(m[-1])]
+            yield from matches
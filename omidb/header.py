@@ -0,0 +1,485 @@
+import collections
+import contextlib
+import json
+import mmap
+import os
+import pathlib
+import struct
+import tempfile
+import threading
+import zlib
+from dataclasses import dataclass
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+from loguru import logger
+from .image import Image
+from . import utilities
+
+TagPath = Union[str, Sequence[str]]
+
+# Node of the tag trie: indices of the paths ending at this node, and children
+_Node = Dict[str, Tuple[List[int], Dict[str, Any]]]
+
+
+def _split(path: TagPath) -> Tuple[str, ...]:
+    if isinstance(path, str):
+        return tuple(path.split("/"))
+    return tuple(path)
+
+
+class HeaderProjection:
+    """
+    Extracts a fixed set of data elements from the JSON representation of
+    DICOM headers (see :attr:`omidb.image.Image.attributes`) in a single
+    traversal of each header.
+
+    Each data element is addressed by its tag, e.g. ``"00080070"``, or by a path
+    of tags into nested sequences, e.g. ``"00540220/00080100"`` or
+    ``["00540220", "00080100"]``, where the first item of each sequence is
+    used. Paths sharing a prefix share the traversal of that prefix.
+
+    Example::
+
+        projection = HeaderProjection({
+            "Manufacturer": "00080070",
+            "ViewModCodeValue": "00540220/00080100",
+        })
+        manufacturer, view_mod_code_value = projection(image)
+        columns = projection.batch(images)
+
+    :param paths: The tag paths to extract, optionally as a mapping from column
+        name to path. Column names otherwise default to the ``/``-separated path.
+    """
+
+    def __init__(self, paths: Union[Sequence[TagPath], Mapping[str, TagPath]]):
+        if isinstance(paths, Mapping):
+            self.names = list(paths.keys())
+            self.paths = [_split(p) for p in paths.values()]
+        else:
+            self.paths = [_split(p) for p in paths]
+            self.names = ["/".join(p) for p in self.paths]
+
+        self._root: _Node = {}
+        for idx, path in enumerate(self.paths):
+            node = self._root
+            for depth, tag in enumerate(path):
+                ends, children = node.setdefault(tag, ([], {}))
+                if depth == len(path) - 1:
+                    ends.append(idx)
+                node = children
+
+    def __call__(
+        self, attributes: Union[Image, Dict[str, Any], None]
+    ) -> List[Optional[Any]]:
+        """
+        Returns the value of each tag path (``None`` if absent), in the order of
+        :attr:`names`.
+
+        :param attributes: An image, or the JSON representation of its header
+        """
+
+        result: List[Optional[Any]] = [None] * len(self.paths)
+
+        if isinstance(attributes, Image):
+            try:
+                attributes = attributes.attributes
+            except json.decoder.JSONDecodeError:
+                attributes = None
+
+        if attributes:
+            self._project(attributes, self._root, result)
+        return result
+
+    def _project(
+        self, attributes: Dict[str, Any], node: _Node, result: List[Optional[Any]]
+    ) -> None:
+        for tag, (ends, children) in node.items():
+            element = attributes.get(tag)
+            if element is None:
+                continue
+            try:
+                value = element["Value"][0]
+            except (KeyError, IndexError, TypeError):
+                continue
+            for idx in ends:
+                result[idx] = value
+            if children and isinstance(value, dict):
+                self._project(value, children, result)
+
+    def batch(
+        self, images: Iterable[Union[Image, Dict[str, Any], None]]
+    ) -> Dict[str, List[Optional[Any]]]:
+        """
+        Projects a batch of headers, returning one list (column) per tag path,
+        keyed by :attr:`names`.
+
+        :param images: Images, or the JSON representations of their headers
+        """
+
+        columns: List[List[Optional[Any]]] = [[] for _ in self.paths]
+        for attributes in images:
+            for column, value in zip(columns, self(attributes)):
+                column.append(value)
+        return dict(zip(self.names, columns))
+
+
+# Tag paths of the attributes summarised per image (see ``omidb summarise``)
+DICOM_ATTRIBUTE_TAGS = {
+    "Manufacturer": "00080070",
+    "Model": "00081090",
+    "PresentationIntentType": "00080068",
+    "ImageLaterality": "00200062",
+    "ViewPosition": "00185101",
+    "ViewModCodeValue": "00540220/00080100",
+    "ViewModCodeMeaning": "00540220/00080104",
+    "BodyPartThicknessMM": "001811A0",
+    "PatientAgeYears": "00101010",
+    "TransferSyntaxUID": "00020010",
+}
+
+DICOM_ATTRIBUTE_PROJECTION = HeaderProjection(DICOM_ATTRIBUTE_TAGS)
+
+
+def dicom_attributes(image: Union[Image, Dict[str, Any], None]) -> Dict[str, Any]:
+    """
+    Extracts the attributes of :data:`DICOM_ATTRIBUTE_TAGS` from the header of
+    ``image``, with the patient's age converted to years.
+
+    :param image: An image, or the JSON representation of its header
+    """
+
+    values = dict(
+        zip(DICOM_ATTRIBUTE_PROJECTION.names, DICOM_ATTRIBUTE_PROJECTION(image))
+    )
+    values["PatientAgeYears"] = utilities.age_to_years(values["PatientAgeYears"])
+    return values
+
+
+class HeaderStore:
+    """
+    Read access to a consolidated header file, holding the JSON headers of all
+    images of a client in one file, as written by :meth:`HeaderStore.write`
+    (see also the ``omidb pack-headers`` command).
+
+    The file comprises a fixed-size preamble, the zlib-compressed JSON header of
+    each image, and an offset table mapping ``study_id/image_id`` to the
+    location of each header, along with the modification times of the study
+    directories when the file was written (see :meth:`is_stale`). The file is
+    memory-mapped, so reading a header requires no additional system calls to
+    open files.
+
+    :param path: Path to the consolidated header file
+    """
+
+    MAGIC = b"OMIDBHDR"
+    VERSION = 2
+    # magic, version, offset and length of the offset table
+    _PREAMBLE = struct.Struct("<8sIQQ")
+
+    def __init__(self, path: Union[str, pathlib.Path]):
+        self.path = pathlib.Path(path)
+        with open(self.path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, offset, length = self._PREAMBLE.unpack_from(self._mm, 0)
+        if magic != self.MAGIC or version not in (1, self.VERSION):
+            raise ValueError(f"{self.path} is not a consolidated header file")
+
+        table = json.loads(zlib.decompress(self._mm[offset : offset + length]))
+        self._index: Dict[str, List[int]] = table
+        #: Modification time (ns) of each study directory when the file was
+        #: written, by study ID (``None`` for files of version 1)
+        self.studies: Optional[Dict[str, int]] = None
+        if version > 1:
+            self._index, self.studies = table["headers"], table["studies"]
+
+    @staticmethod
+    def key(study_id: str, image_id: str) -> str:
+        return f"{study_id}/{image_id}"
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    def keys(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def get(self, study_id: str, image_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the JSON header of an image, or ``None`` if not in the store.
+
+        :param study_id: Study Instance UID
+        :param image_id: SOP Instance UID
+        """
+
+        location = self._index.get(self.key(study_id, image_id))
+        if location is None:
+            return None
+        offset, length = location
+        header: Dict[str, Any] = json.loads(
+            zlib.decompress(self._mm[offset : offset + length])
+        )
+        return header
+
+    def is_stale(self, full: bool = False) -> bool:
+        """
+        ``True`` if the JSON headers of the client changed after the file was
+        written. By default, the modification times of the client's study
+        directories are compared with those recorded in the file (one
+        ``stat`` per study), which detects JSON headers which were added,
+        removed or replaced (e.g. renamed over), but not modified in place.
+        With ``full`` (or for files of version 1), the modification time of
+        every JSON header is compared with that of the file, see
+        :func:`is_stale`.
+
+        :param full: Compare the modification time of every JSON header
+        """
+
+        client_dir = self.path.parent
+        if full or self.studies is None:
+            return is_stale(client_dir)
+        for study_id, mtime in self.studies.items():
+            try:
+                if (client_dir / study_id).stat().st_mtime_ns != mtime:
+                    return True
+            except FileNotFoundError:
+                return True
+        return False
+
+    def close(self) -> None:
+        self._mm.close()
+
+    def __enter__(self) -> "HeaderStore":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    @classmethod
+    def write(
+        cls,
+        path: Union[str, pathlib.Path],
+        headers: Iterable[Tuple[str, str, bytes]],
+        studies: Optional[Mapping[str, int]] = None,
+    ) -> int:
+        """
+        Writes a consolidated header file, atomically replacing ``path``.
+        Returns the number of headers written.
+
+        :param path: Path of the consolidated header file
+        :param headers: Tuples of study ID, image ID and the raw (JSON) header
+        :param studies: The modification time (ns) of each study directory,
+            by study ID, taken before its JSON headers were read
+        """
+
+        path = pathlib.Path(path)
+        index: Dict[str, List[int]] = {}
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(b"\0" * cls._PREAMBLE.size)
+                for study_id, image_id, raw in headers:
+                    # Re-encode compactly, which also validates the JSON
+                    data = zlib.compress(
+                        json.dumps(json.loads(raw), separators=(",", ":")).encode()
+                    )
+                    index[cls.key(study_id, image_id)] = [f.tell(), len(data)]
+                    f.write(data)
+
+                offset = f.tell()
+                table = zlib.compress(
+                    json.dumps({"headers": index, "studies": studies or {}}).encode()
+                )
+                f.write(table)
+                f.seek(0)
+                f.write(cls._PREAMBLE.pack(cls.MAGIC, cls.VERSION, offset, len(table)))
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return len(index)
+
+
+@dataclass
+class _OpenStore:
+    store: Optional[HeaderStore]
+    #: Number of threads reading the store
+    readers: int = 0
+    #: ``True`` once evicted, so closed when the last reader is done
+    evicted: bool = False
+
+
+class HeaderStores:
+    """
+    The consolidated header files (see :class:`HeaderStore`) of the clients in
+    ``data_dir``, opened on demand (unless stale, see
+    :meth:`HeaderStore.is_stale`) and
+    kept open for the ``max_open`` most recently read clients.
+
+    Safe for use by several threads: each store is opened once, and a store
+    evicted while it is read is only closed once its readers are done.
+
+    :param data_dir: The data directory of the DB
+    :param max_open: The maximum number of clients whose stores are kept open
+    :param full_check: Check every JSON header for changes, see
+        :meth:`HeaderStore.is_stale`
+    """
+
+    def __init__(
+        self,
+        data_dir: Union[str, pathlib.Path],
+        max_open: int = 8,
+        full_check: bool = False,
+    ):
+        self.data_dir = pathlib.Path(data_dir)
+        self.max_open = max_open
+        self.full_check = full_check
+        self._stores: "collections.OrderedDict[str, _OpenStore]" = (
+            collections.OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Open stores are not pickled, but reopened on demand
+        return {
+            "data_dir": self.data_dir,
+            "max_open": self.max_open,
+            "full_check": self.full_check,
+        }
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(**state)  # type: ignore
+
+    def __len__(self) -> int:
+        return len(self._stores)
+
+    @contextlib.contextmanager
+    def reading(self, client_id: str) -> Iterator[Optional[HeaderStore]]:
+        """
+        The store of the client with ID ``client_id``, which stays open while
+        the context is active, or ``None`` if it has no (up to date) store
+        """
+
+        with self._lock:
+            entry = self._stores.get(client_id)
+            if entry is None:
+                entry = _OpenStore(self._open(client_id))
+                self._stores[client_id] = entry
+                self._evict()
+            else:
+                self._stores.move_to_end(client_id)
+            entry.readers += 1
+        try:
+            yield entry.store
+        finally:
+            with self._lock:
+                entry.readers -= 1
+                if entry.evicted and not entry.readers:
+                    self._close(entry)
+
+    def _open(self, client_id: str) -> Optional[HeaderStore]:
+        path = header_store_path(self.data_dir / client_id)
+        if not path.exists():
+            return None
+        store = HeaderStore(path)
+        if store.is_stale(self.full_check):
+            store.close()
+            logger.warning(
+                f"{path} is older than the JSON headers of {client_id}, "
+                "reading the JSON headers instead (re-run pack-headers)"
+            )
+            return None
+        return store
+
+    def _evict(self) -> None:
+        while len(self._stores) > self.max_open:
+            _, entry = self._stores.popitem(last=False)
+            entry.evicted = True
+            if not entry.readers:
+                self._close(entry)
+
+    @staticmethod
+    def _close(entry: _OpenStore) -> None:
+        if entry.store is not None:
+            entry.store.close()
+
+    def close(self) -> None:
+        """Closes the stores, once their readers are done"""
+
+        with self._lock:
+            while self._stores:
+                _, entry = self._stores.popitem()
+                entry.evicted = True
+                if not entry.readers:
+                    self._close(entry)
+
+
+def header_store_path(client_dir: pathlib.Path) -> pathlib.Path:
+    """Path of the consolidated header file of the client at ``client_dir``"""
+    return client_dir / f"headers_{client_dir.name}.pack"
+
+
+def sidecars(client_dir: pathlib.Path) -> Iterator[Tuple[str, str, pathlib.Path]]:
+    """
+    Iterates over the JSON headers (sidecars) of the client at ``client_dir``,
+    yielding the study ID, image ID and path of each.
+    """
+
+    for study_dir in sorted(client_dir.iterdir()):
+        if not study_dir.is_dir():
+            continue
+        for json_path in sorted(study_dir.glob("*.json")):
+            image_id = json_path.name[: -len(".json")]
+            if image_id.endswith(".dcm"):
+                image_id = image_id[: -len(".dcm")]
+            yield study_dir.name, image_id, json_path
+
+
+def is_stale(client_dir: pathlib.Path) -> bool:
+    """
+    ``True`` if any JSON header (sidecar) of the client at ``client_dir`` was
+    modified after its consolidated header file was written. This lists the
+    client's directories and stats every JSON header, see
+    :meth:`HeaderStore.is_stale` for a cheaper check.
+
+    :param client_dir: The client's data directory, e.g. ``data/optm1``
+    """
+
+    packed = header_store_path(client_dir).stat().st_mtime_ns
+    return any(
+        json_path.stat().st_mtime_ns > packed
+        for _, _, json_path in sidecars(client_dir)
+    )
+
+
+def pack_client(client_dir: pathlib.Path) -> int:
+    """
+    Consolidates the JSON headers of the client at ``client_dir`` into one file,
+    see :class:`HeaderStore`. Returns the number of headers written.
+
+    :param client_dir: The client's data directory, e.g. ``data/optm1``
+    """
+
+    # Taken first, so that headers changed while packing make the file stale
+    studies = {
+        study_dir.name: study_dir.stat().st_mtime_ns
+        for study_dir in client_dir.iterdir()
+        if study_dir.is_dir()
+    }
+    headers = (
+        (study_id, image_id, json_path.read_bytes())
+        for study_id, image_id, json_path in sidecars(client_dir)
+    )
+    return HeaderStore.write(header_store_path(client_dir), headers, studies)
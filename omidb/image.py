@@ -1,9 +1,18 @@
+import pathlib
 import pydicom
 import matplotlib
 import matplotlib.pyplot as plt
+import numpy.typing as npt
 from dataclasses import dataclass, field
 from typing import List, Optional, Dict, Any, Callable
 from .mark import Mark
+from .pixels import (
+    PixelCache,
+    PixelDataLocation,
+    locate_pixel_data,
+    memmap_pixel_data,
+)
+from . import thumbnails
 
 
 @dataclass
@@ -16,6 +25,7 @@ class LoaderParams:
 
 DicomLoaderFunc = Callable[[LoaderParams], pydicom.dataset.FileDataset]
 JsonLoaderFunc = Callable[[LoaderParams], Dict[str, Any]]
+PathLoaderFunc = Callable[[LoaderParams], pathlib.Path]
 
 
 @dataclass
@@ -30,6 +40,12 @@ class JsonLoader:
     func: JsonLoaderFunc
 
 
+@dataclass
+class PathLoader:
+    args: LoaderParams
+    func: PathLoaderFunc
+
+
 @dataclass
 class Image:
     """
@@ -37,10 +53,12 @@ class Image:
     zero or more marks for one or many lesions.
 
     :param id: SOP Instance UID, a unique identifier
-    :param dcm_path: Path to the dicom image
-    :param json_path: Path to the JSON file storing DICOM metadata
+    :param dcm_loader: Loads the dicom image
+    :param json_loader: Loads the JSON file storing DICOM metadata
     :param marks: A list of marks or annotations, represented by
         :class:`omidb.mark.Mark`
+    :param dcm_path_loader: Resolves the path of the dicom image, enabling
+        direct access to the pixel data on disk
 
     .. _DICOM: https://www.dicomstandard.org/
     """
@@ -49,8 +67,10 @@ class Image:
     dcm_loader: Optional[DicomLoader] = None
     json_loader: Optional[JsonLoader] = None
     marks: List[Mark] = field(default_factory=list)
+    dcm_path_loader: Optional[PathLoader] = None
     _dcm: Optional[pydicom.FileDataset] = None
     _json: Optional[Dict[str, Any]] = None
+    _pixel_location: Optional[PixelDataLocation] = None
 
     @property
     def dcm(self) -> Optional[pydicom.FileDataset]:
@@ -61,6 +81,61 @@ class Image:
             self._dcm = self.dcm_loader.func(self.dcm_loader.args)
         return self._dcm
 
+    @property
+    def dcm_path(self) -> Optional[pathlib.Path]:
+        """
+        Path to the dicom image, if known
+        """
+        if self.dcm_path_loader is None:
+            return None
+        return self.dcm_path_loader.func(self.dcm_path_loader.args)
+
+    def pixels_mmap(self) -> Optional[npt.NDArray[Any]]:
+        """
+        Returns the pixel data as a read-only :class:`numpy.memmap`, such that only
+        the pages of the file that are indexed are read from disk (unless fewer
+        bits are stored than allocated, see
+        :func:`omidb.pixels.memmap_pixel_data`).
+
+        Only uncompressed transfer syntaxes can be memory-mapped; for all other
+        images (or if the path of the dicom is unknown) the pixel data are
+        decoded in full via :attr:`dcm` and returned as a read-only array.
+        """
+
+        path = self.dcm_path
+        if path is not None:
+            if self._pixel_location is None:
+                self._pixel_location = locate_pixel_data(path)
+            if self._pixel_location.is_mappable:
+                return memmap_pixel_data(path, self._pixel_location)
+
+        if self.dcm is None:
+            return None
+
+        arr: npt.NDArray[Any] = self.dcm.pixel_array
+        arr.setflags(write=False)
+        return arr
+
+    def pixels(self, cache: Optional[PixelCache] = None) -> Optional[npt.NDArray[Any]]:
+        """
+        Returns the (read-only) pixel data. Uncompressed pixel data are
+        memory-mapped, as per :meth:`pixels_mmap`. Compressed pixel data are
+        decoded, or served from ``cache`` if given.
+
+        :param cache: On-disk cache of decoded pixel data
+        """
+
+        path = self.dcm_path
+        if cache is None or path is None:
+            return self.pixels_mmap()
+
+        if self._pixel_location is None:
+            self._pixel_location = locate_pixel_data(path)
+        if self._pixel_location.is_mappable:
+            return memmap_pixel_data(path, self._pixel_location)
+
+        return cache.get(path)
+
     @property
     def attributes(self) -> Optional[Dict[str, Any]]:
         """
@@ -72,16 +147,33 @@ class Image:
         return self._json
 
     def plot(
-        self, ax: Optional[matplotlib.axes.Axes] = None
+        self,
+        ax: Optional[matplotlib.axes.Axes] = None,
+        level: Optional[int] = None,
+        cache: Optional[thumbnails.ThumbnailCache] = None,
     ) -> Optional[matplotlib.image.AxesImage]:
         """
         Plot the dicom
+
+        :param ax: Axes to plot on, a new figure is created if ``None``
+        :param level: If not ``None``, plot the thumbnail at this level of the
+            thumbnail pyramid rather than the full resolution image
+        :param cache: Thumbnail cache, defaults to
+            :class:`omidb.thumbnails.ThumbnailCache` with its default directory
         """
 
-        if self.dcm is None:
+        arr: Optional[npt.NDArray[Any]]
+        if level is None:
+            arr = None if self.dcm is None else self.dcm.pixel_array
+        else:
+            if cache is None:
+                cache = thumbnails.ThumbnailCache()
+            arr = cache.get(self, level)
+
+        if arr is None:
             return None
 
         if not ax:
             fig, ax = plt.subplots()
 
-        return ax.imshow(self.dcm.pixel_array, cmap=plt.cm.bone)
+        return ax.imshow(arr, cmap=plt.cm.bone)
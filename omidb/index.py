@@ -0,0 +1,164 @@
+import json
+import numbers
+import os
+import pathlib
+import tempfile
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+from .image import Image, LoaderParams
+from .header import DICOM_ATTRIBUTE_TAGS, dicom_attributes
+
+# Attributes indexed by default, see :data:`omidb.header.DICOM_ATTRIBUTE_TAGS`
+INDEXED_ATTRIBUTES = tuple(DICOM_ATTRIBUTE_TAGS)
+
+
+def _key(value: Any) -> str:
+    # JSON object keys are strings, so values are indexed by their string form,
+    # with numbers normalised such that e.g. 45, 45.0 and DS "45" all match
+    if isinstance(value, str):
+        return value
+    if isinstance(value, numbers.Real) and not isinstance(value, bool):
+        number = float(value)
+        return str(int(number)) if number.is_integer() else repr(number)
+    return str(value)
+
+
+class AttributeIndex:
+    """
+    Inverted index mapping the values of DICOM attributes (see
+    :data:`omidb.header.DICOM_ATTRIBUTE_TAGS`) to the images having them,
+    such that images can be selected by attribute without loading any headers.
+
+    The index is built once, e.g. by the ``omidb build-index`` command, and
+    stored as a JSON file (by default ``attribute_index.json`` within the data
+    directory). It is not updated automatically, so should be rebuilt when the
+    data changes. Most users will query it through
+    :meth:`omidb.parser.DB.images_where`.
+
+    :param images: The indexed images
+    :param postings: For each attribute, the indices into ``images`` of the
+        images having each value
+    """
+
+    VERSION = 1
+
+    def __init__(
+        self,
+        images: Sequence[LoaderParams],
+        postings: Dict[str, Dict[str, List[int]]],
+    ):
+        self.images = list(images)
+        self.postings = postings
+
+    @property
+    def attributes(self) -> List[str]:
+        return list(self.postings)
+
+    def values(self, attribute: str) -> List[str]:
+        """Distinct values of ``attribute`` among the indexed images"""
+        return sorted(self.postings[attribute])
+
+    @classmethod
+    def build(
+        cls,
+        entries: Iterable[Tuple[LoaderParams, Dict[str, Any]]],
+        attributes: Sequence[str] = INDEXED_ATTRIBUTES,
+    ) -> "AttributeIndex":
+        """
+        Builds an index from the attribute values of each image.
+
+        :param entries: Tuples of the image's loader parameters and its
+            attributes (see :func:`omidb.header.dicom_attributes`)
+        :param attributes: The attributes to index
+        """
+
+        images: List[LoaderParams] = []
+        postings: Dict[str, Dict[str, List[int]]] = {a: {} for a in attributes}
+        for params, values in entries:
+            idx = len(images)
+            images.append(params)
+            for attribute, posting in postings.items():
+                value = values.get(attribute)
+                if value is not None:
+                    posting.setdefault(_key(value), []).append(idx)
+        return cls(images, postings)
+
+    def where(
+        self, **criteria: Union[Any, Sequence[Any]]
+    ) -> List[Tuple[int, LoaderParams]]:
+        """
+        Returns the (index and loader parameters of) images matching all
+        ``criteria``, in the order they were indexed. Each criterion is an
+        attribute and either a value, or a list (or tuple or set) of values of
+        which any may match. Numbers match by value, e.g. ``45.0`` matches an
+        attribute value of ``45``.
+
+        :raises ValueError: If an attribute is not indexed
+        """
+
+        selected: Optional[List[int]] = None
+        for attribute, wanted in criteria.items():
+            if attribute not in self.postings:
+                raise ValueError(
+                    f"{attribute} is not indexed, choose from {self.attributes}"
+                )
+            if not isinstance(wanted, (list, tuple, set, frozenset)):
+                wanted = [wanted]
+
+            posting = self.postings[attribute]
+            matches: Set[int] = set()
+            for value in wanted:
+                matches.update(posting.get(_key(value), ()))
+
+            if selected is None:
+                selected = sorted(matches)
+            else:
+                selected = [idx for idx in selected if idx in matches]
+
+            if not selected:
+                return []
+
+        if selected is None:
+            selected = list(range(len(self.images)))
+        return [(idx, self.images[idx]) for idx in selected]
+
+    @classmethod
+    def load(cls, path: Union[str, pathlib.Path]) -> "AttributeIndex":
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("version") != cls.VERSION:
+            raise ValueError(f"{path} is not a supported attribute index")
+        return cls([LoaderParams(*p) for p in data["images"]], data["postings"])
+
+    def save(self, path: Union[str, pathlib.Path]) -> None:
+        """Writes the index to ``path``, atomically replacing any existing file"""
+
+        path = pathlib.Path(path)
+        data = {
+            "version": self.VERSION,
+            "images": [
+                [p.client_id, p.study_id, p.series_id, p.image_id] for p in self.images
+            ],
+            "postings": self.postings,
+        }
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+def index_entry(image: Image) -> Tuple[LoaderParams, Dict[str, Any]]:
+    """
+    The entry of ``image`` in an :class:`AttributeIndex`: the parameters of its
+    loaders and its attributes.
+
+    :raises ValueError: If the image has no loaders
+    """
+
+    loader = image.json_loader or image.dcm_loader
+    if loader is None:
+        raise ValueError(f"Image {image.id} has no loaders, so cannot be indexed")
+    return loader.args, dicom_attributes(image)
@@ -3,6 +3,7 @@ import itertools
 from typing import List, Optional, Union
 from dataclasses import dataclass, field
 from .events import Opinion
+from .utilities import Memoised, memoised_property
 import enum
 
 
@@ -141,7 +142,7 @@ class LesionClinical:
 
 
 @dataclass
-class Lesion:
+class Lesion(Memoised):
     id: str
     side: Optional[Side] = None
     cyst_aspirated: Optional[bool] = None
@@ -158,7 +159,7 @@ class Lesion:
     biopsy_fine: Optional[LesionBiopsyFine] = None
     interval_cancer: Optional[LesionIntervalCancer] = None
 
-    @property
+    @memoised_property
     def status(self) -> Optional[Status]:
         if self.is_invasive:
             return Status.Invasive
@@ -167,7 +168,7 @@ class Lesion:
         else:
             return None
 
-    @property
+    @memoised_property
     def is_invasive(self) -> bool:
         if self.biopsy_wide:
             if self.biopsy_wide.malignant_type == MalignancyType.b:
@@ -189,7 +190,7 @@ class Lesion:
 
         return False
 
-    @property
+    @memoised_property
     def is_insitu(self) -> bool:
         if self.is_invasive:
             return False
@@ -212,7 +213,7 @@ class Lesion:
 
         return False
 
-    @property
+    @memoised_property
     def grade(self) -> Optional[Union[HistologicalGrade, DCISGrade]]:
         if self.surgery and self.surgery.disease_grade:
             return self.surgery.disease_grade
@@ -0,0 +1,117 @@
+"""
+Manifests of the source files of the clients of an output (e.g. of ``omidb
+summarise --manifest``), used to detect the clients whose files changed since
+the output was written (see ``omidb summarise --incremental``).
+"""
+
+import hashlib
+import json
+import pathlib
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Union
+from .parser import DB
+from .checkpoint import write_atomic
+
+VERSION = 1
+
+# Fingerprint of the source files of a client, see fingerprint
+Fingerprint = Dict[str, str]
+
+
+def manifest_path(output_file: Union[str, pathlib.Path]) -> pathlib.Path:
+    """Path of the manifest of ``output_file``, alongside it"""
+    return pathlib.Path(str(output_file) + ".manifest.json")
+
+
+def _key(db: DB, path: pathlib.Path) -> str:
+    try:
+        return path.relative_to(db._data_dir).as_posix()
+    except ValueError:
+        return path.as_posix()
+
+
+def fingerprint(
+    db: DB, client_id: str, previous: Optional[Fingerprint] = None
+) -> Fingerprint:
+    """
+    The fingerprint of the source files of a client (see
+    :meth:`omidb.parser.DB.source_files`): a digest of their paths, sizes and
+    modification times (``stat``), and of their paths and contents (``hash``).
+
+    The files are only read if their ``stat`` digest differs from that of the
+    ``previous`` fingerprint, if given, so unchanged clients cost a directory
+    listing.
+
+    :param db: The DB
+    :param client_id: The ID of the client
+    :param previous: A previous fingerprint of the client
+    """
+
+    files = [(_key(db, path), path) for path in db.source_files(client_id)]
+
+    stat = hashlib.sha1()
+    for key, path in files:
+        st = path.stat()
+        stat.update(f"{key}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+    stat_digest = stat.hexdigest()
+    if previous is not None and previous.get("stat") == stat_digest:
+        return previous
+
+    content = hashlib.sha256()
+    for key, path in files:
+        data = path.read_bytes()
+        content.update(f"{key}\0{len(data)}\n".encode())
+        content.update(data)
+    return {"stat": stat_digest, "hash": content.hexdigest()}
+
+
+@dataclass
+class SourceManifest:
+    """
+    The parameters an output was written with, and the fingerprint (see
+    :func:`fingerprint`) of the source files of each of its clients, when they
+    were read.
+
+    :param params: Parameters which determine the output (JSON-serialisable)
+    :param clients: The fingerprint of each client, by ID
+    """
+
+    params: Dict[str, Any] = field(default_factory=dict)
+    clients: Dict[str, Fingerprint] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: Union[str, pathlib.Path]) -> "SourceManifest":
+        with open(path) as f:
+            manifest = json.load(f)
+        if manifest.get("version") != VERSION:
+            raise ValueError(f"Unsupported manifest version in {path}")
+        return cls(manifest["params"], manifest["clients"])
+
+    def save(self, path: Union[str, pathlib.Path]) -> None:
+        """Writes the manifest to ``path``, atomically"""
+
+        manifest = {"version": VERSION, "params": self.params, "clients": self.clients}
+        write_atomic(
+            pathlib.Path(path),
+            lambda f: f.write(json.dumps(manifest, sort_keys=True).encode()),
+        )
+
+    def update(self, db: DB, client_ids: List[str]) -> List[str]:
+        """
+        Fingerprints the clients of ``client_ids``, and drops the other clients
+        of the manifest. Returns the clients which are new, or whose files
+        changed (in content), since their previous fingerprint.
+
+        :param db: The DB
+        :param client_ids: The IDs of the clients of the DB
+        """
+
+        changed: List[str] = []
+        clients: Dict[str, Fingerprint] = {}
+        for client_id in client_ids:
+            previous = self.clients.get(client_id)
+            clients[client_id] = fingerprint(db, client_id, previous)
+            if previous is None or previous["hash"] != clients[client_id]["hash"]:
+                changed.append(client_id)
+        self.clients = clients
+        return changed
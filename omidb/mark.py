@@ -1,6 +1,12 @@
+from __future__ import annotations
 from dataclasses import dataclass, field
-from typing import Optional, Set
+from typing import TYPE_CHECKING, Any, Optional, Set, Tuple
 import enum
+import numpy as np
+import numpy.typing as npt
+
+if TYPE_CHECKING:
+    from .image import Image
 
 
 @enum.unique
@@ -48,6 +54,33 @@ class BoundingBox:
     x2: int
     y2: int
 
+    def slices(
+        self, margin: int = 0, shape: Optional[Tuple[int, ...]] = None
+    ) -> Tuple[slice, slice]:
+        """
+        Returns the (row, column) slices spanning the bounding box, with the
+        x-coordinates indexing columns and the y-coordinates indexing rows.
+        Coordinates are inclusive.
+
+        :param margin: Number of pixels to pad the box by on each side
+        :param shape: If given, the slices are clipped to an image of this
+            shape (rows, columns, ...)
+        """
+
+        row_start = min(self.y1, self.y2) - margin
+        row_stop = max(self.y1, self.y2) + margin + 1
+        col_start = min(self.x1, self.x2) - margin
+        col_stop = max(self.x1, self.x2) + margin + 1
+
+        if shape is not None:
+            row_stop = min(row_stop, shape[0])
+            col_stop = min(col_stop, shape[1])
+
+        return (
+            slice(max(row_start, 0), max(row_stop, 0)),
+            slice(max(col_start, 0), max(col_stop, 0)),
+        )
+
 
 @dataclass
 class Mark:
@@ -111,3 +144,24 @@ class Mark:
     vascular_feature: Optional[bool] = None
     benign_classification: Optional[BenignClassification] = None
     mass_classification: Optional[MassClassification] = None
+
+    def crop(self, image: Image, margin: int = 0) -> Optional[npt.NDArray[Any]]:
+        """
+        Returns the region of ``image`` enclosed by this mark's bounding box,
+        padded by ``margin`` pixels on each side and clipped to the image
+        bounds.
+
+        Pixels are accessed via :meth:`omidb.image.Image.pixels_mmap` so, for
+        uncompressed dicoms, only the rows spanned by the region are read from
+        disk.
+
+        :param image: The image this mark belongs to
+        :param margin: Number of pixels to pad the bounding box by
+        """
+
+        pixels = image.pixels_mmap()
+        if pixels is None:
+            return None
+
+        rows, columns = self.boundingBox.slices(margin, pixels.shape)
+        return np.array(pixels[rows, columns])
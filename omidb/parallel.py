@@ -0,0 +1,73 @@
+import collections
+import concurrent.futures
+from typing import Any, Callable, Deque, Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# The state of the worker process, see worker_pool
+_state: Any = None
+
+
+def ordered_map(
+    executor: concurrent.futures.Executor,
+    func: Callable[[T], R],
+    iterable: Iterable[T],
+    max_pending: int,
+) -> Iterator[R]:
+    """
+    Like :meth:`concurrent.futures.Executor.map`, but consumes ``iterable``
+    lazily such that no more than ``max_pending`` calls are submitted ahead of
+    the consumer. Results are yielded in the order of ``iterable``.
+
+    Exceptions raised by ``func`` are re-raised when the corresponding result is
+    reached. Calls that have not yet started are cancelled if the iterator is
+    closed early.
+
+    :param executor: Executor used to evaluate ``func``
+    :param func: The function to apply to each item
+    :param iterable: Items to apply ``func`` to
+    :param max_pending: Maximum number of submitted, but not yet consumed, calls
+    """
+
+    if max_pending < 1:
+        raise ValueError("max_pending must be at least 1")
+
+    pending: Deque["concurrent.futures.Future[R]"] = collections.deque()
+    try:
+        for item in iterable:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def worker_pool(jobs: int, state: Any) -> concurrent.futures.ProcessPoolExecutor:
+    """
+    A pool of ``jobs`` worker processes, each of which is sent ``state`` (e.g.
+    a :class:`omidb.parser.DB`) once, when it starts, and reads it with
+    :func:`worker_state`. Tasks then only carry their own arguments (e.g. a
+    client ID), so their cost does not grow with the size of ``state``.
+
+    :param jobs: The number of worker processes
+    :param state: The state shared by the tasks of the workers (picklable)
+    """
+
+    return concurrent.futures.ProcessPoolExecutor(
+        jobs, initializer=_set_state, initargs=(state,)
+    )
+
+
+def _set_state(state: Any) -> None:
+    global _state
+    _state = state
+
+
+def worker_state() -> Any:
+    """The state of the worker process, see :func:`worker_pool`"""
+
+    return _state
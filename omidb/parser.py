@@ -1,12 +1,29 @@
+import os
 import re
 import pathlib
 import json
-from typing import List, Dict, Optional, Iterator, Any, Sequence, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Union,
+)
 from loguru import logger
 import pydicom
+from . import image as im
 from .image import LoaderParams
+from .index import AttributeIndex
+from .header import HeaderStores
 from .client import Client
 from .client_parser import ClientParser
+from .filters import Match, Query
+from . import profiling
+from .progress import Progress, ProgressInfo, count
 
 
 class DB:
@@ -24,6 +41,22 @@ class DB:
     :param distinct_event_study_links: Only match events to imaging studies
         when distinct (1 to 1 mapping)
     :param nbss_dir: An alternative data dir where nbss files can be found
+    :param index_path: Path to the attribute index used by :meth:`images_where`,
+        defaults to ``attribute_index.json`` within ``data_dir``
+    :param progress: Called with the progress (see
+        :class:`omidb.progress.ProgressInfo`) of iterating the clients (with
+        ``__iter__`` or :meth:`select`), every ``progress_interval`` seconds.
+        The ETA is estimated from the sizes of the clients' NBSS and IMAGEDB
+        files (see :meth:`source_size`), read when iteration starts.
+    :param progress_interval: Seconds between calls of ``progress``
+    :param check_header_files: Check every JSON header of a client for changes
+        before reading its consolidated header file, rather than only its study
+        directories (see :meth:`omidb.header.HeaderStore.is_stale`)
+
+    If a client's directory contains a consolidated header file (see the
+    ``omidb pack-headers`` command), image attributes are read from it rather
+    than from the individual JSON files, which remain the fallback (and are
+    read instead if the header file is stale).
     """
 
     def __init__(
@@ -35,6 +68,10 @@ class DB:
         exclude_clients: Optional[Sequence[str]] = None,
         distinct_event_study_links: bool = True,
         nbss_dir: Optional[Union[str, pathlib.Path]] = None,
+        index_path: Optional[Union[str, pathlib.Path]] = None,
+        progress: Optional[Callable[[ProgressInfo], None]] = None,
+        progress_interval: float = 1.0,
+        check_header_files: bool = False,
     ):
         self.alternative_nbss_dir = None if nbss_dir is None else pathlib.Path(nbss_dir)
         self.ignore_missing_images = ignore_missing_images
@@ -44,6 +81,14 @@ class DB:
             pathlib.Path() if image_dir is None else pathlib.Path(image_dir)
         )
         self._data_dir = pathlib.Path(data_dir)
+        self.index_path = (
+            self._data_dir / "attribute_index.json"
+            if index_path is None
+            else pathlib.Path(index_path)
+        )
+        self._attribute_index: Optional[AttributeIndex] = None
+        self.progress = progress
+        self.progress_interval = progress_interval
 
         if not self._data_dir.is_dir():
             raise FileNotFoundError(f"Directory {data_dir} not found")
@@ -55,6 +100,10 @@ class DB:
                     clients.append(client_path.name)
 
         self.clients = set(clients)
+        # Consolidated header files of the most recently accessed clients
+        self._header_stores = HeaderStores(
+            self._data_dir, full_check=check_header_files
+        )
 
         if exclude_clients:
             self.clients = set(clients) - set(exclude_clients)
@@ -65,35 +114,194 @@ class DB:
 
         :return: client_it: A :class:`omidb.client.Client` iterator
         """
-        for client in self.clients:
-            _data_dir = self._data_dir / client
-            studies: List[str] = []
-            for study in _data_dir.glob("*/**"):
-                # Extract study ID from path
-                if study.is_dir():
-                    match = re.match(r"\d+.", study.name)
-                    if match:
-                        studies.append(study.name)
+        progress = self._progress()
+        try:
+            for client in self.clients:
+                if progress is not None:
+                    progress.start(client)
+                try:
+                    parsed = self._parse_client(client, self._studies(client))
+                except Exception:
+                    logger.exception(f"Failed to parse {client}, skipping")
+                    if progress is not None:
+                        progress.finish(client)
+                    continue
+
+                yield parsed
+                if progress is not None:
+                    progress.finish(client, *count(parsed))
+        finally:
+            if progress is not None:
+                progress.close()
+
+    def _progress(self) -> Optional[Progress]:
+        """A tracker of the progress of iterating the clients, if reported"""
+
+        if self.progress is None:
+            return None
+        return Progress(
+            self.progress,
+            self.source_sizes(self.clients),
+            self.progress_interval,
+            ticker=True,
+        )
 
+    def source_size(self, client_id: str) -> int:
+        """
+        Size in bytes of the NBSS and IMAGEDB files of the client with ID
+        ``client_id`` (0 if missing), which is proportional to the work of
+        parsing and summarising it. Unlike :meth:`source_files`, the client's
+        directory is not listed, so the sizes of many clients are cheap.
+        """
+
+        size = 0
+        for path in (self._nbss_path(client_id), self._imagedb_path(client_id)):
             try:
-                yield self._parse_client(client, studies)
-            except Exception:
-                logger.exception(f"Failed to parse {client}, skipping")
-                continue
+                size += path.stat().st_size
+            except FileNotFoundError:
+                pass
+        return size
+
+    def source_sizes(self, client_ids: Iterable[str]) -> Dict[str, int]:
+        """:meth:`source_size` of each client of ``client_ids``, by ID"""
+
+        return {client_id: self.source_size(client_id) for client_id in client_ids}
+
+    def source_files(self, client_id: str) -> List[pathlib.Path]:
+        """
+        Paths of the source files of the client with ID ``client_id``: the
+        files in its directory (NBSS, IMAGEDB, image headers), and its NBSS
+        file in the alternative NBSS directory, if any. Excludes DICOM images.
+        """
+
+        files: List[pathlib.Path] = []
+        for root, dirs, names in os.walk(self._data_dir / client_id):
+            dirs.sort()
+            files.extend(pathlib.Path(root) / name for name in sorted(names))
+        if self.alternative_nbss_dir is not None:
+            nbss_path = self._nbss_path(client_id)
+            if nbss_path.exists():
+                files.append(nbss_path)
+        return files
+
+    def _studies(self, client_id: str) -> List[str]:
+        """IDs of the studies in the directory of the client with ID `client_id`"""
+
+        studies: List[str] = []
+        for study in (self._data_dir / client_id).glob("*/**"):
+            # Extract study ID from path
+            if study.is_dir():
+                match = re.match(r"\d+.", study.name)
+                if match:
+                    studies.append(study.name)
+        return studies
+
+    def images_where(self, **criteria: Any) -> List[im.Image]:
+        """
+        Selects images by the values of their DICOM attributes, using the
+        attribute index (see the ``omidb build-index`` command), such that no
+        clients are parsed and no headers are loaded, e.g.::
+
+            db.images_where(ViewPosition="CC", ImageLaterality="L")
+            db.images_where(Manufacturer=["HOLOGIC, Inc.", "GE"])
+
+        The images are returned as stand-alone handles: they have loaders (see
+        :attr:`omidb.image.Image.attributes` and :attr:`omidb.image.Image.dcm`),
+        whose ``args`` identify the client, study and series of each image, but
+        no marks. Only images of the clients of this DB are returned.
+
+        :param criteria: Attributes and the value, or list of values, to match
+            (see :meth:`omidb.index.AttributeIndex.where`)
+        :raises FileNotFoundError: If the attribute index has not been built
+        """
+
+        if self._attribute_index is None:
+            if not self.index_path.exists():
+                raise FileNotFoundError(
+                    f"Attribute index {self.index_path} not found, "
+                    "build it with omidb build-index"
+                )
+            self._attribute_index = AttributeIndex.load(self.index_path)
 
-    def _parse_client(self, client_id: str, studies: List[str]) -> Client:
+        return [
+            self._image(p)
+            for _, p in self._attribute_index.where(**criteria)
+            if p.client_id in self.clients
+        ]
+
+    def _image(self, p: LoaderParams) -> im.Image:
+        """An image, without marks, whose data is loaded by this DB"""
+
+        return im.Image(
+            id=p.image_id,
+            dcm_loader=im.DicomLoader(p, self._dcm_loader),
+            json_loader=im.JsonLoader(p, self._json_loader),
+            dcm_path_loader=im.PathLoader(p, self._dcm_path),
+        )
+
+    def select(self, query: Query) -> Iterator[Match]:
+        """
+        Lazily yields a ``(client, episode, study, series, image)`` tuple per
+        image matching ``query``. Predicates on the NBSS and IMAGEDB data are
+        evaluated while parsing each client, such that non-matching studies and
+        images are never built, see :class:`omidb.filters.Query`.
+
+        The clients yielded are pruned accordingly. They keep all their
+        episodes, with their NBSS data (events, lesions and dates), but each
+        episode only holds the studies matching the episode type, study date
+        and event type predicates which have images matching the marks
+        predicate, and each such study only holds those images (and the series
+        containing them). :meth:`omidb.filters.Query.where` filters are not
+        applied to the clients, only to the tuples yielded.
+
+        :param query: The query
+        """
+
+        progress = self._progress()
+
+        def clients() -> Iterator[Client]:
+            for client_id in self.clients:
+                if progress is not None:
+                    progress.start(client_id)
+                try:
+                    client = self._parse_client(
+                        client_id, self._studies(client_id), query
+                    )
+                except Exception:
+                    logger.exception(f"Failed to parse {client_id}, skipping")
+                    if progress is not None:
+                        progress.finish(client_id)
+                    continue
+
+                yield client
+                # Resumed once the matches of the client have been yielded
+                if progress is not None:
+                    progress.finish(client_id, *count(client))
+
+        try:
+            yield from query(clients())
+        finally:
+            if progress is not None:
+                progress.close()
+
+    def _parse_client(
+        self, client_id: str, studies: List[str], query: Optional[Query] = None
+    ) -> Client:
         imagedb = self._imagedb(client_id)
         nbss = self._nbss(client_id)
 
-        client = ClientParser(
-            client_id,
-            nbss,
-            imagedb,
-            studies,
-            self.distinct_event_study_links,
-            self._json_loader,
-            self._dcm_loader,
-        )()
+        with profiling.stage("link", client_id):
+            client = ClientParser(
+                client_id,
+                nbss,
+                imagedb,
+                studies,
+                self.distinct_event_study_links,
+                self._json_loader,
+                self._dcm_loader,
+                self._dcm_path,
+                query,
+            )()
 
         return client
 
@@ -117,34 +325,66 @@ class DB:
     def _nbss(self, client_id: str) -> Dict[str, Any]:
         """NBSS data corresponding to the client with ID `client_id`"""
 
-        with open(self._nbss_path(client_id)) as f:
-            nbss: Dict[str, Any] = json.load(f)
+        with profiling.stage("json", client_id) as timer:
+            with open(self._nbss_path(client_id)) as f:
+                nbss: Dict[str, Any] = json.load(f)
+                if timer.enabled:
+                    timer.add_bytes(os.fstat(f.fileno()).st_size)
         return nbss
 
-    def _imagedb(self, client_id: str) -> Dict[str, Any]:
-        """IMAGEDB data corresponding to the client with ID `client_id`"""
+    def _imagedb_path(self, client_id: str) -> pathlib.Path:
+        """Path of the IMAGEDB json file corresponding to the client with ID
+        `client_id`
+        """
 
         p1 = self._data_dir / client_id / ("imagedb_" + client_id + ".json")
 
         if not p1.exists():
             p1 = self._data_dir / client_id / ("IMAGEDB_" + client_id + ".json")
 
-        with open(p1) as f:
-            imagedb: Dict[str, Any] = json.load(f)
+        return p1
+
+    def _imagedb(self, client_id: str) -> Dict[str, Any]:
+        """IMAGEDB data corresponding to the client with ID `client_id`"""
+
+        with profiling.stage("json", client_id) as timer:
+            with open(self._imagedb_path(client_id)) as f:
+                imagedb: Dict[str, Any] = json.load(f)
+                if timer.enabled:
+                    timer.add_bytes(os.fstat(f.fileno()).st_size)
 
         return imagedb
 
+    def _dcm_path(self, p: LoaderParams) -> pathlib.Path:
+        return self._image_dir / p.client_id / p.study_id / (p.image_id + ".dcm")
+
     def _dcm_loader(self, p: LoaderParams) -> pydicom.dataset.FileDataset:
-        dcm_path = self._image_dir / p.client_id / p.study_id / (p.image_id + ".dcm")
-        return pydicom.dcmread(str(dcm_path))
+        return pydicom.dcmread(str(self._dcm_path(p)))
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        # Progress is reported by the process iterating the clients
+        state["progress"] = None
+        return state
 
     def _json_loader(self, p: LoaderParams) -> Dict[str, Any]:
-        json_path = self._data_dir / p.client_id / p.study_id / (p.image_id + ".json")
-        # Due to inconsistency in file naming
-        if not json_path.exists():
-            json_path = json_path.with_suffix(".dcm.json")
-
-        result: Dict[str, Any] = {}
-        with open(json_path) as f:
-            result = json.load(f)
-        return result
+        with profiling.stage("headers", p.client_id) as timer:
+            with self._header_stores.reading(p.client_id) as store:
+                if store is not None:
+                    header = store.get(p.study_id, p.image_id)
+                    if header is not None:
+                        return header
+
+            json_path = (
+                self._data_dir / p.client_id / p.study_id / (p.image_id + ".json")
+            )
+            # Due to inconsistency in file naming
+            if not json_path.exists():
+                json_path = json_path.with_suffix(".dcm.json")
+
+            result: Dict[str, Any] = {}
+            with open(json_path) as f:
+                result = json.load(f)
+                if timer.enabled:
+                    timer.add_bytes(os.fstat(f.fileno()).st_size)
+            return result
@@ -0,0 +1,544 @@
+from __future__ import annotations
+import collections
+import concurrent.futures
+import hashlib
+import os
+import pathlib
+import struct
+import tempfile
+import threading
+from dataclasses import dataclass, field
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+import numpy as np
+import numpy.typing as npt
+import pydicom
+from pydicom.uid import (
+    ImplicitVRLittleEndian,
+    ExplicitVRLittleEndian,
+    ExplicitVRBigEndian,
+)
+from .parallel import ordered_map
+
+if TYPE_CHECKING:
+    from .image import Image
+
+# Transfer syntaxes for which the pixel data are stored as raw, native values
+UNCOMPRESSED_TRANSFER_SYNTAXES = (
+    ImplicitVRLittleEndian,
+    ExplicitVRLittleEndian,
+    ExplicitVRBigEndian,
+)
+
+PIXEL_DATA_TAG = (0x7FE0, 0x0010)
+
+# Environment variable used to override the default cache directory
+CACHE_DIR_ENV = "OMIDB_CACHE_DIR"
+
+# Maximum number of digests memoised in memory by a PixelCache
+MAX_MEMOISED_DIGESTS = 4096
+
+# Explicit VRs with a 2 byte reserved field followed by a 4 byte length
+_LONG_VRS = (b"OB", b"OD", b"OF", b"OL", b"OV", b"OW", b"SQ", b"UC", b"UN", b"UR")
+
+
+@dataclass
+class PixelDataLocation:
+    """
+    Location and layout of the (native) pixel data within a dicom file.
+
+    :param transfer_syntax_uid: Transfer syntax of the dataset
+    :param offset: Byte offset of the pixel data value, or ``None`` if the pixel
+        data cannot be memory-mapped, e.g. for compressed transfer syntaxes
+    :param dtype: Data type of the stored pixel values
+    :param shape: Shape of the stored pixel values, as stored on disk
+    :param planar: ``True`` if colour samples are stored by plane (Planar
+        Configuration is 1)
+    :param bits_stored: Bits stored per value (Bits Stored), if fewer than
+        allocated, or ``None``
+    """
+
+    transfer_syntax_uid: Optional[str]
+    offset: Optional[int] = None
+    dtype: Optional[np.dtype] = None  # type: ignore
+    shape: Tuple[int, ...] = ()
+    planar: bool = False
+    bits_stored: Optional[int] = None
+
+    @property
+    def is_mappable(self) -> bool:
+        """``True`` if the pixel data can be memory-mapped"""
+        return self.offset is not None
+
+
+def _pixel_layout(
+    ds: pydicom.Dataset, little_endian: bool
+) -> Optional[Tuple[np.dtype, Tuple[int, ...], bool, Optional[int]]]:  # type: ignore
+    bits_allocated = ds.get("BitsAllocated")
+    if bits_allocated not in (8, 16, 32, 64):
+        return None
+
+    bits_stored: Optional[int] = ds.get("BitsStored") or bits_allocated
+    if bits_stored > bits_allocated:  # type: ignore
+        return None
+    if bits_stored == bits_allocated:
+        bits_stored = None
+
+    if ds.get("PhotometricInterpretation") == "YBR_FULL_422":
+        return None
+
+    kind = "i" if ds.get("PixelRepresentation", 0) == 1 else "u"
+    order = "<" if little_endian else ">"
+    dtype = np.dtype(f"{order}{kind}{bits_allocated // 8}")
+
+    rows, columns = ds.get("Rows"), ds.get("Columns")
+    if not rows or not columns:
+        return None
+
+    num_frames = int(ds.get("NumberOfFrames") or 1)
+    samples = int(ds.get("SamplesPerPixel") or 1)
+    planar = samples > 1 and ds.get("PlanarConfiguration", 0) == 1
+
+    shape: Tuple[int, ...] = (rows, columns)
+    if samples > 1:
+        shape = (samples, rows, columns) if planar else (rows, columns, samples)
+    if num_frames > 1:
+        shape = (num_frames,) + shape
+
+    return dtype, shape, planar, bits_stored
+
+
+def locate_pixel_data(path: Union[str, pathlib.Path]) -> PixelDataLocation:
+    """
+    Parses the header of the dicom at ``path`` (without reading the pixel data)
+    and returns the location of the Pixel Data element value.
+
+    :param path: Path to the dicom file
+    """
+
+    with open(path, "rb") as f:
+        ds = pydicom.dcmread(f, stop_before_pixels=True)
+        transfer_syntax_uid = ds.file_meta.get("TransferSyntaxUID")
+        location = PixelDataLocation(transfer_syntax_uid=transfer_syntax_uid)
+
+        if transfer_syntax_uid not in UNCOMPRESSED_TRANSFER_SYNTAXES:
+            return location
+
+        little_endian = transfer_syntax_uid != ExplicitVRBigEndian
+        implicit_vr = transfer_syntax_uid == ImplicitVRLittleEndian
+        endian = "<" if little_endian else ">"
+
+        # `stop_before_pixels` leaves the file positioned at the Pixel Data tag
+        header = f.read(8)
+        if len(header) < 8 or struct.unpack(endian + "HH", header[:4]) != (
+            PIXEL_DATA_TAG
+        ):
+            return location
+
+        if implicit_vr:
+            (length,) = struct.unpack(endian + "L", header[4:])
+        elif header[4:6] in _LONG_VRS:
+            (length,) = struct.unpack(endian + "L", f.read(4))
+        else:
+            (length,) = struct.unpack(endian + "H", header[6:])
+
+        # Undefined length implies encapsulated (compressed) pixel data
+        if length == 0xFFFFFFFF:
+            return location
+
+        layout = _pixel_layout(ds, little_endian)
+        if layout is None:
+            return location
+
+        dtype, shape, planar, bits_stored = layout
+        if int(np.prod(shape)) * dtype.itemsize > length:
+            return location
+
+        location.offset = f.tell()
+        location.dtype = dtype
+        location.shape = shape
+        location.planar = planar
+        location.bits_stored = bits_stored
+
+    return location
+
+
+def memmap_pixel_data(
+    path: Union[str, pathlib.Path], location: Optional[PixelDataLocation] = None
+) -> npt.NDArray[Any]:
+    """
+    Returns a read-only :class:`numpy.memmap` of the pixel data of the dicom at
+    ``path``, with the same shape, data type and values as
+    :attr:`pydicom.dataset.Dataset.pixel_array`. If fewer bits are stored than
+    allocated, the values are masked (unsigned) or sign-extended (signed) to
+    the stored bits, as by pydicom, and so read into memory.
+
+    :param path: Path to the dicom file
+    :param location: Location of the pixel data, as returned by
+        :func:`locate_pixel_data`. Pass this to avoid re-parsing the header.
+    """
+
+    if location is None:
+        location = locate_pixel_data(path)
+
+    if not location.is_mappable:
+        raise ValueError(
+            f"Pixel data of {path} cannot be memory-mapped "
+            f"(transfer syntax {location.transfer_syntax_uid})"
+        )
+
+    arr: npt.NDArray[Any] = np.memmap(
+        path,
+        dtype=location.dtype,
+        mode="r",
+        offset=location.offset,  # type: ignore
+        shape=location.shape,
+    )
+
+    if location.planar:
+        arr = np.moveaxis(arr, -3, -1)
+
+    if location.bits_stored is not None:
+        arr = _correct_bits(arr, location.bits_stored)
+        arr.setflags(write=False)
+
+    return arr
+
+
+def _correct_bits(arr: npt.NDArray[Any], bits_stored: int) -> npt.NDArray[Any]:
+    """
+    Values of ``arr`` with their unused high bits cleared (unsigned) or set to
+    their sign bit, bit ``bits_stored - 1`` (signed)
+    """
+
+    if arr.dtype.kind == "i":
+        shift = arr.dtype.type(arr.dtype.itemsize * 8 - bits_stored)
+        corrected: npt.NDArray[Any] = (arr << shift) >> shift
+    else:
+        corrected = arr & arr.dtype.type((1 << bits_stored) - 1)
+    return corrected
+
+
+def read_pixels(path: Union[str, pathlib.Path]) -> npt.NDArray[Any]:
+    """
+    Returns the pixel data of the dicom at ``path``, memory-mapped if possible
+    (see :func:`memmap_pixel_data`) and decoded otherwise.
+
+    :param path: Path to the dicom file
+    """
+
+    location = locate_pixel_data(path)
+    if location.is_mappable:
+        return memmap_pixel_data(path, location)
+
+    arr: npt.NDArray[Any] = pydicom.dcmread(str(path)).pixel_array
+    arr.setflags(write=False)
+    return arr
+
+
+def default_cache_dir() -> pathlib.Path:
+    """
+    Root directory of the on-disk caches, given by the ``OMIDB_CACHE_DIR``
+    environment variable or ``~/.cache/omidb`` otherwise.
+    """
+
+    cache_dir = os.environ.get(CACHE_DIR_ENV)
+    if cache_dir:
+        return pathlib.Path(cache_dir)
+    return pathlib.Path.home() / ".cache" / "omidb"
+
+
+def _decode(path: pathlib.Path) -> npt.NDArray[Any]:
+    arr: npt.NDArray[Any] = pydicom.dcmread(str(path)).pixel_array
+    return arr
+
+
+class PixelCache:
+    """
+    Opt-in, content-addressed on-disk cache of decoded pixel data, intended for
+    dicoms with compressed transfer syntaxes (e.g. JPEG 2000 or JPEG-LS), which
+    are expensive to decode.
+
+    Entries are keyed by the SHA-256 digest of the dicom file and stored in the
+    raw NumPy (``.npy``) format, such that cache hits are memory-mapped rather
+    than decoded. Once the cache exceeds ``max_bytes``, the least recently used
+    entries are evicted.
+
+    The digest of each dicom is recorded in the cache directory (``digests``)
+    along with the size and modification time of the file, so a dicom is only
+    hashed again once it is modified, rather than by every process or cache
+    instance.
+
+    :param cache_dir: Directory in which to store decoded pixel data, defaults
+        to ``pixels`` within :func:`default_cache_dir`
+    :param max_bytes: Disk budget of the cache in bytes, or ``None`` for no limit
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[Union[str, pathlib.Path]] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        if cache_dir is None:
+            self.cache_dir = default_cache_dir() / "pixels"
+        else:
+            self.cache_dir = pathlib.Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._digests: collections.OrderedDict[Tuple[str, int, int], str] = (
+            collections.OrderedDict()
+        )
+        self._size: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def digest(self, path: Union[str, pathlib.Path]) -> str:
+        """
+        SHA-256 digest of the file at ``path``. Digests are recorded by path,
+        size and modification time, in memory (up to
+        :data:`MAX_MEMOISED_DIGESTS`) and in the cache directory, so that each
+        version of a file is hashed once.
+
+        :param path: Path to the dicom file
+        """
+
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            digest = self._digests.get(key)
+            if digest is not None:
+                self._digests.move_to_end(key)
+                return digest
+
+        record = self._digest_path(key[0])
+        stamp = f"{key[1]} {key[2]} "
+        try:
+            text = record.read_text()
+            if text.startswith(stamp):
+                digest = text[len(stamp) :]
+        except (FileNotFoundError, UnicodeDecodeError):
+            pass
+
+        if not digest:
+            sha = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    sha.update(chunk)
+            digest = sha.hexdigest()
+            record.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=record.parent, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                f.write(stamp + digest)
+            os.replace(tmp, record)
+
+        with self._lock:
+            self._digests[key] = digest
+            if len(self._digests) > MAX_MEMOISED_DIGESTS:
+                self._digests.popitem(last=False)
+        return digest
+
+    def _digest_path(self, path: str) -> pathlib.Path:
+        # One record per dicom path, overwritten when the dicom is modified
+        name = hashlib.sha1(path.encode()).hexdigest()
+        return self.cache_dir / "digests" / name[:2] / name
+
+    def path(self, digest: str) -> pathlib.Path:
+        """Path of the cache entry with content digest ``digest``"""
+        return self.cache_dir / digest[:2] / f"{digest}.npy"
+
+    def get(
+        self,
+        path: Union[str, pathlib.Path],
+        decode: Optional[Callable[[pathlib.Path], npt.NDArray[Any]]] = None,
+    ) -> npt.NDArray[Any]:
+        """
+        Returns the (read-only) decoded pixel data of the dicom at ``path``,
+        decoding and storing it on a cache miss.
+
+        :param path: Path to the dicom file
+        :param decode: Function decoding the pixel data of the dicom at ``path``,
+            defaults to :attr:`pydicom.dataset.Dataset.pixel_array`
+        """
+
+        entry = self.path(self.digest(path))
+
+        try:
+            arr: npt.NDArray[Any] = np.load(entry, mmap_mode="r")
+            os.utime(entry)  # Mark as recently used
+            return arr
+        except FileNotFoundError:
+            pass
+
+        arr = (decode or _decode)(pathlib.Path(path))
+        self._store(entry, arr)
+        arr.setflags(write=False)
+        return arr
+
+    def _store(self, entry: pathlib.Path, arr: npt.NDArray[Any]) -> None:
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        # Write atomically, so concurrent readers never see partial files
+        fd, tmp = tempfile.mkstemp(dir=entry.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, arr)
+        os.replace(tmp, entry)
+
+        with self._lock:
+            if self._size is None:
+                self._size = self.size()
+            else:
+                self._size += entry.stat().st_size
+
+            if self.max_bytes is not None and self._size > self.max_bytes:
+                self._size = self._evict(self.max_bytes)
+
+    def _entries(self) -> List[Tuple[float, int, pathlib.Path]]:
+        entries = []
+        for entry in self.cache_dir.glob("*/*.npy"):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        return entries
+
+    def size(self) -> int:
+        """Total size of the cache entries on disk, in bytes"""
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self, max_bytes: int) -> int:
+        entries = sorted(self._entries())
+        size = sum(size for _, size, _ in entries)
+        for _, entry_size, entry in entries:
+            if size <= max_bytes:
+                break
+            try:
+                entry.unlink()
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+        return size
+
+    def evict(self, max_bytes: Optional[int] = None) -> None:
+        """
+        Removes the least recently used entries until the cache is within
+        ``max_bytes`` (defaults to the disk budget of the cache).
+
+        :param max_bytes: Size of the cache, in bytes, after eviction
+        """
+
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        if max_bytes is None:
+            return
+        with self._lock:
+            self._size = self._evict(max_bytes)
+
+
+PixelLoaderFunc = Callable[["Image"], npt.NDArray[Any]]
+
+
+def load_pixels(image: Image, cache: Optional[PixelCache] = None) -> npt.NDArray[Any]:
+    """
+    Reads the pixel data of ``image`` into memory, using
+    :meth:`omidb.image.Image.pixels`.
+
+    :param image: The image to load
+    :param cache: Cache of decoded pixel data, see
+        :meth:`omidb.image.Image.pixels`
+    """
+
+    arr = image.pixels(cache)
+    if arr is None:
+        raise ValueError(f"Failed to load pixel data for image {image.id}")
+    return np.array(arr)
+
+
+@dataclass
+class Batch:
+    """
+    A batch of images and their pixel data.
+
+    :param images: The :class:`omidb.image.Image` s of the batch
+    :param pixels: The pixel data of each image in ``images``
+    """
+
+    images: List[Image] = field(default_factory=list)
+    pixels: List[npt.NDArray[Any]] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.images)
+
+
+class BatchLoader:
+    """
+    Iterates over batches of images, loading and decoding the pixel data of
+    upcoming images on a pool of threads while the current batch is being
+    consumed. Batches are yielded in the order of ``images``.
+
+    Example::
+
+        images = [im for series in study.series for im in series.images]
+        for batch in BatchLoader(images, batch_size=8, workers=4):
+            train(batch.pixels)
+
+    :param images: The images to load, e.g. those of a
+        :class:`omidb.study.Study` or a filtered list
+    :param batch_size: Number of images per batch; the last batch may be smaller
+    :param workers: Number of threads used to load images
+    :param prefetch: Maximum number of batches loaded ahead of the consumer
+    :param loader: Function returning the pixel data of an image, defaults to
+        :func:`load_pixels`
+    :param cache: Cache of decoded pixel data used by the default ``loader``
+    """
+
+    def __init__(
+        self,
+        images: Iterable[Image],
+        batch_size: int = 1,
+        workers: int = 4,
+        prefetch: int = 2,
+        loader: Optional[PixelLoaderFunc] = None,
+        cache: Optional[PixelCache] = None,
+    ):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        if prefetch < 1:
+            raise ValueError("prefetch must be at least 1")
+
+        self.images = images
+        self.batch_size = batch_size
+        self.workers = workers
+        self.prefetch = prefetch
+        self.cache = cache
+        self.loader = loader
+
+    def _load(self, image: Image) -> Tuple[Image, npt.NDArray[Any]]:
+        if self.loader is None:
+            return image, load_pixels(image, self.cache)
+        return image, self.loader(image)
+
+    def __iter__(self) -> Iterator[Batch]:
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as executor:
+            batch = Batch()
+            for image, pixels in ordered_map(
+                executor,
+                self._load,
+                self.images,
+                self.batch_size * self.prefetch,
+            ):
+                batch.images.append(image)
+                batch.pixels.append(pixels)
+                if len(batch) == self.batch_size:
+                    yield batch
+                    batch = Batch()
+            if batch.images:
+                yield batch
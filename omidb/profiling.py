@@ -0,0 +1,291 @@
+"""
+Per-stage timing and I/O instrumentation of passes over a DB, e.g. ``omidb
+summarise --profile``.
+
+The stages of parsing and summarising clients (see :data:`STAGES`) are timed
+while a :class:`Profiler` is active (see :func:`profile`), and cost next to
+nothing otherwise.
+"""
+
+import contextlib
+import json
+import pathlib
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+#: Stages instrumented by omidb
+STAGES = {
+    "json": "Reading and decoding NBSS and IMAGEDB JSON files",
+    "link": "Linking NBSS events to IMAGEDB studies (ClientParser)",
+    "headers": "Reading and decoding the JSON headers of images",
+    "classify": "Classifying episodes (outcomes, sort dates, post-op status)",
+    "rows": "Building the rows of the summary",
+    "write": "Writing the rows of the summary",
+}
+
+
+@dataclass
+class StageStats:
+    """Totals of a stage, over all calls (or those of a client)"""
+
+    #: Wall time in seconds, excluding that of nested stages
+    seconds: float = 0.0
+    calls: int = 0
+    #: Bytes read from files
+    bytes: int = 0
+
+    def add(self, other: "StageStats") -> None:
+        self.seconds += other.seconds
+        self.calls += other.calls
+        self.bytes += other.bytes
+
+
+@dataclass
+class Profiler:
+    """
+    Accumulates the wall time, number of calls and bytes read of each stage,
+    in total (:attr:`stages`) and per client (:attr:`clients`). The time of a
+    stage excludes that of the stages nested within it (e.g. ``headers``
+    within ``rows``), so the times of all stages add up to at most the wall
+    time of the pass.
+
+    Profilers of worker processes are combined with :meth:`merge`, in which
+    case the times of the stages add up to the time spent by all processes.
+    """
+
+    stages: Dict[str, StageStats] = field(default_factory=dict)
+    clients: Dict[str, Dict[str, StageStats]] = field(default_factory=dict)
+    #: Wall time of the profiled pass, see :func:`profile`
+    wall_seconds: float = 0.0
+
+    def __post_init__(self) -> None:
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {
+            "stages": self.stages,
+            "clients": self.clients,
+            "wall_seconds": self.wall_seconds,
+        }
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self.__post_init__()
+
+    def stage(self, name: str, client_id: Optional[str] = None) -> "_Timer":
+        """
+        A context manager timing a call of stage ``name``, attributed to the
+        client ``client_id`` if given. Bytes read are added to the timer with
+        ``add_bytes``.
+        """
+
+        return _Timer(self, name, client_id)
+
+    def _stack(self) -> List["_Timer"]:
+        stack: Optional[List[_Timer]] = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _record(self, timer: "_Timer", seconds: float) -> None:
+        stats = StageStats(seconds, 1, timer.bytes)
+        with self._lock:
+            self.stages.setdefault(timer.name, StageStats()).add(stats)
+            if timer.client_id is not None:
+                client = self.clients.setdefault(timer.client_id, {})
+                client.setdefault(timer.name, StageStats()).add(stats)
+
+    def merge(self, other: "Profiler") -> None:
+        """Adds the totals of ``other``, e.g. of a worker process"""
+
+        with self._lock:
+            for name, stats in other.stages.items():
+                self.stages.setdefault(name, StageStats()).add(stats)
+            for client_id, stages in other.clients.items():
+                client = self.clients.setdefault(client_id, {})
+                for name, stats in stages.items():
+                    client.setdefault(name, StageStats()).add(stats)
+
+    def slowest_clients(self, n: int = 10) -> List[Dict[str, Any]]:
+        """
+        The ``n`` clients with the most time spent in their stages, slowest
+        first, each with its ``client_id``, ``seconds``, ``bytes`` and the
+        seconds of each stage
+        """
+
+        totals: List[Dict[str, Any]] = [
+            {
+                "client_id": client_id,
+                "seconds": sum(s.seconds for s in stages.values()),
+                "bytes": sum(s.bytes for s in stages.values()),
+                "stages": {name: s.seconds for name, s in stages.items()},
+            }
+            for client_id, stages in self.clients.items()
+        ]
+        totals.sort(key=lambda c: c["seconds"], reverse=True)
+        return totals[:n]
+
+    def report(self, num_slowest: int = 10) -> Dict[str, Any]:
+        """
+        The totals as a JSON-serialisable dict, with the ``wall_seconds`` of
+        the pass, the ``seconds``, ``calls`` and ``bytes`` of each stage, the
+        number of clients, and the ``num_slowest`` slowest clients (see
+        :meth:`slowest_clients`)
+        """
+
+        return {
+            "wall_seconds": self.wall_seconds,
+            "stages": {
+                name: {"seconds": s.seconds, "calls": s.calls, "bytes": s.bytes}
+                for name, s in self.stages.items()
+            },
+            "num_clients": len(self.clients),
+            "slowest_clients": self.slowest_clients(num_slowest),
+        }
+
+    def write_json(self, path: Union[str, pathlib.Path], num_slowest: int = 10) -> None:
+        """Writes :meth:`report` to ``path`` as JSON"""
+
+        with open(path, "w") as f:
+            json.dump(self.report(num_slowest), f, indent=1)
+
+    def format(self, num_slowest: int = 10) -> str:
+        """:meth:`report`, formatted as a table"""
+
+        lines = [
+            f"{'stage':<10} {'seconds':>10} {'%':>6} {'calls':>10} {'MB':>10}",
+        ]
+        total = sum(s.seconds for s in self.stages.values())
+        for name, s in sorted(
+            self.stages.items(), key=lambda item: item[1].seconds, reverse=True
+        ):
+            percent = 100 * s.seconds / total if total else 0.0
+            lines.append(
+                f"{name:<10} {s.seconds:>10.3f} {percent:>6.1f} {s.calls:>10d} "
+                f"{s.bytes / 1e6:>10.2f}"
+            )
+        lines.append(f"{'total':<10} {total:>10.3f}")
+        lines.append(
+            f"wall time {self.wall_seconds:.3f} s, {len(self.clients)} clients"
+        )
+
+        slowest = self.slowest_clients(num_slowest)
+        if slowest:
+            lines.append("slowest clients:")
+            for client in slowest:
+                stages = ", ".join(
+                    f"{name} {seconds:.3f}"
+                    for name, seconds in sorted(
+                        client["stages"].items(), key=lambda item: -item[1]
+                    )
+                )
+                lines.append(
+                    f"  {client['client_id']:<12} {client['seconds']:.3f} s "
+                    f"({stages})"
+                )
+        return "\n".join(lines)
+
+
+class _Timer:
+    """Times a call of a stage, see :meth:`Profiler.stage`"""
+
+    __slots__ = ("profiler", "name", "client_id", "bytes", "_start", "_nested")
+
+    enabled = True
+
+    def __init__(self, profiler: Profiler, name: str, client_id: Optional[str]):
+        self.profiler = profiler
+        self.name = name
+        self.client_id = client_id
+        self.bytes = 0
+
+    def add_bytes(self, num_bytes: int) -> None:
+        self.bytes += num_bytes
+
+    def __enter__(self) -> "_Timer":
+        self.profiler._stack().append(self)
+        self._nested = 0.0
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        seconds = time.perf_counter() - self._start
+        stack = self.profiler._stack()
+        stack.pop()
+        if stack:
+            stack[-1]._nested += seconds
+        self.profiler._record(self, seconds - self._nested)
+
+
+class _NullTimer:
+    """A timer which does nothing, used while profiling is disabled"""
+
+    enabled = False
+
+    def add_bytes(self, num_bytes: int) -> None:
+        pass
+
+    def __enter__(self) -> "_NullTimer":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+# The active profiler, see profile
+_profiler: Optional[Profiler] = None
+
+
+def active() -> Optional[Profiler]:
+    """The active profiler, if any"""
+    return _profiler
+
+
+def stage(name: str, client_id: Optional[str] = None) -> Union[_Timer, _NullTimer]:
+    """
+    Times a call of stage ``name`` with the active profiler, if any, e.g.::
+
+        with profiling.stage("json", client_id) as timer:
+            ...
+            if timer.enabled:
+                timer.add_bytes(size)
+
+    :param name: The stage, e.g. one of :data:`STAGES`
+    :param client_id: The client to attribute the call to
+    """
+
+    if _profiler is None:
+        return _NULL_TIMER
+    return _profiler.stage(name, client_id)
+
+
+@contextlib.contextmanager
+def profile(profiler: Optional[Profiler] = None) -> Iterator[Profiler]:
+    """
+    Within this context, the stages of omidb (see :data:`STAGES`) are timed by
+    ``profiler`` (by default, a new :class:`Profiler`), which is yielded.
+    Its :attr:`Profiler.wall_seconds` is incremented by the duration of the
+    context. For example::
+
+        with omidb.profiling.profile() as profiler:
+            omidb.commands.summarise.write_client_data(db)
+        print(profiler.format())
+
+    :param profiler: The profiler to activate
+    """
+
+    global _profiler
+    if profiler is None:
+        profiler = Profiler()
+    previous, _profiler = _profiler, profiler
+    start = time.perf_counter()
+    try:
+        yield profiler
+    finally:
+        profiler.wall_seconds += time.perf_counter() - start
+        _profiler = previous
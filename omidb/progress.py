@@ -0,0 +1,200 @@
+"""
+Progress and throughput of long passes over the clients of a DB, e.g.
+iterating :class:`omidb.parser.DB` with a ``progress`` callback, or ``omidb
+summarise --progress``.
+"""
+
+import datetime
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Mapping, Optional, Set, Tuple
+from .client import Client
+
+
+@dataclass
+class ProgressInfo:
+    """A snapshot of the progress of a pass, see :class:`Progress`"""
+
+    #: Number of clients completed, and in total
+    clients: int
+    total_clients: int
+    #: Number of episodes and images of the completed clients
+    episodes: int
+    images: int
+    #: Size of the NBSS and IMAGEDB files of the completed clients, and in
+    #: total
+    bytes: int
+    total_bytes: int
+    #: Seconds since the start of the pass
+    elapsed: float
+    clients_per_second: float
+    images_per_second: float
+    mb_per_second: float
+    #: Estimated seconds to completion, from the sizes of the NBSS and IMAGEDB
+    #: files of the remaining clients, if known
+    eta: Optional[float]
+    #: The client in progress for the longest time, and for how long
+    slowest_client: Optional[str]
+    slowest_seconds: float
+
+    def __str__(self) -> str:
+        percent = 100 * self.clients / self.total_clients if self.total_clients else 0
+        line = (
+            f"{self.clients}/{self.total_clients} clients ({percent:.0f}%), "
+            f"{self.episodes} episodes, {self.images} images | "
+            f"{self.clients_per_second:.1f} clients/s, "
+            f"{self.images_per_second:.0f} images/s, "
+            f"{self.mb_per_second:.2f} MB/s"
+        )
+        if self.eta is not None:
+            line += f" | ETA {datetime.timedelta(seconds=round(self.eta))}"
+        if self.slowest_client is not None:
+            line += f" | slowest {self.slowest_client} ({self.slowest_seconds:.1f} s)"
+        return line
+
+
+class Progress:
+    """
+    Tracks the clients of a pass as they are started and finished, and calls
+    ``callback`` with a :class:`ProgressInfo` at most every ``interval``
+    seconds (when a client is started or finished, or, with ``ticker``, from
+    a background thread, so stalls are reported too) and when closed.
+
+    :param callback: Called with the progress
+    :param sizes: The size of the NBSS and IMAGEDB files of each client of the
+        pass (see :meth:`omidb.parser.DB.source_size`), by ID
+    :param interval: Minimum seconds between calls of ``callback``
+    :param ticker: Also call ``callback`` every ``interval`` seconds from a
+        background thread, until closed
+    """
+
+    def __init__(
+        self,
+        callback: Callable[[ProgressInfo], None],
+        sizes: Mapping[str, int],
+        interval: float = 1.0,
+        ticker: bool = False,
+    ):
+        self.callback = callback
+        self.sizes = dict(sizes)
+        self.total_bytes = sum(self.sizes.values())
+        self.interval = interval
+
+        self.clients = 0
+        self.episodes = 0
+        self.images = 0
+        self.bytes = 0
+        self._in_flight: Dict[str, float] = {}
+        # Clients finished before they were started, see start
+        self._finished_early: Set[str] = set()
+        self._start = time.perf_counter()
+        self._last = self._start
+        self._lock = threading.Lock()
+        self._report_lock = threading.Lock()
+
+        self._closed = threading.Event()
+        self._ticker: Optional[threading.Thread] = None
+        if ticker:
+            self._ticker = threading.Thread(target=self._tick, daemon=True)
+            self._ticker.start()
+
+    def _tick(self) -> None:
+        while not self._closed.wait(self.interval):
+            self.report()
+
+    def start(self, client_id: str) -> None:
+        """
+        Marks the client ``client_id`` as in progress, unless it is already
+        finished (as starts may be reported late, e.g. by worker processes)
+        """
+
+        now = time.perf_counter()
+        with self._lock:
+            if client_id in self._finished_early:
+                self._finished_early.remove(client_id)
+            else:
+                self._in_flight[client_id] = now
+        if now - self._last >= self.interval:
+            self.report()
+
+    def finish(
+        self, client_id: str, num_episodes: int = 0, num_images: int = 0
+    ) -> None:
+        """
+        Marks the client ``client_id`` as completed, with ``num_episodes``
+        episodes and ``num_images`` images
+        """
+
+        now = time.perf_counter()
+        with self._lock:
+            if self._in_flight.pop(client_id, None) is None:
+                self._finished_early.add(client_id)
+            self.clients += 1
+            self.episodes += num_episodes
+            self.images += num_images
+            self.bytes += self.sizes.get(client_id, 0)
+        if now - self._last >= self.interval:
+            self.report()
+
+    def info(self) -> ProgressInfo:
+        """The current progress"""
+
+        now = time.perf_counter()
+        with self._lock:
+            elapsed = now - self._start
+            slowest = min(
+                self._in_flight.items(), key=lambda item: item[1], default=None
+            )
+            clients, images, num_bytes = self.clients, self.images, self.bytes
+            episodes = self.episodes
+
+        eta: Optional[float] = None
+        if self.total_bytes and num_bytes:
+            eta = elapsed * (self.total_bytes - num_bytes) / num_bytes
+        elif clients:
+            eta = elapsed * (len(self.sizes) - clients) / clients
+
+        rate = 1 / elapsed if elapsed > 0 else 0.0
+        return ProgressInfo(
+            clients=clients,
+            total_clients=len(self.sizes),
+            episodes=episodes,
+            images=images,
+            bytes=num_bytes,
+            total_bytes=self.total_bytes,
+            elapsed=elapsed,
+            clients_per_second=clients * rate,
+            images_per_second=images * rate,
+            mb_per_second=num_bytes * rate / 1e6,
+            eta=eta,
+            slowest_client=None if slowest is None else slowest[0],
+            slowest_seconds=0.0 if slowest is None else now - slowest[1],
+        )
+
+    def report(self) -> None:
+        """Calls the callback with the current progress"""
+
+        with self._report_lock:
+            self._last = time.perf_counter()
+            self.callback(self.info())
+
+    def close(self) -> None:
+        """Stops the ticker, if any, and reports the final progress"""
+
+        self._closed.set()
+        if self._ticker is not None:
+            self._ticker.join()
+        self.report()
+
+
+def count(client: Client) -> Tuple[int, int]:
+    """The number of episodes and images of ``client``"""
+
+    num_images = sum(
+        len(series.images)
+        for episode in client.episodes
+        for study in episode.studies
+        for series in study.series
+    )
+    return len(client.episodes), num_images
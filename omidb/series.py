@@ -1,8 +1,9 @@
-from typing import List
+from typing import List, Optional
 from dataclasses import dataclass
 import matplotlib
 import matplotlib.pyplot as plt
 from .image import Image
+from .thumbnails import ThumbnailCache
 
 
 @dataclass
@@ -27,17 +28,22 @@ class Series:
         """
         return len(self.images)
 
-    def plot(self) -> matplotlib.pyplot.Axes:
+    def plot(
+        self, level: Optional[int] = None, cache: Optional[ThumbnailCache] = None
+    ) -> matplotlib.pyplot.Axes:
         """
         Convenience method for plotting all images in the series
+
+        :param level: See :meth:`omidb.image.Image.plot`
+        :param cache: See :meth:`omidb.image.Image.plot`
         """
 
         if self.num_images == 1:
-            return self.images[0].plot()
+            return self.images[0].plot(level=level, cache=cache)
 
         fig, axes = plt.subplots(1, self.num_images)
 
         for i, image in enumerate(self.images):
-            image.plot(axes[i])
+            image.plot(axes[i], level=level, cache=cache)
 
         return axes
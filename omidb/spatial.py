@@ -0,0 +1,274 @@
+from __future__ import annotations
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+import numpy as np
+import numpy.typing as npt
+from .mark import BoundingBox, Mark
+
+if TYPE_CHECKING:
+    from .client import Client
+    from .image import Image
+
+IntArray = npt.NDArray[np.int64]
+Region = Union[BoundingBox, Callable[["Image"], Optional[BoundingBox]]]
+
+
+def _box(box: BoundingBox) -> Tuple[int, int, int, int]:
+    return (
+        min(box.x1, box.x2),
+        min(box.y1, box.y2),
+        max(box.x1, box.x2),
+        max(box.y1, box.y2),
+    )
+
+
+def _area(
+    x1: npt.NDArray[Any],
+    y1: npt.NDArray[Any],
+    x2: npt.NDArray[Any],
+    y2: npt.NDArray[Any],
+) -> IntArray:
+    # Coordinates are inclusive, see BoundingBox.slices; empty if x1 > x2
+    area: IntArray = np.maximum(x2 - x1 + 1, 0) * np.maximum(y2 - y1 + 1, 0)
+    return area
+
+
+def _iou(
+    boxes: Tuple[IntArray, IntArray, IntArray, IntArray],
+    areas: IntArray,
+    region: Sequence[Any],
+) -> npt.NDArray[np.float64]:
+    # IoU of each of `boxes` with `region` (coordinates, or arrays thereof)
+    x1, y1, x2, y2 = boxes
+    rx1, ry1, rx2, ry2 = region
+    intersection = _area(
+        np.maximum(x1, rx1),
+        np.maximum(y1, ry1),
+        np.minimum(x2, rx2),
+        np.minimum(y2, ry2),
+    )
+    union = areas + _area(rx1, ry1, rx2, ry2) - intersection
+    iou: npt.NDArray[np.float64] = np.divide(
+        intersection,
+        union,
+        out=np.zeros(len(areas), dtype=np.float64),
+        where=union > 0,
+    )
+    return iou
+
+
+class MarkIndex:
+    """
+    Columnar index of the bounding boxes of marks, for vectorised area,
+    intersection over union (IoU) and containment queries over many marks,
+    e.g. for dataset quality assurance. Queries return the matching
+    ``(image, mark)`` pairs.
+
+    Bounding boxes are stored as arrays of (inclusive) pixel coordinates, with
+    ``x1 <= x2`` and ``y1 <= y2``, sorted by ``x1`` such that marks left of a
+    query region are skipped by a binary search. Example::
+
+        index = MarkIndex.from_clients(db)
+        large = index.where_area(min_area=100 * 100)
+        pectoral = index.overlapping(pectoral_region, min_iou=0.1)
+        duplicates = index.overlapping_pairs(min_iou=0.5)
+
+    :param entries: ``(image, mark)`` pairs to index
+    """
+
+    def __init__(self, entries: Iterable[Tuple[Image, Mark]]):
+        self.images: List[Image] = []
+        self.marks: List[Mark] = []
+        image_idx: List[int] = []
+        boxes: List[Tuple[int, int, int, int]] = []
+
+        positions: Dict[int, int] = {}
+        for image, mark in entries:
+            pos = positions.setdefault(id(image), len(self.images))
+            if pos == len(self.images):
+                self.images.append(image)
+            image_idx.append(pos)
+            self.marks.append(mark)
+            boxes.append(_box(mark.boundingBox))
+
+        # Sort by x1, such that the candidates for a query are a prefix
+        coords = np.array(boxes, dtype=np.int64).reshape(-1, 4)
+        order = np.argsort(coords[:, 0], kind="stable")
+        self.marks = [self.marks[i] for i in order]
+        self.image_idx: IntArray = np.array(image_idx, dtype=np.int64)[order]
+        self.x1, self.y1, self.x2, self.y2 = (coords[order, i] for i in range(4))
+        self.areas = _area(self.x1, self.y1, self.x2, self.y2)
+
+    @classmethod
+    def from_clients(cls, clients: Iterable[Client]) -> MarkIndex:
+        """
+        Indexes the marks of all images of ``clients``, e.g. a
+        :class:`omidb.parser.DB`.
+        """
+
+        return cls(
+            (image, mark)
+            for client in clients
+            for episode in client.episodes
+            for study in episode.studies
+            for series in study.series
+            for image in series.images
+            for mark in image.marks
+        )
+
+    def __len__(self) -> int:
+        return len(self.marks)
+
+    def refs(self, idx: Iterable[int]) -> List[Tuple[Image, Mark]]:
+        """The ``(image, mark)`` pairs of the marks at positions ``idx``"""
+        return [(self.images[self.image_idx[i]], self.marks[i]) for i in idx]
+
+    def where_area(
+        self, min_area: Optional[int] = None, max_area: Optional[int] = None
+    ) -> List[Tuple[Image, Mark]]:
+        """
+        Marks whose area (in pixels) is within [``min_area``, ``max_area``]
+
+        :param min_area: Minimum area, if any
+        :param max_area: Maximum area, if any
+        """
+
+        mask = np.ones(len(self), dtype=bool)
+        if min_area is not None:
+            mask &= self.areas >= min_area
+        if max_area is not None:
+            mask &= self.areas <= max_area
+        return self.refs(np.flatnonzero(mask))
+
+    def _region_coords(self, region: Region) -> Tuple[IntArray, ...]:
+        """
+        The coordinates of ``region`` for each mark, evaluating callable regions
+        once per image. Marks of images without a region get an empty region.
+        """
+
+        if isinstance(region, BoundingBox):
+            return tuple(np.full(len(self), c, dtype=np.int64) for c in _box(region))
+
+        per_image = np.empty((len(self.images), 4), dtype=np.int64)
+        for pos, image in enumerate(self.images):
+            box = region(image)
+            per_image[pos] = (0, 0, -1, -1) if box is None else _box(box)
+        return tuple(per_image[self.image_idx, i] for i in range(4))
+
+    def iou(self, region: Region) -> npt.NDArray[np.float64]:
+        """
+        The intersection over union of each mark (in index order, see
+        :meth:`refs`) with ``region``
+
+        :param region: A bounding box, or a function returning the bounding box
+            (or ``None``) of each image, e.g. of its pectoral muscle
+        """
+
+        return _iou(
+            (self.x1, self.y1, self.x2, self.y2),
+            self.areas,
+            self._region_coords(region),
+        )
+
+    def overlapping(
+        self, region: Region, min_iou: float = 0.0
+    ) -> List[Tuple[Image, Mark]]:
+        """
+        Marks overlapping ``region``, i.e. with an IoU greater than ``min_iou``
+
+        :param region: A bounding box, or a function returning the bounding box
+            (or ``None``) of each image
+        :param min_iou: Minimum intersection over union, exclusive
+        """
+
+        if isinstance(region, BoundingBox):
+            # Only marks starting left of the region's right edge can overlap
+            box = _box(region)
+            stop = int(np.searchsorted(self.x1, box[2], side="right"))
+            iou = _iou(
+                (self.x1[:stop], self.y1[:stop], self.x2[:stop], self.y2[:stop]),
+                self.areas[:stop],
+                box,
+            )
+            return self.refs(np.flatnonzero(iou > min_iou))
+
+        return self.refs(np.flatnonzero(self.iou(region) > min_iou))
+
+    def within(self, region: Region) -> List[Tuple[Image, Mark]]:
+        """
+        Marks entirely contained by ``region``
+
+        :param region: A bounding box, or a function returning the bounding box
+            (or ``None``) of each image
+        """
+
+        rx1, ry1, rx2, ry2 = self._region_coords(region)
+        mask = (self.x1 >= rx1) & (self.y1 >= ry1) & (self.x2 <= rx2) & (self.y2 <= ry2)
+        return self.refs(np.flatnonzero(mask))
+
+    def overlapping_pairs(
+        self, min_iou: float = 0.0
+    ) -> List[Tuple[Image, Mark, Mark, float]]:
+        """
+        Pairs of marks on the same image which overlap one another, i.e. with an
+        IoU greater than ``min_iou``, as ``(image, mark, other_mark, iou)``.
+
+        Marks are grouped by image, and each mark is compared with the marks
+        following it in its group, one offset at a time, such that each
+        comparison is vectorised over all groups.
+
+        :param min_iou: Minimum intersection over union, exclusive
+        """
+
+        order = np.lexsort((self.x1, self.image_idx))
+        image_idx = self.image_idx[order]
+        x1, y1, x2, y2 = (c[order] for c in (self.x1, self.y1, self.x2, self.y2))
+        areas = self.areas[order]
+
+        found: List[Tuple[int, int, float]] = []
+        offset = 1
+        while offset < len(order):
+            a = np.arange(len(order) - offset)
+            b = a + offset
+            same = image_idx[a] == image_idx[b]
+            if not same.any():
+                # No group has more than `offset` marks
+                break
+            a, b = a[same], b[same]
+            intersection = _area(
+                np.maximum(x1[a], x1[b]),
+                np.maximum(y1[a], y1[b]),
+                np.minimum(x2[a], x2[b]),
+                np.minimum(y2[a], y2[b]),
+            )
+            union = areas[a] + areas[b] - intersection
+            iou = np.divide(
+                intersection,
+                union,
+                out=np.zeros(len(a), dtype=np.float64),
+                where=union > 0,
+            )
+            hits = np.flatnonzero(iou > min_iou)
+            found.extend(zip(order[a[hits]], order[b[hits]], iou[hits]))
+            offset += 1
+
+        found.sort()
+        return [
+            (
+                self.images[self.image_idx[i]],
+                self.marks[i],
+                self.marks[j],
+                float(iou_ij),
+            )
+            for i, j, iou_ij in found
+        ]
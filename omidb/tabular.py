@@ -0,0 +1,460 @@
+"""
+Writers of tables with typed columns (e.g. the output of ``omidb summarise``)
+in several formats, with rows written as they are produced.
+"""
+
+import abc
+import csv
+import datetime
+import gzip
+import json
+import pathlib
+import zipfile
+from typing import (
+    IO,
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+)
+import numpy as np
+import numpy.typing as npt
+
+# Name and type (one of str, int, float, bool and datetime.date) of a column
+Column = Tuple[str, Type[Any]]
+
+FORMATS = (
+    "csv",
+    "csv.gz",
+    "csv.zst",
+    "ndjson",
+    "ndjson.gz",
+    "ndjson.zst",
+    "npz",
+    "parquet",
+)
+
+# Size of the write buffer of text formats
+BUFFER_SIZE = 1 << 20
+
+
+def format_from_path(path: Union[str, pathlib.Path]) -> str:
+    """
+    The format of :data:`FORMATS` matching the extension of ``path``, e.g.
+    ``"csv.gz"`` for ``summary.csv.gz``, defaulting to ``"csv"``
+    """
+
+    name = pathlib.Path(path).name
+    for fmt in sorted(FORMATS, key=len, reverse=True):
+        if name.endswith("." + fmt):
+            return fmt
+    return "csv"
+
+
+def coerce(value: Any, type_: Type[Any]) -> Any:
+    """
+    Converts ``value`` to ``type_``, or ``None`` if ``value`` is ``None`` or
+    cannot be converted. Dates may be given as ISO 8601 strings, and booleans
+    as ``"True"`` or ``"False"``.
+    """
+
+    if value is None:
+        return None
+    try:
+        if type_ is datetime.date:
+            if isinstance(value, datetime.date):
+                return value
+            return datetime.date.fromisoformat(str(value))
+        if type_ is bool:
+            if isinstance(value, str):
+                return {"true": True, "false": False}.get(value.lower())
+            return bool(value)
+        return type_(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class TableWriter(abc.ABC):
+    """
+    Writes rows of a table with typed ``columns``, see :func:`open_table`. Rows
+    are sequences of values in the order of ``columns``.
+
+    :param columns: The name and type of each column
+    """
+
+    def __init__(self, columns: Sequence[Column]):
+        self.columns = list(columns)
+        self.names = [name for name, _ in self.columns]
+
+    @abc.abstractmethod
+    def writerow(self, row: Sequence[Any]) -> None:
+        """Writes ``row``"""
+
+    def writerows(self, rows: Sequence[Sequence[Any]]) -> None:
+        for row in rows:
+            self.writerow(row)
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "TableWriter":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+
+class CSVTableWriter(TableWriter):
+    """
+    Writes rows as CSV to the text file ``output``, with a header, and values
+    formatted by ``csv.writer``.
+
+    :param output: The text file
+    :param columns: The name and type of each column
+    :param close: Close ``output`` on :meth:`close`
+    """
+
+    def __init__(self, output: IO[str], columns: Sequence[Column], close: bool = False):
+        super().__init__(columns)
+        self._output = output
+        self._close = close
+        self._writer = csv.writer(output, delimiter=",")
+        self._writer.writerow(self.names)
+
+    def writerow(self, row: Sequence[Any]) -> None:
+        self._writer.writerow(row)
+
+    def close(self) -> None:
+        if self._close:
+            self._output.close()
+
+
+class NDJSONTableWriter(TableWriter):
+    """
+    Writes each row as a JSON object (one per line) to the text file
+    ``output``, with values converted to the type of their column, and dates
+    formatted as ISO 8601 strings.
+
+    :param output: The text file
+    :param columns: The name and type of each column
+    :param close: Close ``output`` on :meth:`close`
+    """
+
+    def __init__(self, output: IO[str], columns: Sequence[Column], close: bool = False):
+        super().__init__(columns)
+        self._output = output
+        self._close = close
+
+    def writerow(self, row: Sequence[Any]) -> None:
+        record = {}
+        for (name, type_), value in zip(self.columns, row):
+            value = coerce(value, type_)
+            if isinstance(value, datetime.date):
+                value = value.isoformat()
+            record[name] = value
+        self._output.write(json.dumps(record) + "\n")
+
+    def close(self) -> None:
+        if self._close:
+            self._output.close()
+
+
+class _ColumnBuffer(TableWriter):
+    """A table writer which buffers rows as columns of (converted) values"""
+
+    def __init__(self, columns: Sequence[Column], row_group_size: int):
+        super().__init__(columns)
+        self.row_group_size = row_group_size
+        self._buffer: List[List[Any]] = [[] for _ in self.columns]
+
+    def writerow(self, row: Sequence[Any]) -> None:
+        for column, (_, type_), value in zip(self._buffer, self.columns, row):
+            column.append(coerce(value, type_))
+        if len(self._buffer[0]) >= self.row_group_size:
+            self._flush()
+
+    @abc.abstractmethod
+    def _write_group(self, values: List[List[Any]]) -> None:
+        """Writes a group of rows, given as the values of each column"""
+
+    def _flush(self) -> None:
+        if self._buffer and self._buffer[0]:
+            self._write_group(self._buffer)
+            self._buffer = [[] for _ in self.columns]
+
+
+_NPZ_TYPES: Dict[str, Type[Any]] = {
+    "str": str,
+    "int": int,
+    "float": float,
+    "bool": bool,
+    "date": datetime.date,
+}
+_NPZ_NAMES = {type_: name for name, type_ in _NPZ_TYPES.items()}
+
+
+def _to_array(values: List[Any], type_: Type[Any]) -> npt.NDArray[Any]:
+    """The values of a column as an array of its type, with missing values 0,
+    ``False``, ``""``, ``NaN`` or ``NaT``"""
+
+    if type_ is datetime.date:
+        return np.array(
+            [v if v is not None else "NaT" for v in values], dtype="datetime64[D]"
+        )
+    if type_ is float:
+        return np.array(
+            [v if v is not None else np.nan for v in values], dtype=np.float64
+        )
+    if type_ is int:
+        return np.array([v if v is not None else 0 for v in values], dtype=np.int64)
+    if type_ is bool:
+        return np.array([bool(v) for v in values], dtype=bool)
+    return np.array([v if v is not None else "" for v in values], dtype=str)
+
+
+class NPZTableWriter(_ColumnBuffer):
+    """
+    Writes a typed, columnar table to an ``.npz`` archive (see
+    :func:`read_npz`). Rows are buffered in groups of ``row_group_size``,
+    each column of which is stored as an array of its type (``datetime64[D]``
+    for dates, fixed-width unicode for strings), alongside a mask of the
+    values which are present.
+
+    :param path: Path of the archive
+    :param columns: The name and type of each column
+    :param row_group_size: Number of rows per group
+    """
+
+    def __init__(
+        self,
+        path: Union[str, pathlib.Path],
+        columns: Sequence[Column],
+        row_group_size: int = 1 << 16,
+    ):
+        super().__init__(columns, row_group_size)
+        self._zip = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED)
+        self._num_groups = 0
+        self._save(
+            "__columns__",
+            np.array([[name, _NPZ_NAMES[type_]] for name, type_ in self.columns]),
+        )
+
+    def _save(self, name: str, arr: npt.NDArray[Any]) -> None:
+        with self._zip.open(name + ".npy", "w", force_zip64=True) as f:
+            np.lib.format.write_array(f, arr, allow_pickle=False)
+
+    def _write_group(self, values: List[List[Any]]) -> None:
+        for (name, type_), column in zip(self.columns, values):
+            group = f"{self._num_groups:06d}"
+            self._save(f"{name}/{group}", _to_array(column, type_))
+            self._save(
+                f"{name}.valid/{group}",
+                np.array([v is not None for v in column], dtype=bool),
+            )
+        self._num_groups += 1
+
+    def close(self) -> None:
+        self._flush()
+        self._zip.close()
+
+
+def read_npz(path: Union[str, pathlib.Path]) -> Dict[str, np.ma.MaskedArray]:
+    """
+    Reads a table written by :class:`NPZTableWriter`, returning each column as
+    a masked array (masking missing values), keyed by name, in column order.
+
+    :param path: Path of the archive
+    """
+
+    with np.load(path, allow_pickle=False) as npz:
+        columns = npz["__columns__"]
+        result: Dict[str, np.ma.MaskedArray] = {}
+        for name, type_name in columns.tolist():
+            groups = sorted(k for k in npz.files if k.startswith(name + "/"))
+            if groups:
+                data = np.concatenate([npz[k] for k in groups])
+                valid = np.concatenate(
+                    [npz[name + ".valid/" + k[len(name) + 1 :]] for k in groups]
+                )
+            else:
+                data = _to_array([], _NPZ_TYPES[type_name])
+                valid = np.zeros(0, dtype=bool)
+            result[name] = np.ma.MaskedArray(data, mask=~valid)
+        return result
+
+
+class ParquetTableWriter(_ColumnBuffer):
+    """
+    Writes a table to a Parquet file, in row groups of ``row_group_size``
+    rows. Requires ``pyarrow``.
+
+    :param path: Path of the Parquet file
+    :param columns: The name and type of each column
+    :param row_group_size: Number of rows per row group
+    """
+
+    def __init__(
+        self,
+        path: Union[str, pathlib.Path],
+        columns: Sequence[Column],
+        row_group_size: int = 1 << 16,
+    ):
+        try:
+            import pyarrow  # type: ignore
+            import pyarrow.parquet  # type: ignore
+        except ImportError:
+            raise ImportError("Writing Parquet files requires pyarrow") from None
+
+        super().__init__(columns, row_group_size)
+        types = {
+            str: pyarrow.string(),
+            int: pyarrow.int64(),
+            float: pyarrow.float64(),
+            bool: pyarrow.bool_(),
+            datetime.date: pyarrow.date32(),
+        }
+        self._pyarrow = pyarrow
+        self._schema = pyarrow.schema(
+            [(name, types[type_]) for name, type_ in self.columns]
+        )
+        self._writer = pyarrow.parquet.ParquetWriter(str(path), self._schema)
+
+    def _write_group(self, values: List[List[Any]]) -> None:
+        self._writer.write_table(
+            self._pyarrow.Table.from_arrays(
+                [
+                    self._pyarrow.array(column, type=field.type)
+                    for column, field in zip(values, self._schema)
+                ],
+                schema=self._schema,
+            )
+        )
+
+    def close(self) -> None:
+        self._flush()
+        self._writer.close()
+
+
+def _open_text(
+    path: Union[str, pathlib.Path], compression: Optional[str], mode: str = "w"
+) -> IO[str]:
+    if compression == "gz":
+        return gzip.open(path, mode + "t", newline="")  # type: ignore
+    if compression == "zst":
+        try:
+            import zstandard  # type: ignore
+        except ImportError:
+            raise ImportError("zstd files require zstandard") from None
+        return zstandard.open(path, mode + "t", newline="")  # type: ignore
+    return open(path, mode, buffering=BUFFER_SIZE, newline="")
+
+
+def open_table(
+    path: Union[str, pathlib.Path],
+    columns: Sequence[Column],
+    format: Optional[str] = None,
+) -> TableWriter:
+    """
+    Opens a :class:`TableWriter` writing to ``path`` in ``format``, one of
+    :data:`FORMATS` (by default, :func:`format_from_path`):
+
+    - ``csv``, optionally compressed with gzip (``csv.gz``) or zstd
+      (``csv.zst``, requires ``zstandard``)
+    - ``ndjson`` (newline-delimited JSON with typed values), optionally
+      compressed as above
+    - ``npz``, a typed, columnar NumPy archive, see :func:`read_npz`
+    - ``parquet``, requires ``pyarrow``
+
+    :param path: Path of the output file
+    :param columns: The name and type of each column
+    :param format: The format
+    """
+
+    if format is None:
+        format = format_from_path(path)
+    if format not in FORMATS:
+        raise ValueError(f"Unknown format {format}, expected one of {FORMATS}")
+
+    if format == "npz":
+        return NPZTableWriter(path, columns)
+    if format == "parquet":
+        return ParquetTableWriter(path, columns)
+
+    kind, _, compression = format.partition(".")
+    output = _open_text(path, compression or None)
+    if kind == "ndjson":
+        return NDJSONTableWriter(output, columns, close=True)
+    return CSVTableWriter(output, columns, close=True)
+
+
+def _check_names(
+    path: Union[str, pathlib.Path], names: Sequence[str], expected: Sequence[str]
+) -> None:
+    if list(names) != list(expected):
+        raise ValueError(
+            f"The columns of {path} are {list(names)}, expected {list(expected)}"
+        )
+
+
+def read_table(
+    path: Union[str, pathlib.Path],
+    columns: Sequence[Column],
+    format: Optional[str] = None,
+) -> Iterator[List[Any]]:
+    """
+    Reads the rows of a table written by :func:`open_table`, with values as
+    read (e.g. strings, or ``None`` for empty values, from CSV), such that
+    writing them to a table of the same format reproduces them. Parquet
+    requires ``pyarrow``.
+
+    :param path: Path of the table
+    :param columns: The name and type of each column, which must match those
+        of the table
+    :param format: The format, see :func:`open_table`
+    :raises ValueError: If the columns of the table do not match ``columns``
+    """
+
+    if format is None:
+        format = format_from_path(path)
+    if format not in FORMATS:
+        raise ValueError(f"Unknown format {format}, expected one of {FORMATS}")
+    names = [name for name, _ in columns]
+
+    if format == "npz":
+        table = read_npz(path)
+        _check_names(path, list(table), names)
+        # Masked (missing) values are None
+        values = [table[name].tolist() for name in names]
+        for row in zip(*values):
+            yield list(row)
+        return
+    if format == "parquet":
+        try:
+            import pyarrow.parquet  # type: ignore
+        except ImportError:
+            raise ImportError("Reading Parquet files requires pyarrow") from None
+        parquet = pyarrow.parquet.ParquetFile(str(path))
+        _check_names(path, parquet.schema_arrow.names, names)
+        for batch in parquet.iter_batches():
+            for record in batch.to_pylist():
+                yield [record[name] for name in names]
+        return
+
+    kind, _, compression = format.partition(".")
+    with _open_text(path, compression or None, "r") as f:
+        if kind == "ndjson":
+            for line in f:
+                record = json.loads(line)
+                _check_names(path, list(record), names)
+                yield [record[name] for name in names]
+            return
+
+        reader = csv.reader(f, delimiter=",")
+        _check_names(path, next(reader, []), names)
+        for record in reader:
+            yield [value if value != "" else None for value in record]
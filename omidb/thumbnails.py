@@ -0,0 +1,166 @@
+from __future__ import annotations
+import os
+import pathlib
+import tempfile
+from typing import TYPE_CHECKING, Any, List, Optional, Sequence, Union
+import numpy as np
+import numpy.typing as npt
+from . import pixels
+
+if TYPE_CHECKING:
+    from .image import Image
+
+# Length (in pixels) of the longest side of the thumbnail at each level
+LEVELS = (256, 512, 1024)
+
+
+def downsample(arr: npt.NDArray[Any], size: int) -> npt.NDArray[np.float32]:
+    """
+    Downsamples the 2D array ``arr`` by an integer factor, using the mean of
+    each block of pixels, such that its longest side is at most ``size``.
+    Trailing rows and columns that do not fill a whole block are dropped.
+
+    :param arr: The image to downsample
+    :param size: Maximum length of the longest side of the result
+    """
+
+    factor = -(-max(arr.shape[:2]) // size)
+    if factor <= 1:
+        return np.asarray(arr, dtype=np.float32)
+
+    rows, columns = arr.shape[0] // factor, arr.shape[1] // factor
+    blocks = np.asarray(arr[: rows * factor, : columns * factor], dtype=np.float32)
+    result: npt.NDArray[np.float32] = blocks.reshape(
+        rows, factor, columns, factor
+    ).mean(axis=(1, 3))
+    return result
+
+
+def to_uint8(arr: npt.NDArray[Any], low: float, high: float) -> npt.NDArray[np.uint8]:
+    """Linearly rescales ``arr`` from [``low``, ``high``] to 8-bit"""
+
+    scale = 255.0 / (high - low) if high > low else 0.0
+    return np.clip((arr - low) * scale, 0, 255).astype(np.uint8)  # type: ignore
+
+
+def pyramid(
+    arr: npt.NDArray[Any], levels: Sequence[int] = LEVELS
+) -> List[npt.NDArray[np.uint8]]:
+    """
+    Returns 8-bit thumbnails of the 2D image ``arr``, one per size in
+    ``levels``. Each level is downsampled from the next largest, and all
+    levels share the intensity range of the largest thumbnail.
+
+    :param arr: Full resolution image
+    :param levels: Length of the longest side of each thumbnail
+    """
+
+    order = sorted(range(len(levels)), key=lambda i: levels[i], reverse=True)
+    result: List[Optional[npt.NDArray[np.uint8]]] = [None] * len(levels)
+
+    current = arr
+    low = high = 0.0
+    for n, i in enumerate(order):
+        current = downsample(current, levels[i])
+        if n == 0:
+            low, high = float(current.min()), float(current.max())
+        result[i] = to_uint8(current, low, high)
+
+    return result  # type: ignore
+
+
+class ThumbnailCache:
+    """
+    On-disk cache of 8-bit, downsampled images, for fast plotting and quality
+    assurance. Thumbnails are computed for all ``levels`` at once, and stored as
+    ``.npy`` files keyed by SOP Instance UID and the modification time of the
+    dicom, such that modified dicoms are not served stale thumbnails. The
+    thumbnails of earlier modification times are removed when new ones are
+    written.
+
+    :param cache_dir: Directory in which to store thumbnails, defaults to
+        ``thumbnails`` within :func:`omidb.pixels.default_cache_dir`
+    :param levels: Length (in pixels) of the longest side of each thumbnail
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[Union[str, pathlib.Path]] = None,
+        levels: Sequence[int] = LEVELS,
+    ):
+        if cache_dir is None:
+            self.cache_dir = pixels.default_cache_dir() / "thumbnails"
+        else:
+            self.cache_dir = pathlib.Path(cache_dir)
+        self.levels = tuple(levels)
+
+    def path(self, uid: str, dcm_path: pathlib.Path, level: int) -> pathlib.Path:
+        """
+        Path of the cached thumbnail of the dicom at ``dcm_path``.
+
+        :param uid: SOP Instance UID of the dicom
+        :param dcm_path: Path to the dicom
+        :param level: Index into :attr:`levels`
+        """
+
+        mtime = dcm_path.stat().st_mtime_ns
+        size = self.levels[level]
+        return self.cache_dir / str(size) / uid[-2:] / f"{uid}_{mtime}.npy"
+
+    def build(
+        self, uid: str, dcm_path: pathlib.Path, force: bool = False
+    ) -> List[npt.NDArray[np.uint8]]:
+        """
+        Computes (if not cached, or if ``force``) and stores the thumbnails of
+        all levels of the dicom at ``dcm_path``.
+
+        :param uid: SOP Instance UID of the dicom
+        :param dcm_path: Path to the dicom
+        :param force: Recompute the thumbnails even if they are cached
+        """
+
+        paths = [self.path(uid, dcm_path, i) for i in range(len(self.levels))]
+        if not force and all(p.exists() for p in paths):
+            return [np.load(p) for p in paths]
+
+        thumbnails = pyramid(pixels.read_pixels(dcm_path), self.levels)
+        for thumbnail, path in zip(thumbnails, paths):
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write atomically, so concurrent readers never see partial files
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, thumbnail)
+            os.replace(tmp, path)
+            self._remove_stale(uid, path)
+        return thumbnails
+
+    @staticmethod
+    def _remove_stale(uid: str, path: pathlib.Path) -> None:
+        # Thumbnails of the same dicom, keyed by an earlier modification time
+        for stale in path.parent.glob(f"{uid}_*.npy"):
+            if stale != path:
+                try:
+                    stale.unlink()
+                except FileNotFoundError:
+                    pass
+
+    def get(self, image: Image, level: int = 0) -> Optional[npt.NDArray[np.uint8]]:
+        """
+        Returns the thumbnail of ``image`` at ``level``, computing and caching
+        all levels on a cache miss. If the path of the dicom is unknown, the
+        thumbnail is computed from :attr:`omidb.image.Image.dcm` without caching.
+
+        :param image: The image
+        :param level: Index into :attr:`levels`
+        """
+
+        dcm_path = image.dcm_path
+        if dcm_path is None:
+            arr = image.pixels_mmap()
+            return None if arr is None else pyramid(arr, self.levels)[level]
+
+        path = self.path(image.id, dcm_path, level)
+        if path.exists():
+            return np.load(path)  # type: ignore
+
+        return self.build(image.id, dcm_path)[level]
@@ -1,7 +1,21 @@
 import enum
+import contextlib
 import datetime
 import re
-from typing import Optional, Union, Dict, Any, List
+from typing import (
+    Optional,
+    Union,
+    Dict,
+    Any,
+    List,
+    Callable,
+    ContextManager,
+    Generic,
+    Iterable,
+    Iterator,
+    TypeVar,
+    overload,
+)
 from .image import Image
 import json
 from loguru import logger
@@ -60,9 +74,17 @@ def parse_age(image: Image) -> Optional[int]:
         age_s = try_image_attribute(image, "00101010")
     except AttributeError:
         return None
+    return age_to_years(age_s)
+
+
+AGE_REG = re.compile(r"\d+")
+
+
+def age_to_years(age_s: Any) -> Optional[int]:
+    """Converts a DICOM age string (e.g. ``065Y``) to a number of years"""
     if not isinstance(age_s, str):
         return None
-    match = re.match(r"\d+", age_s.lstrip("0"))
+    match = AGE_REG.match(age_s.lstrip("0"))
     if match is None:
         return None
     age = int(match.group())
@@ -150,3 +172,95 @@ def nbss_str_to_enum(
 
     # Single value, so return enum
     return enum_lookup(value, e)
+
+
+R = TypeVar("R")
+
+# Attribute of the instances whose memoised properties are cached, holding the
+# cached values
+_MEMO = "_memoised"
+
+
+class memoised_property(Generic[R]):
+    """
+    A read-only property whose value is computed once per instance and cached
+    while memoisation is enabled for the instance (see :class:`Memoised`), and
+    computed on every access otherwise.
+    """
+
+    def __init__(self, fget: Callable[[Any], R]):
+        self.fget = fget
+        self.name = fget.__name__
+        self.__doc__ = fget.__doc__
+
+    @overload
+    def __get__(self, obj: None, objtype: Any = None) -> "memoised_property[R]": ...
+
+    @overload
+    def __get__(self, obj: Any, objtype: Any = None) -> R: ...
+
+    def __get__(self, obj: Any, objtype: Any = None) -> Any:
+        if obj is None:
+            return self
+        cache = obj.__dict__.get(_MEMO)
+        if cache is None:
+            return self.fget(obj)
+        if self.name not in cache:
+            cache[self.name] = self.fget(obj)
+        return cache[self.name]
+
+
+class Memoised:
+    """
+    Mixin of classes with :class:`memoised_property` attributes, whose values
+    are cached per instance within :meth:`memoised`, and discarded on leaving
+    it or by :meth:`invalidate`. Cached values are never pickled or copied.
+    """
+
+    def _memoised_children(self) -> Iterable["Memoised"]:
+        """The objects whose properties the properties of this one depend on"""
+        return ()
+
+    def _memoised_tree(self) -> Iterator["Memoised"]:
+        yield self
+        for child in self._memoised_children():
+            yield from child._memoised_tree()
+
+    def memoised(self) -> ContextManager[None]:
+        """
+        A context within which the memoised properties of this object and of
+        its children (e.g. the episodes of a client and their lesions) are
+        cached. The objects must not be modified meanwhile, unless
+        :meth:`invalidate` is then called. Within nested contexts, values are
+        cached until the outermost one is left.
+        """
+
+        return _memoising(self._memoised_tree())
+
+    def invalidate(self) -> None:
+        """
+        Discards the cached properties of this object and of its children.
+        Call after modifying any of them within :meth:`memoised`.
+        """
+
+        for obj in self._memoised_tree():
+            if _MEMO in obj.__dict__:
+                obj.__dict__[_MEMO] = {}
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state.pop(_MEMO, None)
+        return state
+
+
+@contextlib.contextmanager
+def _memoising(objects: Iterable[Memoised]) -> Iterator[None]:
+    # Only the objects not memoised by an enclosing context are reset on exit
+    enabled = [obj for obj in objects if _MEMO not in obj.__dict__]
+    for obj in enabled:
+        obj.__dict__[_MEMO] = {}
+    try:
+        yield
+    finally:
+        for obj in enabled:
+            obj.__dict__.pop(_MEMO, None)
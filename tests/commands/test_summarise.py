@@ -1,8 +1,15 @@
+import csv
+import dataclasses
 import datetime
+import io
+import json
 import pathlib
+import shutil
+import tempfile
+import pytest
 import omidb
 from omidb.classificationtools import _earliest_date
-from typing import Any
+from typing import Any, Iterator
 
 
 def get_client() -> omidb.client.Client:
@@ -171,3 +178,465 @@ def test_write_client_data() -> None:
                 raise ValueError(f"{k} unknown")
 
         assert (v == expected) & (v2 == expected)
+
+
+def test_write_client_data_streaming() -> None:
+
+    client = get_client()
+    rows = omidb.commands.summarise.write_client_data([client]).rows
+
+    output = io.StringIO()
+    writer = omidb.commands.summarise.write_client_data(
+        [client], writer=omidb.commands.summarise.DataWriter(output)
+    )
+    assert writer.rows == [writer.header]
+    assert writer.num_rows == len(rows) - 1
+
+    expected = io.StringIO()
+    csv.writer(expected, delimiter=",").writerows(rows)
+    assert output.getvalue() == expected.getvalue()
+
+
+def test_write_client_data_episode_level() -> None:
+
+    client = get_client()
+    rows = omidb.commands.summarise.write_client_data([client]).rows
+    config = omidb.commands.summarise.Config(
+        "", "", False, None, None, None, None, None, None, None, include_images=False
+    )
+    writer = omidb.commands.summarise.write_client_data([client], config)
+
+    # One row per episode, with the episode-level columns of the image rows
+    assert writer.num_rows == 1
+    assert writer.header == omidb.commands.summarise.EPISODE_LEVEL_COLUMNS
+    image_row = dict(zip(rows[0], rows[1]))
+    assert writer.rows[1] == [image_row[name] for name in writer.header]
+
+    # Other columns are empty
+    config.columns = ["ClientID", "StudyInstanceUID", "SOPInstanceUID", "Model"]
+    writer = omidb.commands.summarise.write_client_data([client], config)
+    assert writer.rows[1] == [client.id, None, None, None]
+
+
+def test_write_client_data_longitudinal() -> None:
+
+    client = get_client()
+    rows = omidb.commands.summarise.write_client_data([client]).rows
+    # Not written by default
+    assert "EpisodeNumPriorScreens" not in rows[0]
+
+    later = dataclasses.replace(
+        client.episodes[0],
+        id="2",
+        studies=[],
+        events=omidb.events.Events(
+            screening=[omidb.events.Screening(dates=[datetime.date(2003, 2, 1)])]
+        ),
+    )
+    client.episodes.append(later)
+    config = omidb.commands.summarise.Config(
+        "", "", False, None, None, None, None, None, None, None
+    )
+    config.columns = [
+        "EpisodeID",
+        "EpisodeNumPriorScreens",
+        "EpisodeDaysSincePrevious",
+        "EpisodeAnyPriorMalignancy",
+        "EpisodeAnyPriorSurgery",
+        "EpisodeIsPostOp",
+    ]
+    rows = omidb.commands.summarise.write_client_data([client], config).rows
+    assert rows[1:] == [
+        ["1.2.3.4.5.6", 0, None, False, False, False],
+        ["1.2.3.4.5.6", 0, None, False, False, False],
+        ["2", 1, 1096, False, False, False],
+    ]
+
+
+@pytest.fixture
+def db_dir() -> Iterator[pathlib.Path]:
+    """Three clients, each with one episode and study of one image"""
+
+    with tempfile.TemporaryDirectory() as root_dir:
+        data_dir = pathlib.Path(root_dir)
+        for c in range(3):
+            client_id = f"demd{c}"
+            study_id = f"1.2.{c}"
+            (data_dir / client_id / study_id).mkdir(parents=True)
+            nbss = {
+                "1": {
+                    "EpisodeType": "F",
+                    "SCREENING": {"L": {"DateTaken": f"201{c}-01-01"}},
+                }
+            }
+            study = {
+                "StudyDate": f"201{c}0101",
+                "EpisodeID": "1",
+                f"1.2.{c}.1": {f"1.2.{c}.2": {}},
+            }
+            with open(data_dir / client_id / study_id / f"1.2.{c}.2.json", "w") as f:
+                json.dump({"00185101": {"vr": "CS", "Value": ["CC"]}}, f)
+            with open(data_dir / client_id / f"nbss_{client_id}.json", "w") as f:
+                json.dump(nbss, f)
+            with open(data_dir / client_id / f"imagedb_{client_id}.json", "w") as f:
+                json.dump({"Site": "site", "STUDIES": {study_id: study}}, f)
+        yield data_dir
+
+
+def test_run_jobs(db_dir: pathlib.Path) -> None:
+
+    outputs = []
+    for jobs in (1, 2):
+        output_file = db_dir / f"summary_{jobs}.csv"
+        config = omidb.commands.summarise.Config(
+            str(db_dir),
+            str(output_file),
+            False,
+            None,  # type: ignore
+            None,  # type: ignore
+            None,  # type: ignore
+            None,
+            None,
+            None,
+            None,
+            jobs,
+        )
+        omidb.commands.summarise.run(config)
+        with open(output_file) as f:
+            outputs.append(list(csv.reader(f)))
+
+    serial, parallel = outputs
+    assert len(parallel) == 4
+    assert parallel[0] == serial[0]
+    # Clients are summarised in order of ID by worker processes
+    assert [row[0] for row in parallel[1:]] == ["demd0", "demd1", "demd2"]
+    assert sorted(parallel[1:]) == sorted(serial[1:])
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_run_skips_failed_clients(db_dir: pathlib.Path, jobs: int) -> None:
+
+    # The header of the image of demd1 cannot be read, and demd2 cannot be
+    # parsed
+    (db_dir / "demd1" / "1.2.1" / "1.2.1.2.json").unlink()
+    (db_dir / "demd2" / "nbss_demd2.json").write_text("{")
+    checkpoint_dir = db_dir / "checkpoint"
+    for checkpoint in (None, str(checkpoint_dir)):
+        output_file = db_dir / "summary.csv"
+        config = omidb.commands.summarise.Config(
+            str(db_dir),
+            str(output_file),
+            False,
+            None,  # type: ignore
+            None,  # type: ignore
+            None,  # type: ignore
+            None,
+            None,
+            None,
+            None,
+            jobs,
+            checkpoint_dir=checkpoint,
+        )
+        assert omidb.commands.summarise.run(config) == ["demd2"]
+        with open(output_file) as f:
+            rows = {row["ClientID"]: row for row in csv.DictReader(f)}
+        assert sorted(rows) == ["demd0", "demd1"]
+        # Written with empty DICOM attributes
+        assert rows["demd0"]["ViewPosition"] == "CC"
+        assert rows["demd1"]["ViewPosition"] == ""
+
+    # Not recorded as completed, so summarised again on resuming
+    completed = omidb.checkpoint.Checkpoint(
+        str(checkpoint_dir),
+        omidb.commands.summarise.summary_columns(config),
+        omidb.commands.summarise.checkpoint_params(config),
+        resume=True,
+    ).completed
+    assert set(completed) == {"demd0", "demd1"}
+
+
+def test_write_client_data_skips_failed_clients(mocker) -> None:
+
+    clients = [get_client(), get_client()]
+    clients[1].id = "2"
+    template = omidb.commands.summarise.DataWriter.episode_template
+
+    def fail(self: Any, client: omidb.client.Client, *args: Any) -> Any:
+        if client.id == "2":
+            raise ValueError("Unsummarisable")
+        return template(self, client, *args)
+
+    mocker.patch.object(omidb.commands.summarise.DataWriter, "episode_template", fail)
+    writer = omidb.commands.summarise.write_client_data(clients)
+    assert writer.skipped == ["2"]
+    assert {row[0] for row in writer.rows[1:]} == {clients[0].id}
+
+
+def test_run_format(db_dir: pathlib.Path) -> None:
+
+    output_file = db_dir / "summary.npz"
+    config = omidb.commands.summarise.Config(
+        str(db_dir),
+        str(output_file),
+        False,
+        None,  # type: ignore
+        None,  # type: ignore
+        None,  # type: ignore
+        None,
+        None,
+        None,
+        None,
+    )
+    omidb.commands.summarise.run(config)
+
+    table = omidb.tabular.read_npz(output_file)
+    assert list(table) == [name for name, _ in omidb.commands.summarise.COLUMNS]
+    assert sorted(table["ClientID"].tolist()) == ["demd0", "demd1", "demd2"]
+    assert str(table["StudyDate"].dtype) == "datetime64[D]"
+    assert table["NumberOfMarks"].tolist() == [0, 0, 0]
+    assert table["ViewPosition"].tolist() == ["CC", "CC", "CC"]
+
+
+def test_run_checkpoint(db_dir: pathlib.Path, mocker) -> None:
+
+    def config(output_file: str, **kwargs: Any) -> Any:
+        return omidb.commands.summarise.Config(
+            str(db_dir),
+            str(db_dir / output_file),
+            False,
+            None,  # type: ignore
+            None,  # type: ignore
+            None,  # type: ignore
+            None,
+            None,
+            None,
+            None,
+            **kwargs,
+        )
+
+    omidb.commands.summarise.run(config("expected.csv", jobs=2))
+
+    # An interrupted run, which completed the first two clients
+    checkpoint_dir = str(db_dir / "checkpoint")
+    clients_file = db_dir / "clients.txt"
+    clients_file.write_text("demd0\ndemd1\n")
+    interrupted = config("summary.csv", checkpoint_dir=checkpoint_dir)
+    interrupted.clients_file = str(clients_file)
+    omidb.commands.summarise.run(interrupted)
+
+    spy = mocker.spy(omidb.DB, "_parse_client")
+    resumed = config(
+        "summary.csv", checkpoint_dir=checkpoint_dir, resume=True, checkpoint_size=1
+    )
+    omidb.commands.summarise.run(resumed)
+    assert [call[0][1] for call in spy.call_args_list] == ["demd2"]
+
+    with open(db_dir / "summary.csv") as f, open(db_dir / "expected.csv") as g:
+        assert f.read() == g.read()
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_run_profile(db_dir: pathlib.Path, jobs: int) -> None:
+
+    profile_json = db_dir / "profile.json"
+    config = omidb.commands.summarise.Config(
+        str(db_dir),
+        str(db_dir / "summary.csv"),
+        False,
+        None,  # type: ignore
+        None,  # type: ignore
+        None,  # type: ignore
+        None,
+        None,
+        None,
+        None,
+        jobs,
+        profile_json=str(profile_json),
+    )
+    omidb.commands.summarise.run(config)
+
+    with open(profile_json) as f:
+        report = json.load(f)
+    stages = report["stages"]
+    assert set(stages) == set(omidb.profiling.STAGES)
+    assert stages["link"]["calls"] == 3
+    assert stages["headers"]["calls"] == 3
+    assert stages["json"]["calls"] == 6 and stages["json"]["bytes"] > 0
+    assert report["num_clients"] == 3
+    assert len(report["slowest_clients"]) == 3
+
+
+def test_run_columns(db_dir: pathlib.Path, mocker) -> None:
+
+    def run(**kwargs: Any) -> Any:
+        output_file = db_dir / "summary.csv"
+        config = omidb.commands.summarise.Config(
+            str(db_dir),
+            str(output_file),
+            False,
+            None,  # type: ignore
+            None,  # type: ignore
+            None,  # type: ignore
+            None,
+            None,
+            None,
+            None,
+            **kwargs,
+        )
+        omidb.commands.summarise.run(config)
+        with open(output_file) as f:
+            return list(csv.reader(f))
+
+    # Image headers are not read unless DICOM attributes are selected
+    loader = mocker.spy(omidb.DB, "_json_loader")
+    rows = run(columns=["EpisodeOutcome", "ClientID", "SOPInstanceUID"])
+    assert rows[0] == ["EpisodeOutcome", "ClientID", "SOPInstanceUID"]
+    assert sorted(rows[1:]) == [
+        ["N", "demd0", "1.2.0.2"],
+        ["N", "demd1", "1.2.1.2"],
+        ["N", "demd2", "1.2.2.2"],
+    ]
+    assert loader.call_count == 0
+
+    rows = run(exclude_columns=["Site", "Model"])
+    assert "Site" not in rows[0] and "ViewPosition" in rows[0]
+    assert {row[rows[0].index("ViewPosition")] for row in rows[1:]} == {"CC"}
+    assert loader.call_count == 3
+
+    rows = run(include_images=False)
+    assert rows[0] == omidb.commands.summarise.EPISODE_LEVEL_COLUMNS
+    assert len(rows) == 4
+
+    with pytest.raises(ValueError):
+        run(columns=["ClientID", "Unknown"])
+
+
+def test_run_incremental(db_dir: pathlib.Path, mocker) -> None:
+
+    def config(output_file: str, **kwargs: Any) -> Any:
+        return omidb.commands.summarise.Config(
+            str(db_dir),
+            str(db_dir / output_file),
+            False,
+            None,  # type: ignore
+            None,  # type: ignore
+            None,  # type: ignore
+            None,
+            None,
+            None,
+            None,
+            **kwargs,
+        )
+
+    omidb.commands.summarise.run(config("summary.csv", manifest=True))
+    assert (db_dir / "summary.csv.manifest.json").exists()
+
+    # Changed, touched (unchanged) and removed clients
+    nbss_path = db_dir / "demd1" / "nbss_demd1.json"
+    nbss = json.loads(nbss_path.read_text())
+    nbss["1"]["EpisodeType"] = "R"
+    nbss_path.write_text(json.dumps(nbss))
+    (db_dir / "demd0" / "nbss_demd0.json").touch()
+    shutil.rmtree(db_dir / "demd2")
+
+    spy = mocker.spy(omidb.DB, "_parse_client")
+    omidb.commands.summarise.run(
+        config("summary.csv", incremental=str(db_dir / "summary.csv"))
+    )
+    assert [call[0][1] for call in spy.call_args_list] == ["demd1"]
+
+    omidb.commands.summarise.run(config("expected.csv"))
+    with open(db_dir / "summary.csv") as f, open(db_dir / "expected.csv") as g:
+        rows, expected = list(csv.reader(f)), list(csv.reader(g))
+    assert rows[0] == expected[0]
+    assert sorted(rows[1:]) == sorted(expected[1:])
+    assert {row[0] for row in rows[1:]} == {"demd0", "demd1"}
+
+    different = config("other.csv", incremental=str(db_dir / "summary.csv"))
+    different.num_months_normal_follow_up = 6
+    with pytest.raises(ValueError):
+        omidb.commands.summarise.run(different)
+
+
+def test_run_incremental_failed(db_dir: pathlib.Path, mocker) -> None:
+
+    def config(output_file: str, **kwargs: Any) -> Any:
+        return omidb.commands.summarise.Config(
+            str(db_dir),
+            str(db_dir / output_file),
+            False,
+            None,  # type: ignore
+            None,  # type: ignore
+            None,  # type: ignore
+            None,
+            None,
+            None,
+            None,
+            **kwargs,
+        )
+
+    parse_client = omidb.DB._parse_client
+
+    def fail_demd1(db: omidb.DB, client_id: str, *args: Any) -> Any:
+        if client_id == "demd1":
+            raise ValueError("Unparsable")
+        return parse_client(db, client_id, *args)
+
+    # A client which fails is not recorded in the manifest
+    patch = mocker.patch.object(omidb.DB, "_parse_client", fail_demd1)
+    omidb.commands.summarise.run(config("failed.csv", manifest=True))
+    manifest_file = db_dir / "failed.csv.manifest.json"
+    assert set(json.loads(manifest_file.read_text())["clients"]) == {"demd0", "demd2"}
+    mocker.stop(patch)
+
+    omidb.commands.summarise.run(config("summary.csv", manifest=True))
+    with open(db_dir / "summary.csv") as f:
+        previous = list(csv.reader(f))
+    manifest_file = db_dir / "summary.csv.manifest.json"
+    fingerprints = json.loads(manifest_file.read_text())["clients"]
+
+    # A changed client which fails keeps its previous rows and fingerprint
+    nbss_path = db_dir / "demd1" / "nbss_demd1.json"
+    nbss = json.loads(nbss_path.read_text())
+    nbss["1"]["EpisodeType"] = "R"
+    nbss_path.write_text(json.dumps(nbss))
+    patch = mocker.patch.object(omidb.DB, "_parse_client", fail_demd1)
+    omidb.commands.summarise.run(
+        config("summary.csv", incremental=str(db_dir / "summary.csv"))
+    )
+    mocker.stop(patch)
+    with open(db_dir / "summary.csv") as f:
+        rows = list(csv.reader(f))
+    assert sorted(rows[1:]) == sorted(previous[1:])
+    assert json.loads(manifest_file.read_text())["clients"] == fingerprints
+
+    # So the next run summarises it again
+    spy = mocker.spy(omidb.DB, "_parse_client")
+    omidb.commands.summarise.run(
+        config("summary.csv", incremental=str(db_dir / "summary.csv"))
+    )
+    assert [call[0][1] for call in spy.call_args_list] == ["demd1"]
+    omidb.commands.summarise.run(config("expected.csv"))
+    with open(db_dir / "summary.csv") as f, open(db_dir / "expected.csv") as g:
+        assert sorted(f.readlines()) == sorted(g.readlines())
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_run_progress(db_dir: pathlib.Path, jobs: int, capsys) -> None:
+
+    config = omidb.commands.summarise.Config(
+        str(db_dir),
+        str(db_dir / "summary.csv"),
+        False,
+        None,  # type: ignore
+        None,  # type: ignore
+        None,  # type: ignore
+        None,
+        None,
+        None,
+        None,
+        jobs,
+        progress=True,
+    )
+    omidb.commands.summarise.run(config)
+    assert "3/3 clients (100%), 3 episodes, 3 images" in capsys.readouterr().err
@@ -0,0 +1,119 @@
+import json
+import pathlib
+import tempfile
+from typing import Any, Dict, Iterator
+import pydicom
+import pytest
+import omidb
+from omidb.commands import build_index
+from omidb.image import LoaderParams
+from omidb.index import AttributeIndex
+
+
+def header(laterality: str, view: str, thickness: int) -> Dict[str, Any]:
+    return {
+        "00080070": {"vr": "LO", "Value": ["HOLOGIC, Inc."]},
+        "00200062": {"vr": "CS", "Value": [laterality]},
+        "00185101": {"vr": "CS", "Value": [view]},
+        "001811A0": {"vr": "DS", "Value": [thickness]},
+        "00101010": {"vr": "AS", "Value": ["065Y"]},
+    }
+
+
+@pytest.fixture
+def data_dir() -> Iterator[pathlib.Path]:
+    """Two clients, each with one study of four images (L/R, CC/MLO)"""
+
+    with tempfile.TemporaryDirectory() as root_dir:
+        data_dir = pathlib.Path(root_dir)
+        for c in range(2):
+            client_id = f"demd{c}"
+            study_id = f"1.2.{c}"
+            study_dir = data_dir / client_id / study_id
+            study_dir.mkdir(parents=True)
+
+            nbss = {
+                "1": {
+                    "EpisodeType": "F",
+                    "SCREENING": {"L": {"DateTaken": "2010-01-01"}},
+                }
+            }
+            study: Dict[str, Any] = {"StudyDate": "20100101", "EpisodeID": "1"}
+            for i, (laterality, view) in enumerate(
+                [("L", "CC"), ("L", "MLO"), ("R", "CC"), ("R", "MLO")]
+            ):
+                image_id = f"1.2.{c}.{i}"
+                study[f"1.2.{c}.1{i}"] = {image_id: {}}
+                with open(study_dir / f"{image_id}.json", "w") as f:
+                    json.dump(header(laterality, view, 40 + i), f)
+
+            with open(data_dir / client_id / f"nbss_{client_id}.json", "w") as f:
+                json.dump(nbss, f)
+            with open(data_dir / client_id / f"imagedb_{client_id}.json", "w") as f:
+                json.dump({"Site": "site", "STUDIES": {study_id: study}}, f)
+
+        yield data_dir
+
+
+def test_where() -> None:
+    images = [LoaderParams("demd1", "1", "1", str(i)) for i in range(4)]
+    index = AttributeIndex.build(
+        [
+            (images[0], {"ViewPosition": "CC", "ImageLaterality": "L"}),
+            (images[1], {"ViewPosition": "MLO", "ImageLaterality": "L"}),
+            (images[2], {"ViewPosition": "CC", "ImageLaterality": "R"}),
+            (images[3], {"ViewPosition": None, "BodyPartThicknessMM": 45}),
+        ]
+    )
+
+    def ids(**criteria: Any) -> list:
+        return [p.image_id for _, p in index.where(**criteria)]
+
+    assert ids(ViewPosition="CC") == ["0", "2"]
+    assert ids(ViewPosition="CC", ImageLaterality="L") == ["0"]
+    assert ids(ViewPosition=["MLO", "CC"]) == ["0", "1", "2"]
+    assert ids(ViewPosition="CC", ImageLaterality="X") == []
+    assert ids(BodyPartThicknessMM=45) == ["3"]
+    assert ids(BodyPartThicknessMM=45.0) == ["3"]
+    assert ids(BodyPartThicknessMM=[44.5, pydicom.valuerep.DSfloat("45")]) == ["3"]
+    assert ids() == ["0", "1", "2", "3"]
+    assert index.values("ViewPosition") == ["CC", "MLO"]
+
+    with pytest.raises(ValueError):
+        index.where(SeriesDescription="x")
+
+
+def test_save_load(data_dir: pathlib.Path) -> None:
+    index = build_index.run(omidb.DB(data_dir))
+    assert len(index.images) == 8
+    index.save(data_dir / "index.json")
+
+    loaded = AttributeIndex.load(data_dir / "index.json")
+    assert loaded.images == index.images
+    assert loaded.postings == index.postings
+
+
+def test_images_where(data_dir: pathlib.Path) -> None:
+    db = omidb.DB(data_dir)
+    with pytest.raises(FileNotFoundError):
+        db.images_where(ViewPosition="CC")
+
+    build_index.run(db, jobs=2).save(db.index_path)
+
+    images = db.images_where(ViewPosition="CC", ImageLaterality="L")
+    assert [image.id for image in images] == ["1.2.0.0", "1.2.1.0"]
+    assert images[1].attributes == header("L", "CC", 40)
+    assert images[1].json_loader.args == LoaderParams(
+        "demd1", "1.2.1", "1.2.1.10", "1.2.1.0"
+    )
+    assert images[1].marks == []
+
+    assert len(db.images_where(PatientAgeYears=65)) == 8
+    assert len(db.images_where(BodyPartThicknessMM=[41, 42])) == 4
+
+    # Restricted to the DB's clients
+    db = omidb.DB(data_dir, clients=["demd1"])
+    assert [image.id for image in db.images_where(ViewPosition="MLO")] == [
+        "1.2.1.1",
+        "1.2.1.3",
+    ]
@@ -0,0 +1,51 @@
+import datetime
+import json
+import pathlib
+import tempfile
+from typing import Iterator
+import pytest
+from omidb.checkpoint import Checkpoint, MANIFEST
+
+columns = [("ClientID", str), ("Date", datetime.date), ("Thickness", float)]
+params = {"num_months": 6}
+
+
+@pytest.fixture
+def checkpoint_dir() -> Iterator[pathlib.Path]:
+    with tempfile.TemporaryDirectory() as checkpoint_dir:
+        yield pathlib.Path(checkpoint_dir) / "checkpoint"
+
+
+def test_checkpoint(checkpoint_dir: pathlib.Path) -> None:
+    checkpoint = Checkpoint(checkpoint_dir, columns, params)
+    assert checkpoint.completed == set()
+
+    rows = [["a", datetime.date(2010, 1, 2), 45.5], ["a", None, "50"]]
+    checkpoint.add(["a"], rows)
+    checkpoint.add(["b", "c"], [["b", datetime.date(2011, 1, 1), None]])
+    assert checkpoint.completed == {"a", "b", "c"}
+    assert checkpoint.num_rows == 3
+
+    manifest = json.loads((checkpoint_dir / MANIFEST).read_text())
+    assert [shard["clients"] for shard in manifest["shards"]] == [["a"], ["b", "c"]]
+
+    # A killed process leaves no partial files behind
+    (checkpoint_dir / "partial.tmp").write_text("")
+    resumed = Checkpoint(checkpoint_dir, columns, params, resume=True)
+    assert not (checkpoint_dir / "partial.tmp").exists()
+    assert resumed.completed == {"a", "b", "c"}
+    assert list(resumed.rows()) == rows + [["b", datetime.date(2011, 1, 1), None]]
+
+    resumed.add(["d"], [])
+    assert len(resumed.shards) == 3
+    assert len({shard["file"] for shard in resumed.shards}) == 3
+
+    with pytest.raises(ValueError):
+        Checkpoint(checkpoint_dir, columns, {"num_months": 12}, resume=True)
+    with pytest.raises(ValueError):
+        Checkpoint(checkpoint_dir, columns[:2], params, resume=True)
+
+    # Without resume, the checkpoint is discarded
+    fresh = Checkpoint(checkpoint_dir, columns, params)
+    assert fresh.completed == set()
+    assert not list(checkpoint_dir.glob("shard-*"))
@@ -0,0 +1,134 @@
+import datetime
+import pytest
+import omidb
+from omidb import episode, events
+from omidb.classificationtools import (
+    ClientTimeline,
+    LongitudinalFeatures,
+    classify_client,
+    EpisodeOutcome,
+    UndefinedEpisodeOutcome,
+)
+
+date = datetime.date(2000, 1, 1)
+
+
+def screen(id: str, days: int) -> episode.Episode:
+    return episode.Episode(
+        id=id,
+        events=events.Events(
+            screening=[events.Screening(dates=[date + datetime.timedelta(days=days)])]
+        ),
+    )
+
+
+def test_timeline_order() -> None:
+    episodes = [screen("1", 20), screen("2", 0), screen("3", 10)]
+    timeline = ClientTimeline(episodes)
+
+    assert timeline.date(episodes[0]) == date + datetime.timedelta(days=20)
+    assert timeline.next_episodes(episodes[1]) == [episodes[2], episodes[0]]
+    assert timeline.previous_episodes(episodes[1]) == []
+    assert timeline.next_episodes(episodes[0]) == []
+    assert timeline.within(episodes[1], episodes[0], 1)
+    assert not timeline.within(episodes[1], episodes[0], 0)
+
+
+def test_timeline_equal_episodes() -> None:
+    # As for list.index, equal episodes share the position of the first
+    episodes = [screen("1", 0), screen("1", 0), screen("2", 10)]
+    timeline = ClientTimeline(episodes)
+
+    assert timeline.next_episodes(episodes[1]) == episodes[1:]
+
+
+def test_timeline_without_dates() -> None:
+    episodes = [screen("1", 0), episode.Episode(id="2", events=None)]
+    timeline = ClientTimeline(episodes)
+
+    with pytest.raises(ValueError):
+        timeline.date(episodes[1])
+    with pytest.raises(ValueError):
+        timeline.next_episodes(episodes[0])
+    assert timeline.outcome(episodes[0])[0] == UndefinedEpisodeOutcome.DateError
+
+
+def test_classify_client(mocker) -> None:
+    episodes = [
+        screen("1", 0),
+        screen("2", 365),
+        episode.Episode(
+            id="3",
+            events=events.Events(
+                surgery=events.BaseEvent(
+                    dates=[date + datetime.timedelta(days=400)],
+                    left_opinion=events.SideOpinion.OM,
+                )
+            ),
+        ),
+    ]
+    client = omidb.client.Client("demd1", episodes, "site")
+
+    assert classify_client(client) == [
+        (EpisodeOutcome.N, None),
+        (EpisodeOutcome.MP, "3"),
+        (EpisodeOutcome.M, None),
+    ]
+    assert classify_client(client, num_months_normal_follow_up=6) == [
+        (EpisodeOutcome.N, "2"),
+        (EpisodeOutcome.MP, "3"),
+        (EpisodeOutcome.M, None),
+    ]
+
+    # Failures are isolated to the episode
+    outcome = ClientTimeline.outcome
+
+    def failing_outcome(self, ep, **kwargs):  # type: ignore
+        if ep.id == "2":
+            raise RuntimeError()
+        return outcome(self, ep, **kwargs)
+
+    mocker.patch.object(ClientTimeline, "outcome", failing_outcome)
+    assert classify_client(client) == [
+        (EpisodeOutcome.N, None),
+        None,
+        (EpisodeOutcome.M, None),
+    ]
+
+
+def test_longitudinal_features() -> None:
+    episodes = [
+        screen("2", 365),
+        episode.Episode(
+            id="3",
+            events=events.Events(
+                surgery=events.BaseEvent(
+                    dates=[date + datetime.timedelta(days=400)],
+                    left_opinion=events.SideOpinion.OM,
+                )
+            ),
+        ),
+        screen("1", 0),
+        screen("4", 800),
+    ]
+    timeline = ClientTimeline(episodes)
+    features = timeline.longitudinal_features()
+
+    assert features[2] == LongitudinalFeatures(
+        is_post_op=False,
+        num_prior_screens=0,
+        days_since_previous=None,
+        any_prior_malignancy=False,
+        any_prior_surgery=False,
+    )
+    assert features[0] == LongitudinalFeatures(False, 1, 365, False, False)
+    assert features[1] == LongitudinalFeatures(False, 2, 35, False, False)
+    assert features[3] == LongitudinalFeatures(True, 2, 400, True, True)
+    assert [f.is_post_op for f in features] == [
+        timeline.is_post_op(ep) for ep in episodes
+    ]
+
+    with pytest.raises(ValueError):
+        ClientTimeline(
+            [screen("1", 0), episode.Episode(id="2", events=None)]
+        ).longitudinal_features()
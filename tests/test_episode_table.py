@@ -0,0 +1,228 @@
+import copy
+import datetime
+import random
+from typing import List, Optional
+import pytest
+import omidb
+from omidb import episode, events
+from omidb.classificationtools import (
+    ClientTimeline,
+    LongitudinalFeatures,
+    EpisodeOutcome,
+    UndefinedEpisodeOutcome,
+    episode_outcome,
+)
+from omidb.episode_table import (
+    EpisodeTable,
+    OUTCOMES,
+    FAILED,
+    parameter_grid,
+    sweep_outcomes,
+)
+
+date = datetime.date(2000, 1, 1)
+
+
+def screen(id: str, days: int) -> episode.Episode:
+    return episode.Episode(
+        id=id,
+        events=events.Events(
+            screening=[events.Screening(dates=[date + datetime.timedelta(days=days)])]
+        ),
+    )
+
+
+def surgery(id: str, days: int) -> episode.Episode:
+    return episode.Episode(
+        id=id,
+        events=events.Events(
+            surgery=events.BaseEvent(
+                dates=[date + datetime.timedelta(days=days)],
+                left_opinion=events.SideOpinion.OM,
+            )
+        ),
+    )
+
+
+def test_episode_table() -> None:
+    clients = [
+        omidb.client.Client(
+            "demd1", [surgery("3", 400), screen("1", 0), screen("2", 365)], "site"
+        ),
+        omidb.client.Client("demd2", [screen("1", 0), screen("2", 100)], "site"),
+    ]
+    table = EpisodeTable(clients)
+
+    assert len(table) == 5
+    assert table.client.tolist() == [0, 0, 0, 1, 1]
+    assert table.order.tolist() == [1, 2, 0, 3, 4]
+    assert table.date[1] == date.toordinal()
+
+    assert table.labels() == [
+        (EpisodeOutcome.M, None),
+        (EpisodeOutcome.N, None),
+        (EpisodeOutcome.MP, "3"),
+        (EpisodeOutcome.N, None),
+        (EpisodeOutcome.N, None),
+    ]
+    assert table.labels(num_months_normal_follow_up=6) == [
+        (EpisodeOutcome.M, None),
+        (EpisodeOutcome.N, "2"),
+        (EpisodeOutcome.MP, "3"),
+        (UndefinedEpisodeOutcome.InvalidFollowUp, None),
+        (UndefinedEpisodeOutcome.NoSubsequentEpisode, None),
+    ]
+
+    code, related = table.outcomes(num_months_cancer_prior=1)
+    assert OUTCOMES[code[2]] == UndefinedEpisodeOutcome.InvalidPrior
+    assert related[2] == 0
+
+
+def test_episode_table_empty() -> None:
+    table = EpisodeTable([omidb.client.Client("demd1", [], "site")])
+    assert len(table) == 0
+    assert table.labels() == []
+
+
+def test_episode_table_fallback(mocker) -> None:
+    client = omidb.client.Client("demd1", [screen("1", 0), surgery("2", 365)], "site")
+
+    # Clients which fail to be tabulated are classified episode by episode
+    mocker.patch("omidb.episode_table._tabulate", side_effect=RuntimeError())
+    table = EpisodeTable([client])
+    assert table.labels() == [(EpisodeOutcome.MP, "2"), (EpisodeOutcome.M, None)]
+    code, related = table.outcomes()
+    assert related.tolist() == [1, -1]
+
+    mocker.patch.object(
+        episode.Episode,
+        "has_malignant_opinions",
+        new_callable=mocker.PropertyMock,
+        side_effect=RuntimeError(),
+    )
+    code, related = EpisodeTable([client]).outcomes()
+    assert (code == FAILED).all()
+
+
+ops = [events.SideOpinion.OM, events.SideOpinion.OB, events.SideOpinion.ON, None]
+types = [episode.Type.F, episode.Type.R, episode.Type.CI, episode.Type.S, None]
+
+
+def random_event(rng: random.Random, d: datetime.date) -> events.BaseEvent:
+    return events.BaseEvent(
+        left_opinion=rng.choice(ops),
+        right_opinion=rng.choice(ops),
+        dates=[d + datetime.timedelta(days=rng.randint(0, 30))],
+    )
+
+
+def random_episode(rng: random.Random, idx: int) -> episode.Episode:
+    d = date + datetime.timedelta(days=rng.randint(0, 3000))
+    e: Optional[events.Events] = None
+    if rng.random() < 0.9:
+        e = events.Events(
+            screening=[events.Screening(dates=[d])] if rng.random() < 0.8 else None
+        )
+        for name in ("assessment", "biopsy_wide", "surgery", "clinical"):
+            if rng.random() < 0.3:
+                setattr(e, name, random_event(rng, d))
+    return episode.Episode(
+        id=str(idx),
+        events=e,
+        type=rng.choice(types),
+        opened_date=d if rng.random() < 0.95 else None,
+        diagnosis_date=d if rng.random() < 0.5 else None,
+    )
+
+
+@pytest.mark.parametrize(
+    "months",
+    [(None, None, None, None), (6, 12, 36, 39), (None, None, 12, None), (0, 5, 0, 7)],
+)
+def test_episode_table_matches_episode_outcome(months) -> None:
+    rng = random.Random(0)
+    clients: List[omidb.client.Client] = []
+    for idx in range(300):
+        episodes = [random_episode(rng, i) for i in range(rng.randint(0, 6))]
+        if episodes and rng.random() < 0.1:
+            episodes.append(copy.deepcopy(episodes[0]))
+        clients.append(omidb.client.Client(f"demd{idx}", episodes, "site"))
+
+    labels = iter(EpisodeTable(clients).labels(*months))
+    for client in clients:
+        for ep in client.episodes:
+            label = next(labels)
+            try:
+                expected = episode_outcome(ep, client.episodes, *months)
+            except ValueError:
+                assert label is None
+            else:
+                assert label == expected
+
+
+def test_sweep_outcomes() -> None:
+    clients = [
+        omidb.client.Client(
+            "demd1", [surgery("3", 400), screen("1", 0), screen("2", 365)], "site"
+        ),
+        omidb.client.Client("demd2", [screen("1", 0), screen("2", 100)], "site"),
+    ]
+    grid = {"num_months_normal_follow_up": [None, 6], "num_months_cancer_prior": [1]}
+
+    sweep = sweep_outcomes(clients, grid)
+    assert [months for months, _ in sweep] == parameter_grid(grid)
+    assert sweep[0][0] == {
+        "num_months_ci_prior": None,
+        "num_months_cancer_prior": 1,
+        "num_months_normal_follow_up": None,
+        "num_months_benign_follow_up": None,
+    }
+    counts = sweep[1][1]
+    assert sum(counts.values()) == 5
+    assert counts[EpisodeOutcome.M] == 1
+    assert counts[UndefinedEpisodeOutcome.InvalidPrior] == 1
+    assert counts[UndefinedEpisodeOutcome.NoSubsequentEpisode] == 1
+    assert counts[None] == 0
+
+    table = EpisodeTable(clients)
+    for months, labels in sweep_outcomes(table, grid, labels=True):
+        assert labels == table.labels(**months)
+
+    with pytest.raises(ValueError):
+        parameter_grid([{"num_months": 1}])
+
+
+def test_episode_table_longitudinal_features() -> None:
+    rng = random.Random(1)
+    clients = [
+        omidb.client.Client(
+            f"demd{idx}",
+            [random_episode(rng, i) for i in range(rng.randint(0, 6))],
+            "site",
+        )
+        for idx in range(200)
+    ]
+    columns = EpisodeTable(clients).longitudinal_features()
+
+    row = 0
+    for client in clients:
+        timeline = ClientTimeline(client.episodes)
+        try:
+            features: List[Optional[LongitudinalFeatures]] = list(
+                timeline.longitudinal_features()
+            )
+        except ValueError:
+            features = [None] * len(client.episodes)
+        for f in features:
+            if f is None:
+                assert not columns["is_post_op"][row]
+                assert columns["days_since_previous"][row] == -1
+            else:
+                assert columns["is_post_op"][row] == f.is_post_op
+                assert columns["num_prior_screens"][row] == f.num_prior_screens
+                assert columns["days_since_previous"][row] == (
+                    -1 if f.days_since_previous is None else f.days_since_previous
+                )
+                assert columns["any_prior_malignancy"][row] == f.any_prior_malignancy
+                assert columns["any_prior_surgery"][row] == f.any_prior_surgery
+            row += 1
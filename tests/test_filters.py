@@ -0,0 +1,78 @@
+import random
+import time
+from typing import List
+import pytest
+import omidb
+from omidb.filters import FilterImages
+
+
+def make_series() -> List[omidb.series.Series]:
+    return [
+        omidb.series.Series(
+            f"1.{s}", [omidb.image.Image(f"1.{s}.{i}") for i in range(20)]
+        )
+        for s in range(3)
+    ]
+
+
+def the_filter(image: omidb.image.Image) -> bool:
+    # Simulate I/O of varying latency, such that results complete out of order
+    time.sleep(random.random() / 1000)
+    number = int(image.id.split(".")[-1])
+    if number == 7:
+        raise FileNotFoundError(image.id)
+    return number % 2 == 1
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_filter_in_place(workers: int) -> None:
+    series_list = make_series()
+    study = omidb.study.Study("1", series_list)
+
+    image_filter = FilterImages(the_filter, workers=workers)
+    image_filter(study)
+
+    for series in series_list:
+        assert [image.id.split(".")[-1] for image in series.images] == [
+            "1",
+            "3",
+            "5",
+            "9",
+            "11",
+            "13",
+            "15",
+            "17",
+            "19",
+        ]
+
+    assert sorted(image.id for image, _ in image_filter.errors) == [
+        "1.0.7",
+        "1.1.7",
+        "1.2.7",
+    ]
+    assert all(isinstance(e, FileNotFoundError) for _, e in image_filter.errors)
+
+    # Errors of the latest call only
+    image_filter(series_list[0])
+    assert [image.id for image, _ in image_filter.errors] == []
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_filter_streaming(workers: int) -> None:
+    series_list = make_series()
+    study = omidb.study.Study("1", series_list)
+
+    image_filter = FilterImages(the_filter, workers=workers)
+    expected = [
+        image.id
+        for series in series_list
+        for image in series.images
+        if not image.id.endswith(".7") and int(image.id.split(".")[-1]) % 2
+    ]
+    assert [image.id for image in image_filter.images(study)] == expected
+    assert len(image_filter.errors) == 3
+    assert len(list(image_filter.images(study))) == len(expected)
+    assert len(image_filter.errors) == 3
+
+    # Not modified
+    assert all(len(series.images) == 20 for series in series_list)
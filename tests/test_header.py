@@ -0,0 +1,86 @@
+import json
+import omidb
+from omidb.header import HeaderProjection
+from omidb.utilities import try_image_attribute
+
+attributes = {
+    "00080070": {"vr": "LO", "Value": ["HOLOGIC, Inc."]},
+    "00200062": {"vr": "CS", "Value": ["L"]},
+    "00101010": {"vr": "AS"},
+    "00280030": {"vr": "DS", "Value": []},
+    "00540220": {
+        "vr": "SQ",
+        "Value": [
+            {
+                "00080100": {"vr": "SH", "Value": ["R-10242"]},
+                "00080104": {"vr": "LO", "Value": ["cranio-caudal"]},
+            }
+        ],
+    },
+}
+
+
+def test_projection() -> None:
+    paths = [
+        "00080070",
+        "00540220/00080100",
+        ["00540220", "00080104"],
+        "00540220",
+        "00101010",
+        "00280030",
+        "00181000",
+        "00080070/00080100",
+    ]
+    projection = HeaderProjection(paths)
+
+    assert projection.names[1] == "00540220/00080100"
+    assert projection.names[2] == "00540220/00080104"
+    assert projection(attributes) == [
+        "HOLOGIC, Inc.",
+        "R-10242",
+        "cranio-caudal",
+        attributes["00540220"]["Value"][0],
+        None,
+        None,
+        None,
+        None,
+    ]
+
+    for path in paths[:4]:
+        tags = path.split("/") if isinstance(path, str) else path
+        assert HeaderProjection([path])(attributes) == [
+            try_image_attribute(attributes, tags)
+        ]
+
+
+def test_projection_of_images() -> None:
+    projection = HeaderProjection(
+        {"Manufacturer": "00080070", "Laterality": "00200062"}
+    )
+
+    image = omidb.image.Image("1", _json=attributes)
+    assert projection(image) == ["HOLOGIC, Inc.", "L"]
+    assert projection(omidb.image.Image("2")) == [None, None]
+
+    def raise_decode_error(_: omidb.image.LoaderParams) -> dict:
+        raise json.decoder.JSONDecodeError("", "", 0)
+
+    broken = omidb.image.Image(
+        "3",
+        json_loader=omidb.image.JsonLoader(
+            omidb.image.LoaderParams("a", "b", "c", "3"), raise_decode_error
+        ),
+    )
+
+    columns = projection.batch([image, broken, {"00200062": {"Value": ["R"]}}])
+    assert columns == {
+        "Manufacturer": ["HOLOGIC, Inc.", None, None],
+        "Laterality": ["L", None, "R"],
+    }
+
+
+def test_age_to_years() -> None:
+    assert omidb.utilities.age_to_years("065Y") == 65
+    assert omidb.utilities.age_to_years("024M") == 2
+    assert omidb.utilities.age_to_years("X") is None
+    assert omidb.utilities.age_to_years(None) is None
@@ -0,0 +1,174 @@
+import concurrent.futures
+import json
+import os
+import pathlib
+import pickle
+import shutil
+import tempfile
+from typing import Iterator
+import pytest
+import omidb
+from omidb.header import (
+    HeaderStore,
+    HeaderStores,
+    header_store_path,
+    is_stale,
+    pack_client,
+)
+from omidb.image import LoaderParams
+
+
+@pytest.fixture
+def client_dir() -> Iterator[pathlib.Path]:
+    with tempfile.TemporaryDirectory() as root_dir:
+        client_dir = pathlib.Path(root_dir) / "demd1"
+        (client_dir / "1.2.3").mkdir(parents=True)
+        (client_dir / "1.2.4").mkdir()
+        (client_dir / "nbss_demd1.json").write_text("{}")
+        yield client_dir
+
+
+def write_header(path: pathlib.Path, manufacturer: str) -> None:
+    path.write_text(json.dumps({"00080070": {"vr": "LO", "Value": [manufacturer]}}))
+
+
+def test_round_trip(client_dir: pathlib.Path) -> None:
+    write_header(client_dir / "1.2.3" / "1.2.3.1.json", "GE")
+    write_header(client_dir / "1.2.3" / "1.2.3.2.dcm.json", "HOLOGIC, Inc.")
+    write_header(client_dir / "1.2.4" / "1.2.4.1.json", "SIEMENS")
+
+    assert pack_client(client_dir) == 3
+
+    with HeaderStore(header_store_path(client_dir)) as store:
+        assert len(store) == 3
+        assert "1.2.3/1.2.3.2" in store
+        assert sorted(store.keys()) == [
+            "1.2.3/1.2.3.1",
+            "1.2.3/1.2.3.2",
+            "1.2.4/1.2.4.1",
+        ]
+        assert store.get("1.2.3", "1.2.3.2") == {
+            "00080070": {"vr": "LO", "Value": ["HOLOGIC, Inc."]}
+        }
+        assert store.get("1.2.4", "1.2.4.1")["00080070"]["Value"] == ["SIEMENS"]
+        assert store.get("1.2.4", "1.2.3.1") is None
+
+
+def test_invalid_file(client_dir: pathlib.Path) -> None:
+    path = client_dir / "headers_demd1.pack"
+    path.write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        HeaderStore(path)
+
+
+def test_invalid_header(client_dir: pathlib.Path) -> None:
+    (client_dir / "1.2.3" / "1.2.3.1.json").write_text("{")
+    with pytest.raises(json.decoder.JSONDecodeError):
+        pack_client(client_dir)
+    assert not header_store_path(client_dir).exists()
+    assert not list(client_dir.glob("*.tmp"))
+
+
+def test_db_json_loader(client_dir: pathlib.Path) -> None:
+    write_header(client_dir / "1.2.3" / "1.2.3.1.json", "GE")
+    study_dir = client_dir / "1.2.4"
+    mtime = study_dir.stat().st_mtime_ns
+    pack_client(client_dir)
+    # Served from the store (modified in place, which is not checked by default)
+    (client_dir / "1.2.3" / "1.2.3.1.json").write_text("{")
+    # Not in the store: falls back to the JSON file (with the study directory
+    # unchanged, as the store would be stale otherwise)
+    write_header(study_dir / "1.2.4.1.dcm.json", "HOLOGIC, Inc.")
+    os.utime(study_dir, ns=(0, mtime))
+    os.utime(
+        study_dir / "1.2.4.1.dcm.json",
+        ns=(0, header_store_path(client_dir).stat().st_mtime_ns),
+    )
+
+    db = omidb.DB(client_dir.parent)
+
+    def params(study_id: str, image_id: str) -> LoaderParams:
+        return LoaderParams("demd1", study_id, "1", image_id)
+
+    header = db._json_loader(params("1.2.3", "1.2.3.1"))
+    assert header["00080070"]["Value"] == ["GE"]
+    header = db._json_loader(params("1.2.4", "1.2.4.1"))
+    assert header["00080070"]["Value"] == ["HOLOGIC, Inc."]
+
+    # The open store is not pickled, but reopened on demand
+    db = pickle.loads(pickle.dumps(db))
+    assert len(db._header_stores) == 0
+    header = db._json_loader(params("1.2.3", "1.2.3.1"))
+    assert header["00080070"]["Value"] == ["GE"]
+
+
+def test_db_stale_store(client_dir: pathlib.Path) -> None:
+    write_header(client_dir / "1.2.3" / "1.2.3.1.json", "GE")
+    pack_client(client_dir)
+    assert not is_stale(client_dir)
+    params = LoaderParams("demd1", "1.2.3", "1", "1.2.3.1")
+
+    # Modified in place after packing: only detected by the full check
+    path = header_store_path(client_dir)
+    write_header(client_dir / "1.2.3" / "1.2.3.1.json", "SIEMENS")
+    os.utime(path, ns=(0, path.stat().st_mtime_ns - 10**9))
+    assert is_stale(client_dir)
+    with HeaderStore(path) as store:
+        assert not store.is_stale()
+        assert store.is_stale(full=True)
+
+    db = omidb.DB(client_dir.parent)
+    assert db._json_loader(params)["00080070"]["Value"] == ["GE"]
+    db = omidb.DB(client_dir.parent, check_header_files=True)
+    assert db._json_loader(params)["00080070"]["Value"] == ["SIEMENS"]
+    with db._header_stores.reading("demd1") as store:
+        assert store is None
+
+    # Replaced (e.g. written atomically) after packing: the JSON headers are
+    # read instead
+    pack_client(client_dir)
+    tmp = client_dir / "1.2.3" / "tmp"
+    write_header(tmp, "HOLOGIC, Inc.")
+    os.replace(tmp, client_dir / "1.2.3" / "1.2.3.1.json")
+    os.utime(client_dir / "1.2.3", ns=(0, path.stat().st_mtime_ns + 10**9))
+    db = omidb.DB(client_dir.parent)
+    assert db._json_loader(params)["00080070"]["Value"] == ["HOLOGIC, Inc."]
+
+
+def test_header_stores_eviction(client_dir: pathlib.Path, mocker) -> None:
+    write_header(client_dir / "1.2.3" / "1.2.3.1.json", "GE")
+    pack_client(client_dir)
+    other_dir = client_dir.parent / "demd2"
+    shutil.copytree(client_dir / "1.2.3", other_dir / "1.2.3")
+    pack_client(other_dir)
+
+    stores = HeaderStores(client_dir.parent, max_open=1)
+    with stores.reading("demd1") as store:
+        close = mocker.spy(store, "close")
+        with stores.reading("demd1") as same:
+            assert same is store
+        # Evicted while read: closed once the reader is done
+        with stores.reading("demd2") as other:
+            assert other is not None
+        assert store.get("1.2.3", "1.2.3.1") is not None
+        close.assert_not_called()
+    close.assert_called_once()
+    assert len(stores) == 1
+
+
+def test_header_stores_threads(client_dir: pathlib.Path) -> None:
+    write_header(client_dir / "1.2.3" / "1.2.3.1.json", "GE")
+    pack_client(client_dir)
+    other_dir = client_dir.parent / "demd2"
+    shutil.copytree(client_dir / "1.2.3", other_dir / "1.2.3")
+    pack_client(other_dir)
+
+    # Threads reading the headers of different clients, with one store open
+    db = omidb.DB(client_dir.parent)
+    db._header_stores.max_open = 1
+    params = [
+        LoaderParams(f"demd{i % 2 + 1}", "1.2.3", "1", "1.2.3.1") for i in range(400)
+    ]
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        headers = list(executor.map(db._json_loader, params))
+    assert all(header["00080070"]["Value"] == ["GE"] for header in headers)
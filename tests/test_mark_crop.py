@@ -0,0 +1,55 @@
+import pathlib
+import numpy as np
+import omidb
+from omidb.commands import export_patches
+from .test_pixels import write_dicom, make_image, tmp_dir  # noqa
+
+
+def get_mark(x1: int, y1: int, x2: int, y2: int) -> omidb.mark.Mark:
+    return omidb.mark.Mark(
+        "1",
+        omidb.mark.BoundingBox(x1, y1, x2, y2),
+        omidb.mark.Conspicuity.subtle,
+        lesion_ids={"1"},
+    )
+
+
+def test_bounding_box_slices() -> None:
+    box = omidb.mark.BoundingBox(2, 3, 5, 4)
+    assert box.slices() == (slice(3, 5), slice(2, 6))
+    assert box.slices(2) == (slice(1, 7), slice(0, 8))
+    assert box.slices(2, (6, 7)) == (slice(1, 6), slice(0, 7))
+
+
+def test_crop(tmp_dir: pathlib.Path) -> None:  # noqa
+    arr = np.arange(10 * 12, dtype=np.uint16).reshape(10, 12)
+    image = make_image(write_dicom(tmp_dir / "1.2.3.4.dcm", arr))
+
+    np.testing.assert_array_equal(get_mark(2, 3, 5, 4).crop(image), arr[3:5, 2:6])
+    np.testing.assert_array_equal(
+        get_mark(2, 3, 5, 4).crop(image, margin=1), arr[2:6, 1:7]
+    )
+    np.testing.assert_array_equal(
+        get_mark(8, 7, 11, 9).crop(image, margin=3), arr[4:10, 5:12]
+    )
+
+
+def test_export_patches(tmp_dir: pathlib.Path) -> None:  # noqa
+    arr = np.arange(10 * 12, dtype=np.uint16).reshape(10, 12)
+    path = write_dicom(tmp_dir / "1.2.3.4.dcm", arr)
+
+    params = omidb.image.LoaderParams("demd1", "1.2", "1.2.3", path.stem)
+    task = export_patches.ExportTask("demd1", "1", params, path, [get_mark(2, 3, 5, 4)])
+    output_dir = tmp_dir / "patches"
+
+    rows = export_patches.export_image(task, output_dir, 1)
+    assert len(rows) == 1
+    row = dict(zip(export_patches.INDEX_HEADER, rows[0]))
+    assert row["SOPInstanceUID"] == path.stem
+    assert (row["RowStart"], row["RowStop"]) == (2, 6)
+    assert (row["ColumnStart"], row["ColumnStop"]) == (1, 7)
+    np.testing.assert_array_equal(np.load(output_dir / row["PatchFile"]), arr[2:6, 1:7])
+
+    # Unreadable images are skipped
+    task.dcm_path = tmp_dir / "missing.dcm"
+    assert export_patches.export_image(task, output_dir, 1) == []
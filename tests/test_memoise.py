@@ -0,0 +1,85 @@
+import copy
+import pickle
+
+from omidb import client, episode, events, lesion
+
+
+def _lesion() -> lesion.Lesion:
+    return lesion.Lesion(id="1", surgery=lesion.LesionSurgery())
+
+
+def _make_invasive(les: lesion.Lesion) -> None:
+    assert les.surgery is not None
+    les.surgery.invasive_type = list(lesion.InvasiveCarcinomaType)[0]
+
+
+def _client(les: lesion.Lesion) -> client.Client:
+    return client.Client(
+        id="optm1",
+        episodes=[episode.Episode(id="1", events=events.Events(), lesions={"1": les})],
+        site="adde",
+    )
+
+
+def test_not_memoised_outside_context() -> None:
+    les = _lesion()
+    assert not les.is_invasive
+    _make_invasive(les)
+    assert les.is_invasive
+
+
+def test_memoised_within_context() -> None:
+    les = _lesion()
+    with les.memoised():
+        assert not les.is_invasive
+        _make_invasive(les)
+        assert not les.is_invasive  # cached
+        les.invalidate()
+        assert les.is_invasive
+
+
+def test_not_memoised_after_context() -> None:
+    les = _lesion()
+    with les.memoised():
+        assert not les.is_invasive
+    _make_invasive(les)
+    assert les.is_invasive
+    assert "_memoised" not in les.__dict__
+
+
+def test_nested_contexts() -> None:
+    les = _lesion()
+    c = _client(les)
+    with c.memoised():
+        assert not les.is_invasive
+        with les.memoised():
+            assert not les.is_invasive
+        _make_invasive(les)
+        # Still cached until the outermost context is left
+        assert not les.is_invasive
+    assert les.is_invasive
+
+
+def test_invalidate_cascades() -> None:
+    les = _lesion()
+    c = _client(les)
+    with c.memoised():
+        assert not les.is_invasive
+        _make_invasive(les)
+        c.invalidate()
+        assert les.is_invasive
+
+
+def test_cache_not_copied_or_pickled() -> None:
+    les = _lesion()
+    c = _client(les)
+    with c.memoised():
+        c.status
+        assert not les.is_invasive
+        for other in (copy.deepcopy(c), pickle.loads(pickle.dumps(c))):
+            assert other == c
+            assert "_memoised" not in other.__dict__
+            other_lesion = other.episodes[0].lesions["1"]
+            assert "_memoised" not in other_lesion.__dict__
+            _make_invasive(other_lesion)
+            assert other_lesion.is_invasive
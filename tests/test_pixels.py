@@ -0,0 +1,276 @@
+import os
+import pathlib
+import tempfile
+from typing import Iterator, Optional
+import numpy as np
+import pydicom
+import pytest
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import (
+    ImplicitVRLittleEndian,
+    ExplicitVRLittleEndian,
+    ExplicitVRBigEndian,
+    RLELossless,
+    generate_uid,
+)
+import omidb
+
+
+def write_dicom(
+    path: pathlib.Path,
+    arr: np.ndarray,
+    transfer_syntax_uid: str = ExplicitVRLittleEndian,
+    bits_stored: Optional[int] = None,
+) -> pathlib.Path:
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = "1.2.840.10008.5.1.4.1.1.1.2"
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+    ds = Dataset()
+    ds.file_meta = meta
+    ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    ds.Modality = "MG"
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.Rows, ds.Columns = arr.shape[-2:]
+    if arr.ndim == 3:
+        ds.NumberOfFrames = arr.shape[0]
+    ds.BitsAllocated = arr.dtype.itemsize * 8
+    ds.BitsStored = bits_stored or ds.BitsAllocated
+    ds.HighBit = ds.BitsStored - 1
+    ds.PixelRepresentation = 1 if arr.dtype.kind == "i" else 0
+    ds.PixelData = arr.astype(arr.dtype.newbyteorder("<")).tobytes()
+    # Trailing elements must not affect the located pixel data
+    ds.add_new(0xFFFAFFFA, "OB", b"\x00" * 4)
+
+    if transfer_syntax_uid == RLELossless:
+        ds.compress(RLELossless)
+    elif transfer_syntax_uid != ExplicitVRLittleEndian:
+        if transfer_syntax_uid == ExplicitVRBigEndian:
+            ds.PixelData = arr.astype(arr.dtype.newbyteorder(">")).tobytes()
+        ds.file_meta.TransferSyntaxUID = transfer_syntax_uid
+
+    ds.preamble = b"\x00" * 128
+    try:
+        pydicom.dcmwrite(str(path), ds, enforce_file_format=True)
+    except TypeError:  # pydicom < 3
+        ds.is_little_endian = transfer_syntax_uid != ExplicitVRBigEndian
+        ds.is_implicit_VR = transfer_syntax_uid == ImplicitVRLittleEndian
+        pydicom.dcmwrite(str(path), ds, write_like_original=False)
+    return path
+
+
+def make_image(path: pathlib.Path) -> omidb.image.Image:
+    args = omidb.image.LoaderParams("demd1", "1.2", "1.2.3", path.stem)
+    return omidb.image.Image(
+        path.stem,
+        dcm_loader=omidb.image.DicomLoader(args, lambda p: pydicom.dcmread(path)),
+        dcm_path_loader=omidb.image.PathLoader(args, lambda p: path),
+    )
+
+
+@pytest.fixture
+def tmp_dir() -> Iterator[pathlib.Path]:
+    with tempfile.TemporaryDirectory() as root_dir:
+        yield pathlib.Path(root_dir)
+
+
+@pytest.mark.parametrize(
+    "transfer_syntax_uid",
+    [ImplicitVRLittleEndian, ExplicitVRLittleEndian, ExplicitVRBigEndian],
+)
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16, np.int16])
+def test_memmap_uncompressed(
+    tmp_dir: pathlib.Path, transfer_syntax_uid: str, dtype: type
+) -> None:
+    arr = np.arange(6 * 8, dtype=dtype).reshape(6, 8)
+    path = write_dicom(tmp_dir / "1.2.3.4.dcm", arr, transfer_syntax_uid)
+
+    location = omidb.pixels.locate_pixel_data(path)
+    assert location.is_mappable
+    assert location.shape == (6, 8)
+
+    image = make_image(path)
+    pixels = image.pixels_mmap()
+    assert isinstance(pixels, np.memmap)
+    assert not pixels.flags.writeable
+    np.testing.assert_array_equal(pixels, pydicom.dcmread(path).pixel_array)
+    np.testing.assert_array_equal(pixels[2:4], arr[2:4])
+    # The pydicom dataset is never loaded
+    assert image._dcm is None
+
+
+def test_memmap_multiframe(tmp_dir: pathlib.Path) -> None:
+    arr = np.arange(3 * 4 * 5, dtype=np.uint16).reshape(3, 4, 5)
+    path = write_dicom(tmp_dir / "1.2.3.4.dcm", arr)
+    np.testing.assert_array_equal(make_image(path).pixels_mmap(), arr)
+
+
+@pytest.mark.parametrize(
+    "transfer_syntax_uid", [ExplicitVRLittleEndian, ExplicitVRBigEndian]
+)
+@pytest.mark.parametrize("dtype", [np.uint16, np.int16])
+def test_memmap_bits_stored(
+    tmp_dir: pathlib.Path, transfer_syntax_uid: str, dtype: type
+) -> None:
+    # 12 bits stored of 16, with some of the unused high bits set
+    stored = np.array([[0xFFFB, 100], [0x07FF, 0xF800]], dtype=np.uint16)
+    path = write_dicom(
+        tmp_dir / "1.2.3.4.dcm", stored.view(dtype), transfer_syntax_uid, 12
+    )
+
+    assert omidb.pixels.locate_pixel_data(path).bits_stored == 12
+    pixels = omidb.pixels.read_pixels(path)
+    assert not pixels.flags.writeable
+    assert pixels.dtype == dtype
+    expected = pydicom.dcmread(path).pixel_array
+    np.testing.assert_array_equal(pixels, expected)
+    if dtype == np.int16:
+        np.testing.assert_array_equal(pixels, [[-5, 100], [2047, -2048]])
+    else:
+        np.testing.assert_array_equal(pixels, [[0xFFB, 100], [0x7FF, 0x800]])
+
+
+def test_compressed_falls_back_to_decoding(tmp_dir: pathlib.Path) -> None:
+    arr = np.arange(6 * 8, dtype=np.uint16).reshape(6, 8)
+    path = write_dicom(tmp_dir / "1.2.3.4.dcm", arr, RLELossless)
+
+    assert not omidb.pixels.locate_pixel_data(path).is_mappable
+    with pytest.raises(ValueError):
+        omidb.pixels.memmap_pixel_data(path)
+
+    pixels = make_image(path).pixels_mmap()
+    assert not isinstance(pixels, np.memmap)
+    assert not pixels.flags.writeable
+    np.testing.assert_array_equal(pixels, arr)
+
+
+def test_no_loaders() -> None:
+    assert omidb.image.Image("1.2.3").pixels_mmap() is None
+
+
+def test_batch_loader_order(tmp_dir: pathlib.Path) -> None:
+    paths = [
+        write_dicom(tmp_dir / f"1.2.3.{i}.dcm", np.full((4, 4), i, dtype=np.uint16))
+        for i in range(7)
+    ]
+    images = [make_image(path) for path in paths]
+
+    batches = list(
+        omidb.pixels.BatchLoader(iter(images), batch_size=3, workers=4, prefetch=2)
+    )
+
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+    loaded = [
+        (im, px) for batch in batches for im, px in zip(batch.images, batch.pixels)
+    ]
+    assert [im for im, _ in loaded] == images
+    for i, (_, pixels) in enumerate(loaded):
+        assert not isinstance(pixels, np.memmap)
+        assert (pixels == i).all()
+
+
+def test_batch_loader_raises() -> None:
+    images = [omidb.image.Image(str(i)) for i in range(4)]
+
+    def loader(image: omidb.image.Image) -> np.ndarray:
+        if image.id == "2":
+            raise RuntimeError(image.id)
+        return np.zeros(1)
+
+    it = iter(omidb.pixels.BatchLoader(images, batch_size=2, loader=loader))
+    assert len(next(it)) == 2
+    with pytest.raises(RuntimeError):
+        next(it)
+
+
+def test_pixel_cache(tmp_dir: pathlib.Path) -> None:
+    arr = np.arange(6 * 8, dtype=np.uint16).reshape(6, 8)
+    path = write_dicom(tmp_dir / "1.2.3.4.dcm", arr, RLELossless)
+    cache = omidb.pixels.PixelCache(tmp_dir / "cache")
+    image = make_image(path)
+
+    decoded = []
+
+    def decode(p: pathlib.Path) -> np.ndarray:
+        decoded.append(p)
+        return pydicom.dcmread(p).pixel_array
+
+    pixels = cache.get(path, decode)
+    np.testing.assert_array_equal(pixels, arr)
+    assert not pixels.flags.writeable
+    assert cache.path(cache.digest(path)).exists()
+
+    # Served from the cache
+    pixels = image.pixels(cache)
+    assert isinstance(pixels, np.memmap)
+    np.testing.assert_array_equal(pixels, arr)
+    assert cache.get(path, decode) is not None
+    assert len(decoded) == 1
+
+    # Content addressed: a copy of the file shares the same entry
+    copy = tmp_dir / "1.2.3.5.dcm"
+    copy.write_bytes(path.read_bytes())
+    assert cache.digest(copy) == cache.digest(path)
+
+
+def test_pixel_cache_digests(tmp_dir: pathlib.Path, mocker) -> None:
+    path = write_dicom(tmp_dir / "1.2.3.4.dcm", np.zeros((4, 4), np.uint16))
+    digest = omidb.pixels.PixelCache(tmp_dir / "cache").digest(path)
+
+    # Recorded in the cache directory, so other caches don't hash the file
+    sha256 = mocker.patch("hashlib.sha256", side_effect=AssertionError)
+    assert omidb.pixels.PixelCache(tmp_dir / "cache").digest(path) == digest
+    mocker.stop(sha256)
+
+    # Modifying the file invalidates the recorded digest
+    cache = omidb.pixels.PixelCache(tmp_dir / "cache")
+    path.write_bytes(path.read_bytes() + b"\x00")
+    assert cache.digest(path) != digest
+
+    mocker.patch.object(omidb.pixels, "MAX_MEMOISED_DIGESTS", 1)
+    cache.digest(tmp_dir / "1.2.3.4.dcm")
+    cache.digest(write_dicom(tmp_dir / "1.2.3.5.dcm", np.ones((4, 4), np.uint16)))
+    assert len(cache._digests) == 1
+
+
+def test_pixel_cache_uncompressed_not_cached(tmp_dir: pathlib.Path) -> None:
+    arr = np.arange(6 * 8, dtype=np.uint16).reshape(6, 8)
+    cache = omidb.pixels.PixelCache(tmp_dir / "cache")
+    image = make_image(write_dicom(tmp_dir / "1.2.3.4.dcm", arr))
+
+    np.testing.assert_array_equal(image.pixels(cache), arr)
+    assert cache.size() == 0
+
+
+def test_pixel_cache_eviction(tmp_dir: pathlib.Path) -> None:
+    paths = [
+        write_dicom(
+            tmp_dir / f"1.2.3.{i}.dcm",
+            np.full((16, 16), i, dtype=np.uint16),
+            RLELossless,
+        )
+        for i in range(3)
+    ]
+    cache = omidb.pixels.PixelCache(tmp_dir / "cache")
+    cache.get(paths[0])
+    entry_size = cache.size()
+
+    cache.max_bytes = 2 * entry_size
+    cache.get(paths[1])
+    # Use the first entry, such that the second is least recently used
+    first = cache.path(cache.digest(paths[0]))
+    second = cache.path(cache.digest(paths[1]))
+    stat = second.stat()
+    os.utime(second, ns=(stat.st_atime_ns, stat.st_mtime_ns - 10**9))
+    cache.get(paths[0])
+    cache.get(paths[2])
+
+    assert cache.size() <= 2 * entry_size
+    assert first.exists()
+    assert not second.exists()
+    assert cache.path(cache.digest(paths[2])).exists()
+
+    cache.evict(0)
+    assert cache.size() == 0
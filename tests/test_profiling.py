@@ -0,0 +1,39 @@
+import pickle
+import time
+from omidb import profiling
+
+
+def test_profile() -> None:
+    assert profiling.active() is None
+    assert not profiling.stage("json").enabled
+
+    with profiling.profile() as profiler:
+        assert profiling.active() is profiler
+        with profiling.stage("rows", "demd1"):
+            with profiling.stage("headers", "demd1") as timer:
+                timer.add_bytes(100)
+                time.sleep(0.02)
+        with profiling.stage("headers", "demd2") as timer:
+            timer.add_bytes(50)
+    assert profiling.active() is None
+
+    assert profiler.stages["headers"].calls == 2
+    assert profiler.stages["headers"].bytes == 150
+    # Time spent in nested stages is excluded
+    assert profiler.stages["rows"].seconds < 0.02 <= profiler.stages["headers"].seconds
+    assert profiler.wall_seconds >= 0.02
+
+    slowest = profiler.slowest_clients(1)
+    assert [c["client_id"] for c in slowest] == ["demd1"]
+    assert set(slowest[0]["stages"]) == {"rows", "headers"}
+
+    report = profiler.report()
+    assert report["num_clients"] == 2
+    assert report["stages"]["headers"]["bytes"] == 150
+    assert "headers" in profiler.format()
+
+    # Profiles of worker processes are merged
+    merged = pickle.loads(pickle.dumps(profiler))
+    merged.merge(profiler)
+    assert merged.stages["headers"].calls == 4
+    assert merged.clients["demd2"]["headers"].bytes == 100
@@ -0,0 +1,86 @@
+import pathlib
+import tempfile
+import time
+from typing import Iterator, List
+import pytest
+import omidb
+from omidb.progress import Progress, ProgressInfo
+
+
+@pytest.fixture
+def data_dir() -> Iterator[pathlib.Path]:
+    with tempfile.TemporaryDirectory() as root_dir:
+        data_dir = pathlib.Path(root_dir)
+        for client_id, size in (("demd1", 100), ("demd2", 300)):
+            (data_dir / client_id / "1.2.3").mkdir(parents=True)
+            (data_dir / client_id / f"nbss_{client_id}.json").write_text("x" * size)
+            (data_dir / client_id / "1.2.3" / "1.2.3.4.json").write_text("{}")
+        yield data_dir
+
+
+def test_progress() -> None:
+    infos: List[ProgressInfo] = []
+    progress = Progress(infos.append, {"demd1": 100, "demd2": 300}, interval=0)
+
+    progress.start("demd1")
+    progress.start("demd2")
+    time.sleep(0.01)
+    progress.finish("demd2", num_episodes=2, num_images=8)
+    info = infos[-1]
+    assert (info.clients, info.total_clients) == (1, 2)
+    assert (info.episodes, info.images) == (2, 8)
+    assert (info.bytes, info.total_bytes) == (300, 400)
+    assert info.slowest_client == "demd1" and info.slowest_seconds >= 0.01
+    # The ETA is estimated from the sizes of the remaining clients
+    assert info.eta == pytest.approx(info.elapsed / 3, rel=0.1)
+    assert "1/2 clients" in str(info)
+
+    progress.finish("demd1")
+    progress.close()
+    assert infos[-1].clients == 2
+    assert infos[-1].eta == 0
+    assert infos[-1].slowest_client is None
+
+
+def test_progress_late_start() -> None:
+    # Workers may report the start of a client after its result
+    infos: List[ProgressInfo] = []
+    progress = Progress(infos.append, {"demd1": 1, "demd2": 1}, interval=0)
+    progress.finish("demd1")
+    progress.start("demd1")
+    progress.start("demd2")
+    assert infos[-1].clients == 1
+    assert infos[-1].slowest_client == "demd2"
+    progress.finish("demd2")
+    assert infos[-1].slowest_client is None
+
+
+def test_progress_interval() -> None:
+    infos: List[ProgressInfo] = []
+    progress = Progress(infos.append, {"demd1": 1}, interval=3600)
+    progress.start("demd1")
+    progress.finish("demd1")
+    assert infos == []
+    progress.close()
+    assert len(infos) == 1
+
+
+def test_db_progress(data_dir: pathlib.Path, mocker) -> None:
+    def parse(self, client_id, studies, query=None):
+        episodes = [omidb.episode.Episode(id=str(i)) for i in range(2)]
+        return omidb.client.Client(client_id, episodes, "site")
+
+    mocker.patch("omidb.DB._parse_client", parse)
+    infos: List[ProgressInfo] = []
+    db = omidb.DB(data_dir, progress=infos.append, progress_interval=3600)
+    # The NBSS and IMAGEDB files only
+    assert db.source_size("demd2") == 300
+    assert [p.name for p in db.source_files("demd1")] == [
+        "nbss_demd1.json",
+        "1.2.3.4.json",
+    ]
+
+    assert len(list(db)) == 2
+    assert len(infos) == 1
+    assert (infos[0].clients, infos[0].episodes, infos[0].images) == (2, 4, 0)
+    assert infos[0].bytes == infos[0].total_bytes == 400
@@ -0,0 +1,135 @@
+import copy
+import dataclasses
+import datetime
+from typing import Any, List
+import pytest
+import omidb
+from omidb.client_parser import ClientParser
+from omidb.events import Event
+from omidb.filters import FilterImages, Query
+
+nbss = {
+    "1": {
+        "EpisodeType": "F",
+        "SCREENING": {"L": {"DateTaken": "2010-01-01"}},
+    },
+    "2": {
+        "EpisodeType": "CI",
+        "ASSESSMENT": {"L": {"1": {"DatePerformed": "2012-06-01"}}},
+    },
+}
+
+mark = {"MarkID": 1, "X1": "1", "X2": "5", "Y1": "1", "Y2": "5"}
+
+imagedb = {
+    "Site": "site",
+    "STUDIES": {
+        "1.1": {
+            "StudyDate": "20100101",
+            "EpisodeID": "1",
+            "1.1.1": {"1.1.1.1": {}, "1.1.1.2": {"1": mark}},
+            "1.1.2": {"1.1.2.1": {}},
+        },
+        "1.2": {
+            "StudyDate": "20120601",
+            "EpisodeID": "2",
+            "1.2.1": {"1.2.1.1": {"1": mark}, "1.2.1.2": {}},
+        },
+    },
+}
+
+
+def parse(query: Any = None) -> omidb.client.Client:
+    return ClientParser(
+        "demd1",
+        copy.deepcopy(nbss),
+        copy.deepcopy(imagedb),
+        ["1.1", "1.2"],
+        query=query,
+    )()
+
+
+def image_ids(matches: Any) -> List[str]:
+    return [image.id for _, _, _, _, image in matches]
+
+
+def test_query_does_not_mutate() -> None:
+    client = parse()
+    query = Query().marked()
+
+    assert image_ids(query(client)) == ["1.1.1.2", "1.2.1.1"]
+    assert image_ids(Query()([client])) == [
+        "1.1.1.1",
+        "1.1.1.2",
+        "1.1.2.1",
+        "1.2.1.1",
+        "1.2.1.2",
+    ]
+
+    image_filter = FilterImages(lambda image: image.id.endswith(".1"))
+    assert [i.id for i in image_filter.images(client)] == [
+        "1.1.1.1",
+        "1.1.2.1",
+        "1.2.1.1",
+    ]
+    assert len(client.episodes[0].studies[0].series[0].images) == 2
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        (Query(), ["1.1.1.1", "1.1.1.2", "1.1.2.1", "1.2.1.1", "1.2.1.2"]),
+        (Query().marked(), ["1.1.1.2", "1.2.1.1"]),
+        (Query().marked(False), ["1.1.1.1", "1.1.2.1", "1.2.1.2"]),
+        (Query().episode_type(omidb.episode.Type.CI), ["1.2.1.1", "1.2.1.2"]),
+        (Query().event_type(Event.screening), ["1.1.1.1", "1.1.1.2", "1.1.2.1"]),
+        (Query().study_date(start=datetime.date(2011, 1, 1)), ["1.2.1.1", "1.2.1.2"]),
+        (Query().study_date(end=datetime.date(2010, 1, 1)).marked(), ["1.1.1.2"]),
+        (Query().where(lambda image: image.id.endswith(".2")), ["1.1.1.2", "1.2.1.2"]),
+        (Query().episode_type(omidb.episode.Type.R), []),
+    ],
+)
+def test_pushdown(query: Query, expected: List[str]) -> None:
+    assert image_ids(query(parse())) == expected
+
+    client = parse(query)
+    assert image_ids(query(client)) == expected
+
+    # Episodes are complete, but only studies and images matching the
+    # predicates on NBSS and IMAGEDB data are parsed
+    assert [episode.id for episode in client.episodes] == ["1", "2"]
+    pushed_down = dataclasses.replace(query, image_filters=())
+    assert [
+        image.id
+        for episode in client.episodes
+        for study in episode.studies
+        for series in study.series
+        for image in series.images
+    ] == image_ids(pushed_down(parse()))
+
+
+def test_image_filters_after_pushdown() -> None:
+    seen: List[str] = []
+
+    def image_filter(image: omidb.image.Image) -> bool:
+        seen.append(image.id)
+        return True
+
+    query = Query().marked().where(image_filter)
+    assert image_ids(query(parse(query))) == ["1.1.1.2", "1.2.1.1"]
+    assert seen == ["1.1.1.2", "1.2.1.1"]
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_where_filter_images(workers: int) -> None:
+    def image_filter(image: omidb.image.Image) -> bool:
+        if image.id == "1.2.1.1":
+            raise FileNotFoundError(image.id)
+        return True
+
+    filter_images = FilterImages(image_filter, workers=workers)
+    query = Query().marked().where(filter_images)
+    for _ in range(2):
+        assert image_ids(query([parse(query), parse(query)])) == ["1.1.1.2"] * 2
+        # Errors of each call of the query
+        assert [image.id for image, _ in filter_images.errors] == ["1.2.1.1"] * 2
@@ -0,0 +1,105 @@
+import itertools
+from typing import List
+import numpy as np
+import omidb
+from omidb.mark import BoundingBox, Conspicuity, Mark
+from omidb.spatial import MarkIndex
+
+
+def make_mark(id: str, x1: int, y1: int, x2: int, y2: int) -> Mark:
+    return Mark(id, BoundingBox(x1, y1, x2, y2), Conspicuity.obvious)
+
+
+def make_client(images: List[omidb.image.Image]) -> omidb.client.Client:
+    series = omidb.series.Series("1", images)
+    study = omidb.study.Study("1", [series])
+    episode = omidb.episode.Episode("1", None, [study])
+    return omidb.client.Client("demd1", [episode], "site")
+
+
+def brute_iou(a: BoundingBox, b: BoundingBox) -> float:
+    ax = set(range(min(a.x1, a.x2), max(a.x1, a.x2) + 1))
+    ay = set(range(min(a.y1, a.y2), max(a.y1, a.y2) + 1))
+    bx = set(range(min(b.x1, b.x2), max(b.x1, b.x2) + 1))
+    by = set(range(min(b.y1, b.y2), max(b.y1, b.y2) + 1))
+    intersection = len(ax & bx) * len(ay & by)
+    union = len(ax) * len(ay) + len(bx) * len(by) - intersection
+    return intersection / union
+
+
+def test_queries() -> None:
+    image1 = omidb.image.Image(
+        "1",
+        marks=[
+            make_mark("a", 0, 0, 9, 9),  # area 100
+            make_mark("b", 5, 5, 14, 14),  # overlaps a
+            make_mark("c", 50, 50, 59, 59),
+        ],
+    )
+    # Corners in reverse order
+    image2 = omidb.image.Image("2", marks=[make_mark("d", 29, 29, 0, 0)])
+    index = MarkIndex.from_clients([make_client([image1, image2])])
+
+    assert len(index) == 4
+
+    def ids(refs: list) -> List[str]:
+        return sorted(f"{image.id}{mark.id}" for image, mark in refs)
+
+    assert ids(index.where_area(min_area=101)) == ["2d"]
+    assert ids(index.where_area(max_area=100)) == ["1a", "1b", "1c"]
+
+    region = BoundingBox(0, 0, 9, 9)
+    assert ids(index.overlapping(region)) == ["1a", "1b", "2d"]
+    assert ids(index.overlapping(region, min_iou=0.5)) == ["1a"]
+    assert ids(index.within(BoundingBox(0, 0, 20, 20))) == ["1a", "1b"]
+
+    # Per-image regions
+    def region_of(image: omidb.image.Image) -> BoundingBox:
+        return BoundingBox(40, 40, 100, 100) if image.id == "1" else None
+
+    assert ids(index.overlapping(region_of)) == ["1c"]
+    assert ids(index.within(region_of)) == ["1c"]
+
+    pairs = index.overlapping_pairs()
+    assert [(image.id, a.id, b.id) for image, a, b, _ in pairs] == [("1", "a", "b")]
+    assert np.isclose(pairs[0][3], 25 / 175)
+    assert index.overlapping_pairs(min_iou=0.5) == []
+
+
+def test_against_brute_force() -> None:
+    rng = np.random.default_rng(0)
+    images = []
+    for i in range(20):
+        marks = []
+        for j in range(rng.integers(0, 6)):
+            x, y = rng.integers(0, 100, 2)
+            w, h = rng.integers(0, 40, 2)
+            marks.append(make_mark(str(j), int(x), int(y), int(x + w), int(y + h)))
+        images.append(omidb.image.Image(str(i), marks=marks))
+    index = MarkIndex.from_clients([make_client(images)])
+
+    region = BoundingBox(20, 30, 70, 60)
+    expected = sorted(
+        (image.id, mark.id)
+        for image in images
+        for mark in image.marks
+        if brute_iou(mark.boundingBox, region) > 0.1
+    )
+    assert expected
+    assert (
+        sorted((i.id, m.id) for i, m in index.overlapping(region, min_iou=0.1))
+        == expected
+    )
+
+    expected_pairs = sorted(
+        (image.id, a.id, b.id)
+        for image in images
+        for a, b in itertools.combinations(image.marks, 2)
+        if brute_iou(a.boundingBox, b.boundingBox) > 0
+    )
+    assert expected_pairs
+    found = sorted(
+        (image.id,) + tuple(sorted((a.id, b.id)))
+        for image, a, b, _ in index.overlapping_pairs()
+    )
+    assert found == expected_pairs
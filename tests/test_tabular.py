@@ -0,0 +1,145 @@
+import csv
+import datetime
+import gzip
+import json
+import pathlib
+import tempfile
+from typing import Iterator
+import numpy as np
+import pytest
+from omidb import tabular
+
+columns = [
+    ("ID", str),
+    ("Date", datetime.date),
+    ("Flag", bool),
+    ("Count", int),
+    ("Thickness", float),
+]
+
+rows = [
+    ["a", datetime.date(2010, 1, 2), True, 3, 45.5],
+    ["b", None, False, None, "50"],
+    [None, "2011-02-03", None, "4", None],
+]
+
+
+@pytest.fixture
+def output_dir() -> Iterator[pathlib.Path]:
+    with tempfile.TemporaryDirectory() as output_dir:
+        yield pathlib.Path(output_dir)
+
+
+def test_format_from_path() -> None:
+    assert tabular.format_from_path("summary.csv") == "csv"
+    assert tabular.format_from_path("summary.csv.gz") == "csv.gz"
+    assert tabular.format_from_path("out/summary.ndjson.zst") == "ndjson.zst"
+    assert tabular.format_from_path("summary.npz") == "npz"
+    assert tabular.format_from_path("summary") == "csv"
+
+
+def test_coerce() -> None:
+    assert tabular.coerce("2010-01-02", datetime.date) == datetime.date(2010, 1, 2)
+    assert tabular.coerce("False", bool) is False
+    assert tabular.coerce("065Y", int) is None
+    assert tabular.coerce(None, str) is None
+
+
+@pytest.mark.parametrize("fmt", ["csv", "csv.gz"])
+def test_csv(output_dir: pathlib.Path, fmt: str) -> None:
+    path = output_dir / f"summary.{fmt}"
+    with tabular.open_table(path, columns) as writer:
+        writer.writerows(rows)
+
+    with gzip.open(path, "rt") if fmt == "csv.gz" else open(path) as f:
+        written = list(csv.reader(f))
+    assert written[0] == ["ID", "Date", "Flag", "Count", "Thickness"]
+    assert written[1] == ["a", "2010-01-02", "True", "3", "45.5"]
+    assert written[2] == ["b", "", "False", "", "50"]
+
+
+def test_ndjson(output_dir: pathlib.Path) -> None:
+    path = output_dir / "summary.ndjson.gz"
+    with tabular.open_table(path, columns) as writer:
+        writer.writerows(rows)
+
+    with gzip.open(path, "rt") as f:
+        records = [json.loads(line) for line in f]
+    assert records[1] == {
+        "ID": "b",
+        "Date": None,
+        "Flag": False,
+        "Count": None,
+        "Thickness": 50.0,
+    }
+    assert records[2]["Date"] == "2011-02-03"
+    assert records[2]["Count"] == 4
+
+
+def test_npz(output_dir: pathlib.Path) -> None:
+    path = output_dir / "summary.npz"
+    with tabular.NPZTableWriter(path, columns, row_group_size=2) as writer:
+        writer.writerows(rows)
+
+    table = tabular.read_npz(path)
+    assert list(table) == ["ID", "Date", "Flag", "Count", "Thickness"]
+    assert table["ID"].tolist() == ["a", "b", None]
+    assert table["Date"].dtype == np.dtype("datetime64[D]")
+    assert table["Date"].tolist() == [
+        datetime.date(2010, 1, 2),
+        None,
+        datetime.date(2011, 2, 3),
+    ]
+    assert table["Flag"].tolist() == [True, False, None]
+    assert table["Count"].tolist() == [3, None, 4]
+    assert table["Thickness"].tolist() == [45.5, 50.0, None]
+
+    # Empty tables keep their columns
+    with tabular.open_table(path, columns) as writer:
+        pass
+    assert len(tabular.read_npz(path)["Date"]) == 0
+
+
+def test_parquet(output_dir: pathlib.Path) -> None:
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = output_dir / "summary.parquet"
+    with tabular.open_table(path, columns) as writer:
+        writer.writerows(rows)
+
+    table = pq.read_table(path).to_pydict()
+    assert table["Date"] == [datetime.date(2010, 1, 2), None, datetime.date(2011, 2, 3)]
+    assert table["Count"] == [3, None, 4]
+
+
+def test_unknown_format(output_dir: pathlib.Path) -> None:
+    with pytest.raises(ValueError):
+        tabular.open_table(output_dir / "summary.csv", columns, "xlsx")
+
+
+@pytest.mark.parametrize("fmt", ["csv", "csv.gz", "ndjson", "npz"])
+def test_read_table(output_dir: pathlib.Path, fmt: str) -> None:
+    path = output_dir / f"summary.{fmt}"
+    with tabular.open_table(path, columns) as writer:
+        writer.writerows(rows)
+
+    # Rows read are written as they were
+    copy = output_dir / f"copy.{fmt}"
+    with tabular.open_table(copy, columns) as writer:
+        writer.writerows(tabular.read_table(path, columns))
+    assert list(tabular.read_table(copy, columns)) == list(
+        tabular.read_table(path, columns)
+    )
+    if fmt in ("csv", "ndjson"):
+        assert copy.read_bytes() == path.read_bytes()
+
+    read = list(tabular.read_table(path, columns))
+    assert len(read) == 3
+    assert read[1][0] == "b" and read[1][1] is None
+
+    with pytest.raises(ValueError):
+        list(tabular.read_table(path, columns[:2]))
+
+
+def test_table_writer_abstract() -> None:
+    with pytest.raises(TypeError):
+        tabular.TableWriter([("a", int)])  # type: ignore
@@ -0,0 +1,65 @@
+import os
+import pathlib
+import matplotlib
+import numpy as np
+import omidb
+from omidb.commands import thumbnails as thumbnails_command
+from .test_pixels import write_dicom, make_image, tmp_dir  # noqa
+
+matplotlib.use("Agg")
+
+
+def test_downsample() -> None:
+    arr = np.arange(6 * 9, dtype=np.uint16).reshape(6, 9)
+    result = omidb.thumbnails.downsample(arr, 4)
+    assert result.shape == (2, 3)
+    assert result[0, 0] == arr[:3, :3].mean()
+    assert omidb.thumbnails.downsample(arr, 9).shape == (6, 9)
+
+
+def test_pyramid() -> None:
+    arr = np.arange(64 * 32, dtype=np.uint16).reshape(64, 32)
+    levels = omidb.thumbnails.pyramid(arr, (16, 8, 32))
+    assert [_.shape for _ in levels] == [(16, 8), (8, 4), (32, 16)]
+    for level in levels:
+        assert level.dtype == np.uint8
+    assert levels[2].min() == 0
+    assert levels[2].max() == 255
+
+
+def test_cache(tmp_dir: pathlib.Path) -> None:  # noqa
+    arr = np.arange(64 * 32, dtype=np.uint16).reshape(64, 32)
+    image = make_image(write_dicom(tmp_dir / "1.2.3.4.dcm", arr))
+    cache = omidb.thumbnails.ThumbnailCache(tmp_dir / "cache", (16, 8))
+
+    thumbnail = cache.get(image, 1)
+    assert thumbnail.shape == (8, 4)
+    for level in (0, 1):
+        assert cache.path(image.id, image.dcm_path, level).exists()
+    np.testing.assert_array_equal(cache.get(image, 1), thumbnail)
+
+    # Modifying the dicom invalidates the thumbnails
+    stat = image.dcm_path.stat()
+    os.utime(image.dcm_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert not cache.path(image.id, image.dcm_path, 1).exists()
+
+    assert image.plot(level=0, cache=cache).get_array().shape == (16, 8)
+    assert cache.path(image.id, image.dcm_path, 1).exists()
+    # The stale thumbnails are removed
+    assert len(list((tmp_dir / "cache").glob("*/*/*.npy"))) == 2
+
+
+def test_cache_without_path() -> None:
+    image = omidb.image.Image("1.2.3")
+    assert omidb.thumbnails.ThumbnailCache().get(image) is None
+
+
+def test_build_thumbnails(tmp_dir: pathlib.Path) -> None:  # noqa
+    path = write_dicom(tmp_dir / "1.2.3.4.dcm", np.zeros((8, 8), dtype=np.uint16))
+    cache = omidb.thumbnails.ThumbnailCache(tmp_dir / "cache", (4,))
+
+    assert thumbnails_command.build_thumbnails(path.stem, path, cache)
+    assert cache.path(path.stem, path, 0).exists()
+    assert not thumbnails_command.build_thumbnails(
+        "1.2", tmp_dir / "missing.dcm", cache
+    )